@@ -30,10 +30,18 @@ import os
 # Widgetsの作成
 dbutils.widgets.text("catalog", "workspace", "カタログ名")
 dbutils.widgets.text("schema", "default", "スキーマ名")
+dbutils.widgets.dropdown("ingest_mode", "overwrite", ["overwrite", "incremental"], "取込モード")
+dbutils.widgets.text("max_workers", "4", "並列数")
+dbutils.widgets.dropdown("preview", "false", ["false", "true"], "プレビュー表示")
+dbutils.widgets.dropdown("streaming", "off", ["off", "available_now", "continuous"], "ストリーミング取込")
 
 # Widgetからの値の取得
 catalog = dbutils.widgets.get("catalog")
 schema = dbutils.widgets.get("schema")
+ingest_mode = dbutils.widgets.get("ingest_mode")
+max_workers = int(dbutils.widgets.get("max_workers"))
+preview = dbutils.widgets.get("preview") == "true"
+streaming = dbutils.widgets.get("streaming")
 
 # 設定値取得
 current_user = dbutils.notebook.entry_point.getDbutils().notebook().getContext().userName().get()
@@ -44,7 +52,7 @@ spark.sql(f"USE CATALOG {catalog}")
 # spark.sql(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
 # spark.sql(f"CREATE SCHEMA {schema}")
 spark.sql(f"USE SCHEMA {schema}")
-spark.sql(f"CREATE VOLUME volume")
+spark.sql(f"CREATE VOLUME IF NOT EXISTS volume")
 
 # ストレージパス / テーブル名の設定
 schema_path = f"/Volumes/{catalog}/{schema}/volume/schema"
@@ -80,364 +88,144 @@ CSV_FILES = [
 
 # DBTITLE 1,csvダウンロード・テーブル作成関数を定義
 from pyspark.sql.functions import col, to_date, length
+from pipeline.fetch import CsvFetcher
+from pipeline.ingest import ingest_csv_incremental, ingest_csv_overwrite, read_csv
+from pipeline.schemas import TABLES
+from pipeline.streaming import STREAM_TABLES
 
-def download_csv_file(filename):
-    """Download a CSV file from GitHub"""
-    url = f"{BASE_URL}/{filename}"
-    print(f"Downloading {filename} from {url}")
-    
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        
-        # Save to temporary location
-        temp_path = f"{data_path}"
-        with open(temp_path, 'wb') as f:
-            f.write(response.content)
-        
-        print(f"Successfully downloaded {filename}")
-        return temp_path
-    except Exception as e:
-        print(f"Error downloading {filename}: {str(e)}")
-        return None
-
+# Streamed extracts (SalesOrders*.csv etc.) are read with the fact tables so a rerun keeps their rows
 def create_table_from_csv(csv_path, table_name):
     """Create a Delta table from CSV file"""
     try:
-        # Read CSV with Spark, explicitly set encoding to UTF-8 to avoid mojibake
-        df = spark.read.option("header", "true").option("inferSchema", "true").option("encoding", "UTF-8").csv(csv_path)
-                
-        print(f"\nSample data for {table_name}:")
-        display(df.limit(5))
-        print(f"Schema for {table_name}:")
-        df.printSchema()
-        print(f"Row count: {df.count()}")
+        # Sample rows, schema and row count cost extra Spark jobs, so they are opt-in
+        if preview:
+            df = read_csv(spark, csv_path, TABLES[table_name], extracts=table_name in STREAM_TABLES)
+            print(f"\nSample data for {table_name}:")
+            display(df.limit(5))
+            print(f"Schema for {table_name}:")
+            df.printSchema()
+            print(f"Row count: {df.count()}")
         
-        df.write.mode("overwrite").saveAsTable(f"{table_name}")
+        # Row count, bytes and files come from the write's commit metrics
+        result = ingest_csv_overwrite(spark, csv_path, TABLES[table_name], extracts=table_name in STREAM_TABLES)
         
         print(f"Successfully created table: {table_name}")
-        return True
+        return result
     except Exception as e:
         print(f"Error creating table {table_name}: {str(e)}")
-        return False
+        return None
+
+def merge_table_from_csv(csv_path, table_name):
+    """Incrementally load a CSV file into its Delta table with MERGE"""
+    try:
+        return ingest_csv_incremental(spark, csv_path, TABLES[table_name], extracts=table_name in STREAM_TABLES)
+    except Exception as e:
+        print(f"Error merging table {table_name}: {str(e)}")
+        return None
 
 # COMMAND ----------
 
-# DBTITLE 1,すべてのファイルをダウンロードしてテーブルを作成
-successful_tables = []
-failed_tables = []
-
-for csv_file in CSV_FILES:
-    print(f"\n{'='*50}")
-    print(f"Processing {csv_file}")
-    print(f"{'='*50}")
-    
-    # Download CSV
-    temp_path = download_csv_file(csv_file)
-    
-    if temp_path:
-        # Create table name (remove .csv extension and add prefix)
-        table_name = csv_file.replace('.csv', '').lower()
-        table_name = 'bronze_' + table_name
-        
-        # Create table
-        if create_table_from_csv(temp_path, table_name):
-            successful_tables.append(table_name)
-        else:
-            failed_tables.append(table_name)
-        
-        # # Clean up temp file
-        # try:
-        #     os.remove(temp_path)
-        # except:
-        #     pass
-    else:
-        failed_tables.append(csv_file.replace('.csv', ''))
+# DBTITLE 1,すべてのファイルをダウンロードしてテーブル・制約を作成
+from pipeline.scheduler import run_dag
+from pipeline.setup import build_setup_tasks, loaded_tables
+from pipeline.trace import Tracer, traced_tasks
+
+# Every task is recorded as a stage (time, rows, bytes, Spark jobs, errors) of this run
+tracer = Tracer(spark, run_name="setup")
+
+# Each table runs download -> load -> date fix -> column drop -> primary key in parallel;
+# foreign keys start once both of their tables are ready
+load_table = merge_table_from_csv if ingest_mode == "incremental" else create_table_from_csv
+with CsvFetcher(BASE_URL, data_path, max_workers=max_workers) as fetcher:
+    tasks = traced_tasks(tracer, build_setup_tasks(spark, catalog, schema, CSV_FILES, fetcher, load_table))
+    task_results = run_dag(tasks, max_workers=max_workers)
+
+successful_tables, failed_tables = loaded_tables(task_results)
+failed_tasks = [r for r in task_results.values() if r.status != "succeeded"]
 
 # COMMAND ----------
 
 # DBTITLE 1,取得結果を要約
-print("\n" + "="*60)
-print("PROCESSING SUMMARY")
-print("="*60)
+from pipeline.setup import print_ingest_summary
 
-print(f"\nSuccessfully created {len(successful_tables)} tables:")
-for table in successful_tables:
-    print(f"  ✓ {table}")
+print_ingest_summary(task_results)
 
-if failed_tables:
-    print(f"\nFailed to create {len(failed_tables)} tables:")
-    for table in failed_tables:
-        print(f"  ✗ {table}")
+if failed_tasks:
+    print(f"\nFailed or skipped {len(failed_tasks)} tasks:")
+    for r in failed_tasks:
+        print(f"  ✗ {r.name} ({r.status}): {r.error}")
+
+# COMMAND ----------
 
-print(f"\nTotal tables in database:")
-tables_df = spark.sql(f"SHOW TABLES IN {schema}")
-tables_df.show(truncate=False)
+# DBTITLE 1,主キー・外部キーの整合性を確認
+from pipeline.integrity import check_integrity, print_integrity_report
+
+# RELY constraints are trusted by the optimizer but never enforced, so verify them against the data
+with tracer.stage("integrity") as stage:
+    violations = check_integrity(spark, f"{catalog}.{schema}", tables=successful_tables)
+    stage.rows = sum(v.count for v in violations)
+broken_constraints = print_integrity_report(violations)
 
 # COMMAND ----------
 
 # MAGIC %md
-# MAGIC ## 型変更、コメント、リレーション情報の付与
+# MAGIC ## コメントの付与
+# MAGIC
+# MAGIC テーブル・カラムの説明は `pipeline/comments.json` で管理します。現在のコメントを `information_schema` から1回のクエリで取得し、差分のあるテーブルだけにまとめて反映します。
 
 # COMMAND ----------
 
-# DBTITLE 1,yyyyMMddで格納された文字列を日付型に変更
-date_column_list = spark.sql(f"""
-SELECT
-  table_schema
-  , table_name
-  , column_name
-FROM
-  workspace.information_schema.columns
-WHERE
-  table_schema = '{schema}'
-  AND (column_name LIKE '%DAT' OR column_name LIKE '%DATE')
-""")
-
-for row in date_column_list.collect():
-    table = f"{row['table_name']}"
-    column = row['column_name']
-    df = spark.read.table(table)
-    if column in df.columns:
-        # df = df.withColumn(column, F.to_date(F.col(column).cast("string"), "yyyyMMdd"))
-        df.write.mode("overwrite").option("overwriteSchema", "true").saveAsTable(table)
+# DBTITLE 1,テーブル説明・カラム説明を追記
+from pipeline.comments import apply_comments
+
+# Descriptions live in pipeline/comments.json; only comments that differ from the catalog are sent
+with tracer.stage("comments") as stage:
+    stage.extra["tables"] = len(apply_comments(spark, catalog, schema, tables=successful_tables))
 
 # COMMAND ----------
 
-# DBTITLE 1,余分なカラムを除外
-# MAGIC %sql
-# MAGIC ALTER TABLE bronze_employees SET TBLPROPERTIES ('delta.columnMapping.mode' = 'name'); 
-# MAGIC ALTER TABLE bronze_employees DROP COLUMNS (Unnamed13, Unnamed14, Unnamed15, Unnamed16, Unnamed17, Unnamed18);
+# DBTITLE 1,取引先・製品・従業員の変更履歴を記録
+from pipeline.history import DIMENSIONS, capture_history
+
+# Bronze tables only hold the latest values; each load's versions are kept as SCD2 history for as-of joins
+for table, dimension in DIMENSIONS.items():
+    if table in successful_tables:
+        with tracer.stage("history", table=f"{catalog}.{schema}.{dimension.history_table}"):
+            capture_history(spark, f"{catalog}.{schema}", dimension)
 
 # COMMAND ----------
 
-# DBTITLE 1,テーブル説明・カラム説明を追記
-# MAGIC %sql
-# MAGIC -- salesorders テーブル
-# MAGIC COMMENT ON TABLE bronze_salesorders IS "売上注文に関連するデータが含まれるテーブルで、注文管理の包括的なビューを提供します。売上パフォーマンスの追跡、顧客関係の管理、財務報告のコンプライアンスを確保するために使用できます。";
-# MAGIC
-# MAGIC -- addresses テーブル
-# MAGIC COMMENT ON TABLE bronze_addresses IS "このテーブルは、住所の地理的および管理的属性を含む詳細な情報を提供します。テーブルは、位置のマッピングや住所の有効性の分析、住所の種別（住宅または商業など）による分類など、さまざまな目的に活用できます。都市、郵便番号、通り名、および地理座標などの主要データポイントが含まれており、ロジスティクス、配送計画、位置情報サービスの支援に役立ちます。";
-# MAGIC
-# MAGIC -- productcategories テーブル
-# MAGIC COMMENT ON TABLE bronze_productcategories IS "システム内の製品カテゴリに関する情報が含まれるテーブルです。各製品カテゴリの識別子、レコード作成者、作成日時が記録されており、製品の分類追跡や変更の監査、エントリーの履歴理解に活用されます。";
-# MAGIC
-# MAGIC -- products テーブル
-# MAGIC COMMENT ON TABLE bronze_products IS "在庫製品に関する詳細データを含むテーブル。製品の識別、カテゴリ、価格、寸法、サプライヤー情報を提供。在庫管理、販売分析、サプライヤー管理など多岐に渡る用途。データは製品変更の追跡や税制規則の遵守を支援。";
-# MAGIC
-# MAGIC -- businesspartners テーブル
-# MAGIC COMMENT ON TABLE bronze_businesspartners IS "このテーブルには、組織に関連するパートナー情報が含まれており、パートナー関係の管理や貢献の分析、およびコミュニケーション支援に利用できます。さらに、パートナーレコードの作成と変更履歴を追跡し、データ管理と監査を支援します。";
-# MAGIC
-# MAGIC -- employees テーブル
-# MAGIC COMMENT ON TABLE bronze_employees IS "社員情報を含むテーブルであり、従業員のデータを管理し、組織内でのコミュニケーションを促進するために使用されます。従業員の個人情報や雇用状況が含まれており、雇用履歴の追跡や正確な報告を支援します。";
-# MAGIC
-# MAGIC -- salesorderitems テーブル
-# MAGIC COMMENT ON TABLE bronze_salesorderitems IS "販売注文とそれに関連するアイテムに関する詳細な情報が含まれています。注文とアイテムの一意の識別子、製品の詳細、金額（控除前後）、税情報、アイテムの状態などが記録されており、売上パフォーマンスの追跡や在庫管理、収益分析、財務規制への適合、物流および顧客コミュニケーションに役立ちます。";
-# MAGIC
-# MAGIC -- producttexts テーブル
-# MAGIC COMMENT ON TABLE bronze_producttexts IS "製品に関する詳細情報を含む表で、製品のカタログ作成、マーケティング資料、顧客サポートに利用できます。";
-# MAGIC
-# MAGIC -- productcategorytext テーブル
-# MAGIC COMMENT ON TABLE bronze_productcategorytext IS "このテーブルは、製品カテゴリに関する情報を含んでおり、製品を効果的にカテゴリ分けし、各カテゴリに関する素早く詳細な情報をユーザーに提供するために使用されます。製品検索機能の強化、ユーザーエクスペリエンスの向上、製品カテゴリの理解を深めたマーケティング活動のサポートなど、さまざまな用途が考えられます。";
-# MAGIC
-# MAGIC -- addresses カラム
-# MAGIC COMMENT ON COLUMN default.bronze_addresses.ADDRESSID IS '各アドレスエントリの固有の識別子で、アドレスレコードの簡単な参照と管理を可能にします。';
-# MAGIC COMMENT ON COLUMN default.bronze_addresses.CITY IS '住所に関連付けられた都市の名前で、地理的なコンテキストを提供する。';
-# MAGIC COMMENT ON COLUMN default.bronze_addresses.POSTALCODE IS '郵便物の配達や場所の特定に不可欠な住所の郵便番号。';
-# MAGIC COMMENT ON COLUMN default.bronze_addresses.STREET IS '住所が存在する通りの名前で、正確な場所を特定するのに役立ちます。';
-# MAGIC COMMENT ON COLUMN default.bronze_addresses.BUILDING IS '住所に存在する特定の建物を識別するための識別子で、同じ通り上にある複数の建物を区別するのに役立ちます。';
-# MAGIC COMMENT ON COLUMN default.bronze_addresses.COUNTRY IS '住所が存在する国の名前、国際的な文脈では重要です。';
-# MAGIC COMMENT ON COLUMN default.bronze_addresses.REGION IS '住所に関連付けられた地域または州、追加の地理的詳細を提供する。';
-# MAGIC COMMENT ON COLUMN default.bronze_addresses.ADDRESSTYPE IS '住所の種類を表すコードで、住宅、商業などであるかどうかを示すことができる。';
-# MAGIC COMMENT ON COLUMN default.bronze_addresses.VALIDITY_STARTDATE IS 'アドレスが有効とみなされる日付。時間の経過に伴う変更を追跡するのに役立ちます。';
-# MAGIC COMMENT ON COLUMN default.bronze_addresses.VALIDITY_ENDDATE IS '有効なアドレスを管理するために、アドレスが有効な期間を示す日付。';
-# MAGIC COMMENT ON COLUMN default.bronze_addresses.LATITUDE IS '住所の緯度座標で、正確な地理的マッピングを可能にします。';
-# MAGIC COMMENT ON COLUMN default.bronze_addresses.LONGITUDE IS '住所の緯度座標で、緯度と組み合わせて正確な位置を特定する。';
-# MAGIC
-# MAGIC -- businesspartners カラム
-# MAGIC COMMENT ON COLUMN default.bronze_businesspartners.PARTNERID IS 'システム内の各パートナーに一意の識別子を表し、パートナー関連データの簡単な参照と管理を可能にします。';
-# MAGIC COMMENT ON COLUMN default.bronze_businesspartners.PARTNERROLE IS 'パートナーが組織内で果たす特定の役割または機能を示し、それにより彼らの責任や貢献を理解するのに役立ちます。';
-# MAGIC COMMENT ON COLUMN default.bronze_businesspartners.EMAILADDRESS IS 'パートナーに関連付けられた電子メールアドレスを含み、通信や連絡の目的で役立ちます。';
-# MAGIC COMMENT ON COLUMN default.bronze_businesspartners.PHONENUMBER IS 'パートナーの主な電話番号を保持し、必要に応じて直接連絡できるようにします。';
-# MAGIC COMMENT ON COLUMN default.bronze_businesspartners.FAXNUMBER IS 'パートナーのファックス番号を格納します。これは、特定の種類の文書化や通信に役立つ場合があります。';
-# MAGIC COMMENT ON COLUMN default.bronze_businesspartners.WEBADDRESS IS 'パートナーのウェブサイトのURLを提供し、追加情報とオンラインプレゼンスのためのリソースを提供します。';
-# MAGIC COMMENT ON COLUMN default.bronze_businesspartners.ADDRESSID IS 'パートナーに関連付けられたアドレスを一意に識別するために使用され、他のアドレス関連データにリンクできます。';
-# MAGIC COMMENT ON COLUMN default.bronze_businesspartners.COMPANYNAME IS 'パートナーの会社の公式名称を表し、識別およびブランド化の目的で不可欠です。';
-# MAGIC COMMENT ON COLUMN default.bronze_businesspartners.LEGALFORM IS 'パートナーの組織の法的構造を記述し、契約および規制上の考慮事項に影響を及ぼす可能性があります。';
-# MAGIC COMMENT ON COLUMN default.bronze_businesspartners.CREATEDBY IS 'パートナーレコードを作成したユーザーの識別子を示します。責任の追跡とデータ管理に役立ちます。';
-# MAGIC COMMENT ON COLUMN default.bronze_businesspartners.CREATEDAT IS 'パートナーレコードが作成されたときのタイムスタンプを記録し、データの履歴のコンテキストを提供します。';
-# MAGIC COMMENT ON COLUMN default.bronze_businesspartners.CHANGEDBY IS 'パートナーレコードを最後に変更したユーザーの識別子を表示し、明確な監査証跡を保持するのに役立ちます。';
-# MAGIC COMMENT ON COLUMN default.bronze_businesspartners.CHANGEDAT IS 'パートナーレコードに最後に加えられた変更のタイムスタンプを取得します。これは、データの更新を理解する上で重要です。';
-# MAGIC COMMENT ON COLUMN default.bronze_businesspartners.CURRENCY IS 'パートナーとの取引または取引で使用される通貨を指定します。これは、財務操作に不可欠です。';
-# MAGIC
-# MAGIC -- employees カラム
-# MAGIC COMMENT ON COLUMN default.bronze_employees.EMPLOYEEID IS '各従業員に割り当てられた一意の識別子で、システム内での記録を追跡するために使用できます。';
-# MAGIC COMMENT ON COLUMN default.bronze_employees.NAME_FIRST IS '従業員の名前、識別に個人的な感覚を提供する。';
-# MAGIC COMMENT ON COLUMN default.bronze_employees.NAME_MIDDLE IS '従業員の中間名で、正式な身分証明または文書化に使用される場合があります。';
-# MAGIC COMMENT ON COLUMN default.bronze_employees.NAME_LAST IS '従業員の姓は、同様の名前を持つ個人の区別に不可欠です。';
-# MAGIC COMMENT ON COLUMN default.bronze_employees.NAME_INITIALS IS '従業員の名前の頭文字で、簡単な参照やスペースが限られている状況で使用できます。';
-# MAGIC COMMENT ON COLUMN default.bronze_employees.SEX IS '従業員の性別で、人口統計学的分析や報告書の目的で関連する場合があります。';
-# MAGIC COMMENT ON COLUMN default.bronze_employees.LANGUAGE IS '従業員が主に使用する言語で、多様な労働力の中でのコミュニケーションとサポートに役立ちます。';
-# MAGIC COMMENT ON COLUMN default.bronze_employees.PHONENUMBER IS '必要に応じて直接通信できるようにするための従業員の連絡先番号。';
-# MAGIC COMMENT ON COLUMN default.bronze_employees.EMAILADDRESS IS '従業員の公式の電子メールアドレスであり、電子通信および文書交換に不可欠です。';
-# MAGIC COMMENT ON COLUMN default.bronze_employees.LOGINNAME IS '社員が会社のシステムにアクセスするために使用するユーザー名で、セキュアでパーソナライズされたアクセスを保証する。';
-# MAGIC COMMENT ON COLUMN default.bronze_employees.ADDRESSID IS '従業員の住所を識別するための識別子で、別の場所に保存されたより詳細な住所情報にリンクしています。';
-# MAGIC COMMENT ON COLUMN default.bronze_employees.VALIDITY_STARTDATE IS '従業員の記録が有効になる日付であり、雇用または状態の開始を示します。';
-# MAGIC COMMENT ON COLUMN default.bronze_employees.VALIDITY_ENDDATE IS '従業員の記録が有効でなくなった日付で、従業員の雇用またはステータスの終了を示します。';
-# MAGIC
-# MAGIC -- productcategories カラム
-# MAGIC COMMENT ON COLUMN default.bronze_productcategories.PRODCATEGORYID IS '各製品カテゴリの固有の識別子を表し、システム内での製品の簡単なカテゴリ化と取得を可能にします。';
-# MAGIC COMMENT ON COLUMN default.bronze_productcategories.CREATEDBY IS 'レコードを作成したユーザーまたはシステムの識別子を示し、変更の追跡や責任の追及に役立ちます。';
-# MAGIC COMMENT ON COLUMN default.bronze_productcategories.CREATEDAT IS 'レコードが作成されたときのタイムスタンプを保存し、データの年齢と関連性のコンテキストを提供する。';
-# MAGIC
-# MAGIC -- productcategorytext カラム
-# MAGIC COMMENT ON COLUMN default.bronze_productcategorytext.PRODCATEGORYID IS '各製品カテゴリの固有の識別子を表し、関連製品の簡単なカテゴリ化と取得を可能にします。';
-# MAGIC COMMENT ON COLUMN default.bronze_productcategorytext.LANGUAGE IS '製品の説明が提供される言語を示し、ユーザーが優先する言語で情報にアクセスできるようにします。';
-# MAGIC COMMENT ON COLUMN default.bronze_productcategorytext.SHORT_DESCR IS '製品カテゴリの簡単な説明を含み、ユーザーがカテゴリを一目で理解できるようにクイックオーバービューを提供します。';
-# MAGIC COMMENT ON COLUMN default.bronze_productcategorytext.MEDIUM_DESCR IS '製品カテゴリのより詳細な説明を提供し、ユーザーに短い説明を超えた追加のコンテキストと情報を提供します。';
-# MAGIC COMMENT ON COLUMN default.bronze_productcategorytext.LONG_DESCR IS '製品カテゴリの詳細な説明を提供し、機能、利点、その他の関連情報を含めて、ユーザーが情報に基づいた決定を下すのを支援します。';
-# MAGIC
-# MAGIC -- products カラム
-# MAGIC COMMENT ON COLUMN default.bronze_products.PRODUCTID IS '在庫にあるユニークな製品を識別し、製品の詳細を追跡および管理できるようにします。';
-# MAGIC COMMENT ON COLUMN default.bronze_products.TYPECODE IS '製品の分類を表し、レポートや分析のために製品をカテゴリ化するために使用できます。';
-# MAGIC COMMENT ON COLUMN default.bronze_products.PRODCATEGORYID IS '製品をその特定のカテゴリにリンクし、同様の製品の組織化と取得を容易にします。';
-# MAGIC COMMENT ON COLUMN default.bronze_products.CREATEDBY IS '製品エントリを作成したユーザーの識別子を示します。監査と責任追跡に役立ちます。';
-# MAGIC COMMENT ON COLUMN default.bronze_products.CREATEDAT IS '製品が作成されたときのタイムスタンプを記録し、製品ライフサイクル管理のコンテキストを提供する。';
-# MAGIC COMMENT ON COLUMN default.bronze_products.CHANGEDBY IS '製品エントリを最後に変更したユーザーの識別子を表示します。変更や更新を追跡するために重要です。';
-# MAGIC COMMENT ON COLUMN default.bronze_products.CHANGEDAT IS '製品への最後の変更のタイムスタンプを取得し、バージョン管理と履歴追跡を支援します。';
-# MAGIC COMMENT ON COLUMN default.bronze_products.SUPPLIER_PARTNERID IS '製品に関連するサプライヤーを特定し、調達およびサプライヤー管理に不可欠です。';
-# MAGIC COMMENT ON COLUMN default.bronze_products.TAXTARIFFCODE IS '製品の税分類を表し、税制上の規制に従うために必要です。';
-# MAGIC COMMENT ON COLUMN default.bronze_products.QUANTITYUNIT IS '製品の数量の測定単位を指定し、在庫および販売取引の明確性を確保します。';
-# MAGIC COMMENT ON COLUMN default.bronze_products.WEIGHTMEASURE IS '出荷、取り扱い、在庫管理において重要となる製品の重量を示します。';
-# MAGIC COMMENT ON COLUMN default.bronze_products.WEIGHTUNIT IS '製品の重量の測定単位を定義し、重量報告の的一貫性を提供する。';
-# MAGIC COMMENT ON COLUMN default.bronze_products.CURRENCY IS '製品価格が記載されている通貨を指定し、財務取引や報告書の作成に不可欠です。';
-# MAGIC COMMENT ON COLUMN default.bronze_products.PRICE IS '製品の販売価格を表し、販売分析および収益追跡に重要です。';
-# MAGIC COMMENT ON COLUMN default.bronze_products.WIDTH IS '製品の幅の寸法を示します。保管、出荷、展示の考慮に重要です。';
-# MAGIC COMMENT ON COLUMN default.bronze_products.DEPTH IS '製品のサイズやフィットを理解するために必要な製品の深さの次元を表します。';
-# MAGIC COMMENT ON COLUMN default.bronze_products.HEIGHT IS '製品の高さの寸法を把握し、空間計画および在庫管理を支援する。';
-# MAGIC COMMENT ON COLUMN default.bronze_products.DIMENSIONUNIT IS '製品の寸法の測定単位を指定し、サイズの報告における一貫性を確保します。';
-# MAGIC COMMENT ON COLUMN default.bronze_products.PRODUCTPICURL IS '製品画像へのURLリンクを含み、オンラインリストやマーケティング資料に不可欠です。';
-# MAGIC
-# MAGIC -- producttexts カラム
-# MAGIC COMMENT ON COLUMN default.bronze_producttexts.PRODUCTID IS 'データベース内のユニークな製品を識別し、製品情報の簡単な参照と取得を可能にします。';
-# MAGIC COMMENT ON COLUMN default.bronze_producttexts.LANGUAGE IS '製品の説明が提供される言語を指定し、ユーザーが優先する言語で情報にアクセスできるようにします。';
-# MAGIC COMMENT ON COLUMN default.bronze_producttexts.SHORT_DESCR IS '製品の簡潔な概要を提供し、重要な機能と利点を強調しています。';
-# MAGIC COMMENT ON COLUMN default.bronze_producttexts.MEDIUM_DESCR IS '製品の詳細な説明を提供し、その機能や使用方法について詳しく説明して、より深い理解を促進します。';
-# MAGIC COMMENT ON COLUMN default.bronze_producttexts.LONG_DESCR IS '製品の詳細な説明を含み、技術仕様、使用方法、そして深い知識のための他の関連情報が含まれています。';
-# MAGIC
-# MAGIC -- salesorderitems カラム
-# MAGIC COMMENT ON COLUMN default.bronze_salesorderitems.SALESORDERID IS '各販売注文の一意の識別子を表し、特定の注文を追跡および参照することを可能にします。';
-# MAGIC COMMENT ON COLUMN default.bronze_salesorderitems.SALESORDERITEM IS '販売注文内の個々のアイテムを識別し、詳細な注文管理を容易にします。';
-# MAGIC COMMENT ON COLUMN default.bronze_salesorderitems.PRODUCTID IS '各製品の固有の識別子を含み、在庫管理と販売追跡に不可欠です。';
-# MAGIC COMMENT ON COLUMN default.bronze_salesorderitems.NOTEID IS '販売注文アイテムに関連するメモの識別子を保持します。追加のコンテキストまたは指示に役立ちます。';
-# MAGIC COMMENT ON COLUMN default.bronze_salesorderitems.CURRENCY IS '取引が行われる通貨を指定し、財務報告および分析のために重要です。';
-# MAGIC COMMENT ON COLUMN default.bronze_salesorderitems.GROSSAMOUNT IS '一切控除前の合計額を表し、初期取引価値の明確な概要を提供する。';
-# MAGIC COMMENT ON COLUMN default.bronze_salesorderitems.NETAMOUNT IS '割引や返品などの控除後の最終額を示し、実際の売上からの収益を反映します。';
-# MAGIC COMMENT ON COLUMN default.bronze_salesorderitems.TAXAMOUNT IS '販売注文アイテムに適用される合計税額を表示し、コンプライアンスと財務計算に不可欠です。';
-# MAGIC COMMENT ON COLUMN default.bronze_salesorderitems.ITEMATPSTATUS IS '販売注文のアイテムのステータスを説明し、在庫状況または処理ステージを示すことができる。';
-# MAGIC COMMENT ON COLUMN default.bronze_salesorderitems.OPITEMPOS IS 'アイテムの運用位置に関する情報を含み、物流または履行に関連する場合があります。';
-# MAGIC COMMENT ON COLUMN default.bronze_salesorderitems.QUANTITY IS 'アイテムの注文単位数を示し、在庫管理と注文履行に不可欠です。';
-# MAGIC COMMENT ON COLUMN default.bronze_salesorderitems.QUANTITYUNIT IS '数量の測定単位を指定し、注文の詳細を明確にする。';
-# MAGIC COMMENT ON COLUMN default.bronze_salesorderitems.DELIVERYDATE IS '販売注文アイテムの出荷予定日を表し、スケジューリングと顧客とのコミュニケーションに重要です。';
-# MAGIC
-# MAGIC -- salesorders カラム
-# MAGIC COMMENT ON COLUMN default.bronze_salesorders.SALESORDERID IS '各販売注文の一意の識別子を表し、簡単に追跡および参照できるようにします。';
-# MAGIC COMMENT ON COLUMN default.bronze_salesorders.CREATEDBY IS '販売注文を作成したユーザーの識別子を示します。監査と責任追跡に役立ちます。';
-# MAGIC COMMENT ON COLUMN default.bronze_salesorders.CREATEDAT IS '販売注文が作成されたときのタイムスタンプを記録し、注文の履歴に関するコンテキストを提供する。';
-# MAGIC COMMENT ON COLUMN default.bronze_salesorders.CHANGEDBY IS '販売注文を最後に変更したユーザーの識別子を表示します。これは、変更を追跡するために重要です。';
-# MAGIC COMMENT ON COLUMN default.bronze_salesorders.CHANGEDAT IS '販売注文に最後に加えられた変更のタイムスタンプを取得し、注文のライフサイクルを理解するのに役立ちます。';
-# MAGIC COMMENT ON COLUMN default.bronze_salesorders.FISCVARIANT IS '販売注文に適用される財務バリアントを表し、財務報告および分析に影響を与えることができる。';
-# MAGIC COMMENT ON COLUMN default.bronze_salesorders.FISCALYEARPERIOD IS '販売注文が属する会計年度と期間を示し、財務計画と報告書のために不可欠です。';
-# MAGIC COMMENT ON COLUMN default.bronze_salesorders.NOTEID IS '販売注文に関連するメモの識別子を含み、追加のコンテキストまたは指示を可能にします。';
-# MAGIC COMMENT ON COLUMN default.bronze_salesorders.PARTNERID IS '販売注文に関連するビジネスパートナーの識別子を表し、関係管理に不可欠です。';
-# MAGIC COMMENT ON COLUMN default.bronze_salesorders.SALESORG IS '販売組織構造とレポートのために重要な、販売注文を担当する販売組織を特定する。';
-# MAGIC COMMENT ON COLUMN default.bronze_salesorders.CURRENCY IS '販売注文を処理する通貨を指定します。財務取引や換算に関係します。';
-# MAGIC COMMENT ON COLUMN default.bronze_salesorders.GROSSAMOUNT IS '一切の控除前の販売注文の合計額を反映し、注文の価値を明確に示します。';
-# MAGIC COMMENT ON COLUMN default.bronze_salesorders.NETAMOUNT IS '割引などの控除後の販売注文額を表し、収益計算に不可欠です。';
-# MAGIC COMMENT ON COLUMN default.bronze_salesorders.TAXAMOUNT IS '販売注文に適用される合計税額を示し、コンプライアンスと財務報告のために重要です。';
-# MAGIC COMMENT ON COLUMN default.bronze_salesorders.LIFECYCLESTATUS IS '販売注文のライフサイクルにおける現在のステータスを説明し、注文の進捗状況を管理および追跡するのに役立ちます。';
-# MAGIC COMMENT ON COLUMN default.bronze_salesorders.BILLINGSTATUS IS '販売注文の請求状況を表示し、財務の追跡と顧客とのコミュニケーションに重要です。';
-# MAGIC COMMENT ON COLUMN default.bronze_salesorders.DELIVERYSTATUS IS '販売注文の出荷状況を示します。物流と顧客満足度の両方に不可欠です。';
+# DBTITLE 1,ステージ別の実行記録を保存
+from pipeline.trace import HISTORY_TABLE
+
+# Per-stage numbers of this run go to the run-history table and a trace file (open it in https://ui.perfetto.dev)
+tracer.print_summary()
+tracer.save_history(spark, f"{catalog}.{schema}.{HISTORY_TABLE}")
+print(tracer.write_trace(f"/Volumes/{catalog}/{schema}/volume/traces/{tracer.run_id}.json"))
 
 # COMMAND ----------
 
-# DBTITLE 1,主キー制約を追加
-# MAGIC %sql
-# MAGIC -- BusinessPartner
-# MAGIC ALTER TABLE bronze_businesspartners ALTER COLUMN PARTNERID SET NOT NULL;
-# MAGIC ALTER TABLE bronze_businesspartners ADD PRIMARY KEY (PARTNERID) RELY;
-# MAGIC
-# MAGIC -- SalesOrders
-# MAGIC ALTER TABLE bronze_salesorders ALTER COLUMN SALESORDERID SET NOT NULL;
-# MAGIC ALTER TABLE bronze_salesorders ADD PRIMARY KEY (SALESORDERID) RELY;
-# MAGIC
-# MAGIC -- Products
-# MAGIC ALTER TABLE bronze_products ALTER COLUMN PRODUCTID SET NOT NULL;
-# MAGIC ALTER TABLE bronze_products ADD PRIMARY KEY (PRODUCTID) RELY;
-# MAGIC
-# MAGIC -- ProductCategories
-# MAGIC ALTER TABLE bronze_productcategories ALTER COLUMN PRODCATEGORYID SET NOT NULL;
-# MAGIC ALTER TABLE bronze_productcategories ADD PRIMARY KEY (PRODCATEGORYID) RELY;
+# MAGIC %md
+# MAGIC ## ストリーミング取込
 # MAGIC
-# MAGIC -- Employees
-# MAGIC ALTER TABLE bronze_employees ALTER COLUMN EMPLOYEEID SET NOT NULL;
-# MAGIC ALTER TABLE bronze_employees ADD PRIMARY KEY (EMPLOYEEID) RELY;
+# MAGIC `SalesOrders*.csv` / `SalesOrderItems*.csv` という名前の受注データを `data_path` に追加すると、Auto Loaderで差分だけをbronzeテーブルにマージし、影響を受けた月の特徴量・集計テーブルを更新します。取り込んだファイルは `data_path` に残り、セットアップを再実行しても元のCSVと合わせて読み込まれるため、ストリーミングで追加した行は失われません。スキーマは `schema_path`、処理済みの位置は `checkpoint_path` に記録されます。
 # MAGIC
-# MAGIC -- Address
-# MAGIC ALTER TABLE bronze_addresses ALTER COLUMN ADDRESSID SET NOT NULL;
-# MAGIC ALTER TABLE bronze_addresses ADD PRIMARY KEY (ADDRESSID) RELY;
+# MAGIC - `available_now`: 未処理のファイルをすべて取り込んで終了
+# MAGIC - `continuous`: 1分ごとに新しいファイルを監視し続ける
 
 # COMMAND ----------
 
-# DBTITLE 1,外部キー制約を追加
-# MAGIC %sql
-# MAGIC -- businesspartners → addresses
-# MAGIC ALTER TABLE bronze_businesspartners ADD CONSTRAINT fk_bp_address
-# MAGIC     FOREIGN KEY (ADDRESSID) REFERENCES bronze_addresses(ADDRESSID)
-# MAGIC     RELY;
-# MAGIC
-# MAGIC -- salesorders → businesspartners
-# MAGIC ALTER TABLE bronze_salesorders ADD CONSTRAINT fk_so_partner
-# MAGIC     FOREIGN KEY (PARTNERID) REFERENCES bronze_businesspartners(PARTNERID)
-# MAGIC     RELY;
-# MAGIC
-# MAGIC -- salesorders → employees（CreatedBy, ChangedByは社員IDと推測）
-# MAGIC ALTER TABLE bronze_salesorders ADD CONSTRAINT fk_so_createdby
-# MAGIC     FOREIGN KEY (CREATEDBY) REFERENCES bronze_employees(EMPLOYEEID)
-# MAGIC     RELY;
-# MAGIC ALTER TABLE bronze_salesorders ADD CONSTRAINT fk_so_changedby
-# MAGIC     FOREIGN KEY (CHANGEDBY) REFERENCES bronze_employees(EMPLOYEEID)
-# MAGIC     RELY;
-# MAGIC
-# MAGIC -- salesorderitems → salesorders
-# MAGIC ALTER TABLE bronze_salesorderitems ADD CONSTRAINT fk_soi_salesorder
-# MAGIC     FOREIGN KEY (SALESORDERID) REFERENCES bronze_salesorders(SALESORDERID)
-# MAGIC     RELY;
-# MAGIC
-# MAGIC -- salesorderitems → products
-# MAGIC ALTER TABLE bronze_salesorderitems ADD CONSTRAINT fk_soi_product
-# MAGIC     FOREIGN KEY (PRODUCTID) REFERENCES bronze_products(PRODUCTID)
-# MAGIC     RELY;
-# MAGIC
-# MAGIC -- products → productcategories
-# MAGIC ALTER TABLE bronze_products ADD CONSTRAINT fk_products_category
-# MAGIC     FOREIGN KEY (PRODCATEGORYID) REFERENCES bronze_productcategories(PRODCATEGORYID)
-# MAGIC     RELY;
-# MAGIC
-# MAGIC -- employees → addresses
-# MAGIC ALTER TABLE bronze_employees ADD CONSTRAINT fk_emp_address
-# MAGIC     FOREIGN KEY (ADDRESSID) REFERENCES bronze_addresses(ADDRESSID)
-# MAGIC     RELY;
-# MAGIC
-# MAGIC -- products → producttexts
-# MAGIC ALTER TABLE bronze_producttexts ADD CONSTRAINT fk_products_text
-# MAGIC     FOREIGN KEY (PRODUCTID) REFERENCES bronze_products(PRODUCTID)
-# MAGIC     RELY;
-# MAGIC
-# MAGIC -- productcategories → productcategorytext
-# MAGIC ALTER TABLE bronze_productcategorytext ADD CONSTRAINT fk_products_category_texts
-# MAGIC     FOREIGN KEY (PRODCATEGORYID) REFERENCES bronze_productcategories(PRODCATEGORYID)
-# MAGIC     RELY;
+# DBTITLE 1,受注データをストリーミングで取込
+from pipeline.streaming import start_sales_streams
+
+if streaming != "off":
+    queries = start_sales_streams(
+        spark, f"{catalog}.{schema}", data_path, schema_path, checkpoint_path,
+        processing_time="1 minute" if streaming == "continuous" else None,
+    )
+    if streaming == "available_now":
+        for query in queries:
+            query.awaitTermination()
 
 # COMMAND ----------
 
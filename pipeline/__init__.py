@@ -0,0 +1 @@
+"""Helpers for the SAP bike sales hands-on notebooks."""
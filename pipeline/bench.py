@@ -0,0 +1,269 @@
+"""Stage-by-stage benchmarks of the pipeline at several data scales.
+
+Every measured stage appends one JSON line to a results file with its wall
+time, rows, rows/sec, peak memory and bytes written, tagged with a run id
+and the git revision, so runs can be compared later:
+
+    python -m pipeline.bench --scales 10 100 1000 --results bench_results.jsonl
+    python -m pipeline.bench --results bench_results.jsonl --compare <run_a> <run_b>
+
+The local benchmark uses LocalEngine; run_spark_benchmark measures the
+Databricks path (ingest, date migration, feature build, sales_report) from a
+notebook.
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+
+import pyarrow as pa
+
+from pipeline import synth
+from pipeline.colcache import ColumnarCache
+from pipeline.engine import LocalEngine
+from pipeline.features import FEATURE_TABLE, qualified
+from pipeline.schemas import TABLES
+
+
+@dataclass
+class StageResult:
+    """Measurements of one pipeline stage in one benchmark run"""
+    run_id: str
+    engine: str
+    scale: float
+    stage: str
+    rows: int = 0
+    seconds: float = 0.0
+    rows_per_sec: float = 0.0
+    peak_memory_bytes: int = 0
+    bytes_written: int = 0
+    error: str = None
+    git_rev: str = None
+    started_at: str = None
+    extra: dict = field(default_factory=dict)
+
+
+def _rss_bytes():
+    """Current resident set size, or the peak so far where /proc is not available"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class _PeakMemory:
+    """Samples process memory on a background thread while a stage runs"""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while True:
+            self.peak = max(self.peak, _rss_bytes())
+            if self._stop.wait(self.interval):
+                return
+
+    def __enter__(self):
+        self.peak = _rss_bytes()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss_bytes())
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def directory_bytes(path):
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+class Benchmark:
+    """Collects StageResults for one run and appends them to a JSON Lines file"""
+
+    def __init__(self, results_path, engine, run_id=None):
+        self.results_path = results_path
+        self.engine = engine
+        self.run_id = run_id or datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S-") + uuid.uuid4().hex[:6]
+        self.git_rev = git_revision()
+        self.results = []
+
+    @contextmanager
+    def stage(self, name, scale):
+        """Time a stage; the body fills in rows, bytes_written and extra on the yielded result"""
+        result = StageResult(self.run_id, self.engine, scale, name, git_rev=self.git_rev,
+                             started_at=datetime.now(timezone.utc).isoformat(timespec="seconds"))
+        started = time.perf_counter()
+        try:
+            with _PeakMemory() as memory:
+                yield result
+        except Exception as e:
+            result.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            result.seconds = time.perf_counter() - started
+            result.peak_memory_bytes = memory.peak
+            result.rows_per_sec = result.rows / result.seconds if result.seconds and result.rows else 0.0
+            self._record(result)
+
+    def _record(self, result):
+        self.results.append(result)
+        with open(self.results_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(asdict(result), ensure_ascii=False) + "\n")
+        status = result.error or f"{result.rows:>12,} rows {result.rows_per_sec:>14,.0f} rows/s"
+        print(f"x{result.scale:<8g} {result.stage:<10} {result.seconds:>8.2f}s {status}")
+
+
+def run_local_benchmark(scales, work_dir, results_path, data_dir="data", report_months=("2023-01", "2023-12"),
+                        seed=0, keep_data=False):
+    """Generate each scale and time generate / load / convert / load_cached / feature / report locally"""
+    bench = Benchmark(results_path, "local")
+    for scale in scales:
+        scale_dir = os.path.join(work_dir, f"x{scale:g}")
+
+        with bench.stage("generate", scale) as r:
+            counts = synth.generate(data_dir, scale_dir, scale, seed)
+            r.rows = sum(counts.values())
+            r.bytes_written = directory_bytes(scale_dir)
+
+        engine = LocalEngine(scale_dir)
+        with bench.stage("load", scale) as r:
+            # Typed read including the yyyyMMdd -> DATE conversion
+            r.rows = sum(engine.arrow_table(t).num_rows for t in TABLES)
+            r.extra["arrow_bytes"] = pa.total_allocated_bytes()
+
+        cache = ColumnarCache(os.path.join(scale_dir, "_cache"))
+        with bench.stage("convert", scale) as r:
+            for table_schema in TABLES.values():
+                cache.convert(os.path.join(scale_dir, table_schema.source_file), table_schema)
+                r.rows += engine.arrow_table(table_schema.table).num_rows
+            r.bytes_written = directory_bytes(cache.cache_dir)
+
+        with bench.stage("load_cached", scale) as r:
+            cached = LocalEngine(scale_dir, cache)
+            r.rows = sum(cached.arrow_table(t).num_rows for t in TABLES)
+
+        with bench.stage("feature", scale) as r:
+            feature = engine.feature_arrow()
+            r.rows = engine.arrow_table("bronze_salesorderitems").num_rows
+            r.extra["output_rows"] = feature.num_rows
+            r.bytes_written = feature.nbytes
+
+        with bench.stage("report", scale) as r:
+            report = engine.sales_report(*report_months)
+            r.rows = feature.num_rows
+            r.extra["output_rows"] = len(report)
+
+        if not keep_data:
+            shutil.rmtree(scale_dir)
+    return bench.results
+
+
+def run_spark_benchmark(spark, csv_dirs, results_path, namespace="workspace.default",
+                        report_months=("2023-01", "2023-12")):
+    """Time the Databricks path for pre-generated data sets.
+
+    csv_dirs maps each scale to a directory (e.g. a volume path) holding the
+    generated CSV files. Tables are overwritten in the current schema.
+    """
+    from pipeline.features import rebuild_feature_sales_by_product
+    from pipeline.ingest import ingest_csv_overwrite
+    from pipeline.migrations import migrate_date_columns
+
+    catalog, schema = namespace.split(".")
+    bench = Benchmark(results_path, "spark")
+    for scale, csv_dir in csv_dirs.items():
+        loaded = {}
+        with bench.stage("load", scale) as r:
+            for table_schema in TABLES.values():
+                result = ingest_csv_overwrite(spark, f"{csv_dir}/{table_schema.source_file}", table_schema)
+                loaded[table_schema.table] = result.rows
+                r.rows += result.rows
+                r.bytes_written += result.bytes
+
+        with bench.stage("dates", scale) as r:
+            r.extra["migrated"] = migrate_date_columns(spark, catalog, schema)
+
+        feature = qualified(namespace, FEATURE_TABLE)
+        with bench.stage("feature", scale) as r:
+            rebuild_feature_sales_by_product(spark, namespace)
+            r.rows = loaded["bronze_salesorderitems"]
+            r.bytes_written = spark.sql(f"DESCRIBE DETAIL {feature}").first()["sizeInBytes"]
+        # Counted outside the timed stages
+        feature_rows = spark.table(feature).count()
+
+        with bench.stage("report", scale) as r:
+            report = spark.sql(
+                f"SELECT * FROM {qualified(namespace, 'sales_report')}(:start_month, :end_month)",
+                args={"start_month": report_months[0], "end_month": report_months[1]},
+            ).toPandas()
+            r.rows = feature_rows
+            r.extra["output_rows"] = len(report)
+    return bench.results
+
+
+def load_results(results_path):
+    with open(results_path, encoding="utf-8") as f:
+        return [StageResult(**json.loads(line)) for line in f if line.strip()]
+
+
+def compare_runs(results_path, baseline_run, candidate_run):
+    """Print per-stage seconds, rows/sec and peak memory of two runs side by side"""
+    by_run = defaultdict(dict)
+    for r in load_results(results_path):
+        by_run[r.run_id][(r.scale, r.stage)] = r
+    baseline, candidate = by_run[baseline_run], by_run[candidate_run]
+
+    header = f"{'scale':>8} {'stage':<10} {'seconds':>9} {'->':>9} {'speedup':>8} {'peak MB':>9} {'->':>9}"
+    print(header)
+    print("-" * len(header))
+    for key in [k for k in baseline if k in candidate]:
+        b, c = baseline[key], candidate[key]
+        speedup = b.seconds / c.seconds if c.seconds else float("inf")
+        print(f"{key[0]:>8g} {key[1]:<10} {b.seconds:>9.2f} {c.seconds:>9.2f} {speedup:>7.2f}x "
+              f"{b.peak_memory_bytes / 2**20:>9.0f} {c.peak_memory_bytes / 2**20:>9.0f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the local pipeline at several data scales")
+    parser.add_argument("--scales", type=float, nargs="+", default=[10, 100])
+    parser.add_argument("--results", default="bench_results.jsonl")
+    parser.add_argument("--work-dir", default="/tmp/dbx_handson_bench")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--keep-data", action="store_true")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE_RUN", "CANDIDATE_RUN"))
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare_runs(args.results, *args.compare)
+        return
+    os.makedirs(args.work_dir, exist_ok=True)
+    results = run_local_benchmark(args.scales, args.work_dir, args.results, args.data_dir, keep_data=args.keep_data)
+    print(f"run {results[0].run_id} appended to {args.results}")
+
+
+if __name__ == "__main__":
+    main()
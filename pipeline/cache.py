@@ -0,0 +1,134 @@
+"""In-process result cache for the sales_report / sales_prediction table functions.
+
+Results are keyed on the call arguments plus the current versions of the
+tables the function reads, so a new commit to any source table invalidates
+every cached result. Looking a version up is a DESCRIBE HISTORY round trip
+per table, so versions are checked at most every version_check_interval
+seconds (5 by default) and a hit may return a result up to that old.
+Pass 0 to check on every call. The check runs outside the cache lock, and
+calls arriving while another thread checks keep using the versions known
+so far instead of waiting for it. Entries are evicted least-recently-used first once the
+entry or row budget is exceeded.
+"""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from pipeline.delta import table_version
+from pipeline.forecast import FORECAST_TABLE
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    invalidations: int = 0
+    entries: int = 0
+    rows: int = 0
+
+    @property
+    def hit_rate(self):
+        calls = self.hits + self.misses
+        return self.hits / calls if calls else 0.0
+
+
+class TableFunctionCache:
+    """LRU cache of one table function's results, returned as pandas DataFrames"""
+
+    def __init__(self, spark, function, source_tables, max_entries=256, max_rows=1_000_000,
+                 version_check_interval=5.0):
+        self.spark = spark
+        self.function = function
+        self.source_tables = tuple(source_tables)
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        # Seconds between source version checks, i.e. how stale a hit may be; 0 checks on every call
+        self.version_check_interval = version_check_interval
+        self._entries = OrderedDict()
+        self._versions = None
+        self._checked_at = 0.0
+        self._stats = CacheStats()
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+
+    def _due(self):
+        return self._versions is None or time.monotonic() - self._checked_at >= self.version_check_interval
+
+    def _current_versions(self):
+        """Source versions, looked up again once the check interval has passed"""
+        with self._lock:
+            versions, due = self._versions, self._due()
+        if not due:
+            return versions
+        # Only the first call ever has to wait; later ones use the known versions while a check runs
+        if not self._reload_lock.acquire(blocking=versions is None):
+            return versions
+        try:
+            with self._lock:
+                if not self._due():
+                    return self._versions
+            versions = tuple(table_version(self.spark, t) for t in self.source_tables)
+            with self._lock:
+                self._checked_at = time.monotonic()
+                if versions != self._versions:
+                    if self._entries:
+                        self._stats.invalidations += 1
+                    self._entries.clear()
+                    self._stats.rows = 0
+                    self._versions = versions
+                return self._versions
+        finally:
+            self._reload_lock.release()
+
+    def _query(self, args):
+        placeholders = ", ".join(f":arg{i}" for i in range(len(args)))
+        params = {f"arg{i}": value for i, value in enumerate(args)}
+        return self.spark.sql(f"SELECT * FROM {self.function}({placeholders})", args=params).toPandas()
+
+    def __call__(self, *args):
+        key = (args, self._current_versions())
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._stats.hits += 1
+                return self._entries[key].copy()
+            self._stats.misses += 1
+
+        # Run the query outside the lock so concurrent misses do not serialize
+        result = self._query(args)
+
+        with self._lock:
+            if key[1] == self._versions and key not in self._entries:
+                self._entries[key] = result
+                self._stats.rows += len(result)
+                self._evict()
+        return result.copy()
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._stats.rows > self.max_rows):
+            _, evicted = self._entries.popitem(last=False)
+            self._stats.rows -= len(evicted)
+            self._stats.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._stats.rows = 0
+
+    def stats(self):
+        with self._lock:
+            return CacheStats(**{**self._stats.__dict__, "entries": len(self._entries)})
+
+
+def sales_report_cache(spark, namespace="workspace.default", **kwargs):
+    """Cache for sales_report, invalidated by commits to feature_sales_by_product"""
+    return TableFunctionCache(
+        spark, f"{namespace}.sales_report", [f"{namespace}.feature_sales_by_product"], **kwargs)
+
+
+def sales_prediction_cache(spark, forecast_table=None, namespace="workspace.default", **kwargs):
+    """Cache for sales_prediction, invalidated by commits to the forecast table"""
+    forecast_table = forecast_table or f"{namespace}.{FORECAST_TABLE.format(grain='region')}"
+    return TableFunctionCache(spark, f"{namespace}.sales_prediction", [forecast_table], **kwargs)
@@ -0,0 +1,91 @@
+"""Typed columnar cache of the source CSV files.
+
+Each CSV is parsed once with its registered schema and written as an Arrow
+IPC file named after the table and the SHA-256 of the CSV. Later reads
+memory-map that file and only materialize the requested columns, so no text
+is parsed again until the CSV changes; a changed CSV gets a new file and the
+old one is removed.
+
+Buffers are LZ4-compressed by default, which keeps the cache small and only
+decompresses the projected columns. With compression=None the buffers are
+used straight from the page cache without any copy.
+
+A small sidecar records the CSV's size and mtime next to its hash, so an
+untouched CSV is recognized without hashing it again.
+"""
+import glob
+import json
+import os
+
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+from pipeline.engine import read_csv_arrow
+from pipeline.fetch import file_fingerprint
+
+
+class ColumnarCache:
+    """Arrow IPC copies of the source CSV files, keyed by their content hash"""
+
+    def __init__(self, cache_dir, compression="lz4"):
+        self.cache_dir = cache_dir
+        self.compression = compression
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, table, fingerprint):
+        return os.path.join(self.cache_dir, f"{table}-{fingerprint[:16]}.arrow")
+
+    def _sidecar(self, table):
+        return os.path.join(self.cache_dir, f"{table}.json")
+
+    def fingerprint(self, csv_path, table):
+        """Hash of the CSV, reusing the recorded one while size and mtime are unchanged"""
+        stat = os.stat(csv_path)
+        try:
+            with open(self._sidecar(table), encoding="utf-8") as f:
+                recorded = json.load(f)
+            if recorded["size"] == stat.st_size and recorded["mtime_ns"] == stat.st_mtime_ns:
+                return recorded["sha256"]
+        except (OSError, ValueError, KeyError):
+            pass
+        fingerprint = file_fingerprint(csv_path)
+        with open(self._sidecar(table), "w", encoding="utf-8") as f:
+            json.dump({"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": fingerprint}, f)
+        return fingerprint
+
+    def convert(self, csv_path, table_schema):
+        """Make sure the cache holds the current contents of csv_path; returns the cache file path"""
+        table = table_schema.table
+        path = self._path(table, self.fingerprint(csv_path, table))
+        if os.path.exists(path):
+            return path
+
+        data = read_csv_arrow(csv_path, table_schema)
+        options = ipc.IpcWriteOptions(compression=self.compression)
+        with pa.OSFile(path + ".part", "wb") as sink, ipc.new_file(sink, data.schema, options=options) as writer:
+            writer.write_table(data)
+        os.replace(path + ".part", path)
+
+        # Older versions of this table are stale now
+        for stale in glob.glob(os.path.join(self.cache_dir, f"{table}-*.arrow")):
+            if stale != path:
+                os.remove(stale)
+        return path
+
+    def read(self, csv_path, table_schema, columns=None):
+        """Table for csv_path from the cache, converting it first if needed.
+
+        columns limits the read to those columns; the others are neither
+        decompressed nor paged in.
+        """
+        path = self.convert(csv_path, table_schema)
+        options = None
+        if columns is not None:
+            # The cache files hold the table columns in registry order
+            names = [c.name for c in table_schema.table_columns]
+            missing = [c for c in columns if c not in names]
+            if missing:
+                raise KeyError(f"{table_schema.table} has no columns {missing}")
+            options = ipc.IpcReadOptions(included_fields=[names.index(c) for c in columns])
+        data = ipc.open_file(pa.memory_map(path, "r"), options=options).read_all()
+        return data if columns is None else data.select(list(columns))
@@ -0,0 +1,109 @@
+"""Table and column descriptions kept in comments.json and applied as a diff.
+
+The current comments of every manifest table are read from
+information_schema in one query; only comments that differ are sent, as at
+most one COMMENT ON TABLE and one multi-column ALTER TABLE per table. A
+schema that is already up to date costs that single query.
+"""
+import json
+import os
+
+MANIFEST_PATH = os.path.join(os.path.dirname(__file__), "comments.json")
+
+
+def load_comments(path=MANIFEST_PATH):
+    """{table: {"comment": str, "columns": {column: str}}}"""
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _sql_string(value):
+    return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def current_comments(spark, catalog, schema, tables):
+    """Existing comments of the given tables as {table: {"comment": ..., "columns": {...}}}, in one query"""
+    names = ", ".join(f"'{t}'" for t in tables)
+    rows = spark.sql(f"""
+    SELECT table_name, NULL AS column_name, comment
+    FROM {catalog}.information_schema.tables
+    WHERE table_schema = '{schema}' AND table_name IN ({names})
+    UNION ALL
+    SELECT table_name, column_name, comment
+    FROM {catalog}.information_schema.columns
+    WHERE table_schema = '{schema}' AND table_name IN ({names})
+    """).collect()
+
+    current = {}
+    for row in rows:
+        entry = current.setdefault(row["table_name"], {"comment": None, "columns": {}})
+        if row["column_name"] is None:
+            entry["comment"] = row["comment"]
+        else:
+            entry["columns"][row["column_name"].upper()] = row["comment"]
+    return current
+
+
+def comment_changes(manifest, current):
+    """Comments to apply per existing table: {table: (table comment or None, {column: comment})}.
+
+    Tables that do not exist yet and columns the table does not have are skipped.
+    """
+    changes = {}
+    for table, wanted in manifest.items():
+        existing = current.get(table)
+        if existing is None:
+            continue
+        table_comment = wanted.get("comment")
+        if table_comment == existing["comment"]:
+            table_comment = None
+        columns = {
+            column: comment for column, comment in wanted.get("columns", {}).items()
+            if column.upper() in existing["columns"] and existing["columns"][column.upper()] != comment
+        }
+        if table_comment is not None or columns:
+            changes[table] = (table_comment, columns)
+    return changes
+
+
+def comment_statements(table, table_comment, columns):
+    """At most one statement for the table comment and one for all column comments"""
+    statements = []
+    if table_comment is not None:
+        statements.append(f"COMMENT ON TABLE {table} IS {_sql_string(table_comment)}")
+    if columns:
+        assignments = ", ".join(f"`{c}` COMMENT {_sql_string(comment)}" for c, comment in columns.items())
+        statements.append(f"ALTER TABLE {table} ALTER COLUMN {assignments}")
+    return statements
+
+
+def _apply_table(spark, table, table_comment, columns):
+    if table_comment is not None:
+        spark.sql(comment_statements(table, table_comment, {})[0])
+    if not columns:
+        return
+    try:
+        spark.sql(comment_statements(table, None, columns)[0])
+    except Exception:
+        # Runtimes without multi-column ALTER COLUMN take one statement per column
+        for column, comment in columns.items():
+            spark.sql(comment_statements(table, None, {column: comment})[0])
+
+
+def apply_comments(spark, catalog, schema, manifest=None, tables=None):
+    """Bring table and column comments in line with the manifest; returns the applied changes"""
+    manifest = manifest if manifest is not None else load_comments()
+    if tables is not None:
+        manifest = {t: v for t, v in manifest.items() if t in tables}
+    if not manifest:
+        return {}
+
+    changes = comment_changes(manifest, current_comments(spark, catalog, schema, manifest))
+    for table, (table_comment, columns) in changes.items():
+        _apply_table(spark, f"{catalog}.{schema}.{table}", table_comment, columns)
+        updated = (["table"] if table_comment is not None else []) + list(columns)
+        print(f"Commented {table}: {', '.join(updated)}")
+
+    if not changes:
+        print("All comments are up to date")
+    return changes
@@ -0,0 +1,45 @@
+"""Small helpers around Delta table metadata."""
+
+
+def table_version(spark, table):
+    """Latest committed version of a Delta table"""
+    return spark.sql(f"DESCRIBE HISTORY {table} LIMIT 1").first()["version"]
+
+
+def get_table_property(spark, table, key):
+    """Read one table property, or None if the table or property does not exist"""
+    if not spark.catalog.tableExists(table):
+        return None
+    return spark.sql(f"DESCRIBE DETAIL {table}").first()["properties"].get(key)
+
+
+def set_table_properties(spark, table, properties):
+    """Set several table properties in a single commit"""
+    assignments = ", ".join(f"'{key}' = '{value}'" for key, value in properties.items())
+    spark.sql(f"ALTER TABLE {table} SET TBLPROPERTIES ({assignments})")
+
+
+def _write_metrics(metrics):
+    metrics = metrics or {}
+    return {
+        "rows": int(metrics.get("numOutputRows", 0)),
+        "bytes": int(metrics.get("numOutputBytes", metrics.get("numTargetBytesAdded", 0))),
+        "files": int(metrics.get("numFiles", metrics.get("numTargetFilesAdded", 0))),
+    }
+
+
+def last_commit_metrics(spark, table):
+    """Rows, bytes and files written by the table's latest commit, read from the Delta log"""
+    return _write_metrics(spark.sql(f"DESCRIBE HISTORY {table} LIMIT 1").first()["operationMetrics"])
+
+
+def commit_metrics_since(spark, table, version=None):
+    """Rows, bytes and files written by all commits after version (every commit if None)"""
+    history = spark.sql(f"DESCRIBE HISTORY {table}")
+    if version is not None:
+        history = history.where(f"version > {version}")
+    totals = {"rows": 0, "bytes": 0, "files": 0}
+    for row in history.select("operationMetrics").collect():
+        for key, value in _write_metrics(row["operationMetrics"]).items():
+            totals[key] += value
+    return totals
@@ -0,0 +1,251 @@
+"""Versioned, sharded snapshots of feature_sales_by_product for training.
+
+A snapshot pins one version of the feature table. Its rows are written as
+one Arrow IPC shard per FISCAL_YEAR_MONTH under shards/, and a manifest
+(manifests/v{version}.json) lists the shards with their rows, bytes and
+fingerprint. latest.json points at the manifest of the highest version;
+exporting an older version adds its manifest without moving latest.json
+back.
+
+Shards are named after their month and fingerprint, so a month that did
+not change between two versions keeps its file and both manifests refer
+to it. A new export first fingerprints every month of the new version in
+one aggregate query (row count and bit_xor of row hashes), then reads
+and writes only the months whose fingerprint differs from the previous
+manifest. Older manifests stay loadable until prune_shards removes
+shards no kept manifest refers to.
+
+Loading memory-maps the shards. Shards are LZ4-compressed by default;
+with compression=None they are read straight from the page cache without
+a copy, and numeric columns without nulls convert to numpy zero-copy as
+well.
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.ipc as ipc
+
+from pipeline.delta import table_version
+from pipeline.features import FEATURE_TABLE, qualified
+
+NO_MONTH = "none"
+
+
+def _write_json(path, data):
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+
+
+def _month_label(value):
+    return value.strftime("%Y-%m") if value is not None else NO_MONTH
+
+
+def manifest_path(out_dir, version):
+    return os.path.join(out_dir, "manifests", f"v{version}.json")
+
+
+def load_manifest(out_dir, version=None):
+    """Manifest of a version (the latest one if None), or None if there is none"""
+    if version is None:
+        try:
+            with open(os.path.join(out_dir, "latest.json"), encoding="utf-8") as f:
+                version = json.load(f)["version"]
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+    try:
+        with open(manifest_path(out_dir, version), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _split_months(data):
+    """{month label: rows of that month sorted by the feature key}"""
+    months = {}
+    for value in data["FISCAL_YEAR_MONTH"].unique().to_pylist():
+        mask = pc.is_null(data["FISCAL_YEAR_MONTH"]) if value is None else \
+            pc.equal(data["FISCAL_YEAR_MONTH"], pa.scalar(value, data.schema.field("FISCAL_YEAR_MONTH").type))
+        rows = data.filter(mask)
+        months[_month_label(value)] = rows.sort_by([("REGION", "ascending"), ("PRODUCTID", "ascending")])
+    return months
+
+
+def write_snapshot(out_dir, source, version, fingerprints, read_months, compression="lz4"):
+    """Write the manifest of one version, exporting only months missing from the previous one.
+
+    fingerprints maps every month label of the version to its fingerprint;
+    read_months(labels) returns the rows of those months as an Arrow table.
+    Returns the manifest.
+    """
+    os.makedirs(os.path.join(out_dir, "shards"), exist_ok=True)
+    os.makedirs(os.path.join(out_dir, "manifests"), exist_ok=True)
+    previous = load_manifest(out_dir)
+    reusable = {}
+    if previous is not None and previous.get("compression") == compression:
+        reusable = {s["month"]: s for s in previous["shards"]
+                    if fingerprints.get(s["month"]) == s["fingerprint"]
+                    and os.path.exists(os.path.join(out_dir, s["path"]))}
+
+    changed = sorted(m for m in fingerprints if m not in reusable)
+    shards = dict(reusable)
+    schema = previous["schema"] if previous else None
+    if changed:
+        data = read_months(changed)
+        schema = [[f.name, str(f.type)] for f in data.schema]
+        options = ipc.IpcWriteOptions(compression=compression)
+        for month, rows in _split_months(data).items():
+            fingerprint = fingerprints[month]
+            path = os.path.join("shards", f"{month}-{hashlib.sha256(fingerprint.encode()).hexdigest()[:16]}.arrow")
+            full = os.path.join(out_dir, path)
+            with pa.OSFile(full + ".part", "wb") as sink, ipc.new_file(sink, rows.schema, options=options) as w:
+                w.write_table(rows)
+            os.replace(full + ".part", full)
+            shards[month] = {"month": month, "path": path, "rows": rows.num_rows,
+                             "bytes": os.path.getsize(full), "fingerprint": fingerprint}
+
+    manifest = {
+        "source": source,
+        "version": version,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "compression": compression,
+        "schema": schema,
+        "rows": sum(s["rows"] for s in shards.values()),
+        "exported_months": changed,
+        "shards": [shards[m] for m in sorted(shards)],
+    }
+    _write_json(manifest_path(out_dir, version), manifest)
+    if previous is None or version >= previous["version"]:
+        _write_json(os.path.join(out_dir, "latest.json"), {"version": version})
+    return manifest
+
+
+def export_training_set(spark, out_dir, namespace="workspace.default", version=None, compression="lz4"):
+    """Snapshot the feature table at a version (the current one if None) into out_dir"""
+    feature = qualified(namespace, FEATURE_TABLE)
+    version = table_version(spark, feature) if version is None else version
+    source = f"{feature} VERSION AS OF {version}"
+
+    rows = spark.sql(f"""
+    SELECT
+      coalesce(date_format(FISCAL_YEAR_MONTH, 'yyyy-MM'), '{NO_MONTH}') AS month
+      , count(*) AS rows
+      , bit_xor(xxhash64(REGION, PRODUCTID, FISCAL_YEAR_MONTH, TOTAL_NETAMOUNT)) AS hash
+    FROM {source}
+    GROUP BY 1
+    """).collect()
+    fingerprints = {r["month"]: f"{r['rows']}-{r['hash'] & 0xFFFFFFFFFFFFFFFF:016x}" for r in rows}
+
+    def read_months(months):
+        dated = [m for m in months if m != NO_MONTH]
+        conditions = []
+        if dated:
+            conditions.append("FISCAL_YEAR_MONTH IN (" + ", ".join(f"DATE'{m}-01'" for m in dated) + ")")
+        if NO_MONTH in months:
+            conditions.append("FISCAL_YEAR_MONTH IS NULL")
+        df = spark.sql(f"SELECT * FROM {source} WHERE {' OR '.join(conditions)}")
+        return df.toArrow() if hasattr(df, "toArrow") else pa.Table.from_pandas(df.toPandas(), preserve_index=False)
+
+    manifest = write_snapshot(out_dir, feature, version, fingerprints, read_months, compression)
+    print(f"Exported version {version} of {feature}: {len(manifest['exported_months'])} of "
+          f"{len(manifest['shards'])} shards written, {manifest['rows']:,} rows")
+    return manifest
+
+
+def export_local(engine, out_dir, version=None, compression="lz4"):
+    """Snapshot a LocalEngine's feature table; version defaults to the latest manifest's + 1"""
+    data = engine.feature_arrow()
+    if version is None:
+        previous = load_manifest(out_dir)
+        version = previous["version"] + 1 if previous else 0
+    months = _split_months(data)
+    fingerprints = {}
+    for month, rows in months.items():
+        sink = pa.BufferOutputStream()
+        with ipc.new_stream(sink, rows.schema) as writer:
+            writer.write_table(rows)
+        fingerprints[month] = f"{rows.num_rows}-{hashlib.sha256(sink.getvalue()).hexdigest()[:16]}"
+    return write_snapshot(out_dir, "local:feature_sales_by_product", version, fingerprints,
+                          lambda labels: pa.concat_tables([months[m] for m in labels]), compression)
+
+
+def load_training_set(out_dir, version=None, columns=None, months=None):
+    """Arrow table of a snapshot (the latest if version is None), memory-mapped shard by shard.
+
+    columns limits the read to those columns and months ('yyyy-MM' labels)
+    to those shards.
+    """
+    manifest = load_manifest(out_dir, version)
+    if manifest is None:
+        raise FileNotFoundError(f"No training set snapshot {version if version is not None else ''} in {out_dir}")
+    names = [name for name, _ in manifest["schema"]]
+    options = None
+    if columns is not None:
+        options = ipc.IpcReadOptions(included_fields=[names.index(c) for c in columns])
+    tables = [
+        ipc.open_file(pa.memory_map(os.path.join(out_dir, shard["path"]), "r"), options=options).read_all()
+        for shard in manifest["shards"] if months is None or shard["month"] in months
+    ]
+    if not tables:
+        return pa.schema([(n, t) for n, t in manifest["schema"]]).empty_table()
+    data = pa.concat_tables(tables)
+    return data if columns is None else data.select(list(columns))
+
+
+def training_frame(out_dir, version=None, columns=None, months=None):
+    """load_training_set as a pandas DataFrame, converting column by column"""
+    return load_training_set(out_dir, version, columns, months).to_pandas(split_blocks=True)
+
+
+def training_arrays(out_dir, version=None, columns=None, months=None):
+    """{column: numpy array}; zero-copy for uncompressed numeric columns in a single shard"""
+    data = load_training_set(out_dir, version, columns, months)
+    return {name: data[name].to_numpy() for name in data.column_names}
+
+
+def prune_shards(out_dir, keep=5):
+    """Delete all but the newest keep (at least one) manifests and the shards no kept manifest refers to"""
+    keep = max(keep, 1)
+    manifests = sorted(glob.glob(os.path.join(out_dir, "manifests", "v*.json")),
+                       key=lambda p: int(os.path.basename(p)[1:-5]))
+    for path in manifests[:-keep]:
+        os.remove(path)
+    referenced = set()
+    for path in manifests[-keep:]:
+        with open(path, encoding="utf-8") as f:
+            referenced.update(s["path"] for s in json.load(f)["shards"])
+    removed = 0
+    for shard in glob.glob(os.path.join(out_dir, "shards", "*.arrow")):
+        if os.path.relpath(shard, out_dir) not in referenced:
+            os.remove(shard)
+            removed += 1
+    return removed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the local feature table as a training snapshot")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--out", default=".cache/training")
+    parser.add_argument("--compression", default="lz4", help="lz4, zstd or none")
+    args = parser.parse_args(argv)
+
+    from pipeline.engine import LocalEngine
+    compression = None if args.compression == "none" else args.compression
+    manifest = export_local(LocalEngine(args.data_dir), args.out, compression=compression)
+    print(f"Version {manifest['version']}: wrote {len(manifest['exported_months'])} of "
+          f"{len(manifest['shards'])} shards, {manifest['rows']:,} rows")
+
+    started = time.perf_counter()
+    data = load_training_set(args.out, manifest["version"])
+    print(f"Loaded {data.num_rows:,} rows in {(time.perf_counter() - started) * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""Concurrent, conditional download of the source CSV files."""
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+MANIFEST_NAME = "_manifest.json"
+CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass
+class FetchResult:
+    """Outcome of fetching one file"""
+    filename: str
+    path: str = None
+    status: str = "failed"  # downloaded / not_modified / failed
+    bytes: int = 0
+    error: str = None
+    entry: dict = None
+
+    @property
+    def ok(self):
+        return self.status != "failed"
+
+
+def file_fingerprint(path, chunk_size=CHUNK_SIZE):
+    """SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def create_session(max_workers=4, retries=3, backoff_factor=0.5):
+    """Create a pooled HTTP session that retries with exponential backoff"""
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["GET"]),
+    )
+    adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def load_manifest(dest_dir):
+    """Load the ETag/Last-Modified manifest kept next to the downloaded files"""
+    try:
+        with open(os.path.join(dest_dir, MANIFEST_NAME), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_manifest(dest_dir, manifest):
+    """Write the manifest atomically"""
+    path = os.path.join(dest_dir, MANIFEST_NAME)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def download_csv_file(session, base_url, filename, dest_dir, entry=None, timeout=30):
+    """Download one CSV file, skipping it if the server reports it unchanged"""
+    url = f"{base_url}/{filename}"
+    path = os.path.join(dest_dir, filename)
+
+    # Only ask for a conditional response if the local copy is still the one we recorded
+    headers = {}
+    if entry and os.path.exists(path) and os.path.getsize(path) == entry.get("size"):
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    try:
+        with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+            if response.status_code == 304:
+                return FetchResult(filename, path, "not_modified", 0, entry=entry)
+            response.raise_for_status()
+
+            # Stream to a temporary file so a failed download never replaces a good copy
+            digest = hashlib.sha256()
+            size = 0
+            with open(path + ".part", "wb") as f:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    f.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+            os.replace(path + ".part", path)
+
+            new_entry = {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "sha256": digest.hexdigest(),
+                "size": size,
+            }
+            return FetchResult(filename, path, "downloaded", size, entry=new_entry)
+    except Exception as e:
+        # A download cut off mid-stream leaves its partial file behind
+        if os.path.exists(path + ".part"):
+            os.remove(path + ".part")
+        return FetchResult(filename, error=str(e))
+
+
+class CsvFetcher:
+    """Shared pooled session and manifest for fetching files one at a time from several threads"""
+
+    def __init__(self, base_url, dest_dir, max_workers=4, retries=3, backoff_factor=0.5, timeout=30):
+        os.makedirs(dest_dir, exist_ok=True)
+        self.base_url = base_url
+        self.dest_dir = dest_dir
+        self.timeout = timeout
+        self.manifest = load_manifest(dest_dir)
+        self.session = create_session(max_workers, retries, backoff_factor)
+        self._lock = threading.Lock()
+
+    def fetch(self, filename):
+        with self._lock:
+            entry = self.manifest.get(filename)
+        result = download_csv_file(self.session, self.base_url, filename, self.dest_dir, entry, self.timeout)
+        if result.ok:
+            with self._lock:
+                self.manifest[filename] = result.entry
+        print(f"{result.status:>12}  {result.filename}" + (f"  ({result.error})" if result.error else ""))
+        return result
+
+    def close(self):
+        """Persist the manifest and release pooled connections"""
+        with self._lock:
+            save_manifest(self.dest_dir, self.manifest)
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def download_csv_files(filenames, base_url, dest_dir, max_workers=4, retries=3, backoff_factor=0.5, timeout=30):
+    """Download all CSV files concurrently over one session into dest_dir/<filename>"""
+    with CsvFetcher(base_url, dest_dir, max_workers, retries, backoff_factor, timeout) as fetcher, \
+            ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(fetcher.fetch, filenames))
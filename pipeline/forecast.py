@@ -0,0 +1,252 @@
+"""Batched monthly sales forecasts from feature_sales_by_product.
+
+Every series (one per REGION, or per REGION x PRODUCTID) is modelled with
+Holt's linear trend method. All series are fitted at once: the smoothing
+recursion runs over months on a (parameter grid x series) array, and each
+series keeps the (alpha, beta) with the smallest one-step-ahead squared
+error.
+
+The fitted parameters and the final level/trend of every series are kept
+in a state table. When only new months have arrived, the recursion is
+continued from that state with the cached parameters instead of refitting;
+series without state, or all series after a change to already-fitted
+months, are fitted from scratch. Parameters are also re-estimated once
+REFIT_AFTER months have been added since the last fit.
+
+The state table records the source versions the feature table reflected
+when it was fitted, so the months rewritten since then come from the
+change feed rather than from whichever refresh ran last.
+
+Forecasts are written with predicted_TOTAL_NETAMOUNT and lower/upper
+bounds of a normal prediction interval, which sales_prediction reads.
+"""
+from dataclasses import dataclass, fields
+
+import numpy as np
+import pandas as pd
+
+from pipeline.features import (
+    FEATURE_TABLE, LAYOUT_PROPERTY, changed_months as source_changed_months, qualified, record_versions,
+    recorded_versions,
+)
+
+GRAINS = {
+    "region": ("REGION",),
+    "product": ("REGION", "PRODUCTID"),
+}
+FORECAST_TABLE = "forecast_sales_by_{grain}"
+STATE_TABLE = "forecast_state_by_{grain}"
+LAYOUT_VERSION = "1"
+
+ALPHAS = np.linspace(0.05, 0.95, 19)
+BETAS = np.linspace(0.0, 0.5, 11)
+# 95% prediction interval
+Z = 1.959964
+REFIT_AFTER = 6
+
+
+@dataclass
+class HoltState:
+    """Fitted parameters and final state of a batch of series, one entry per series"""
+    alpha: np.ndarray
+    beta: np.ndarray
+    level: np.ndarray
+    trend: np.ndarray
+    sse: np.ndarray
+    n: np.ndarray  # one-step errors included in sse
+    months_since_fit: np.ndarray
+
+
+def _run(y, alpha, beta, level, trend):
+    """Continue the Holt recursion over the columns of y; returns (level, trend, sse, n).
+
+    alpha/beta/level/trend broadcast against y[..., t], so a leading
+    parameter-grid axis fits many candidates in one pass.
+    """
+    sse = np.zeros(np.broadcast_shapes(np.shape(alpha), np.shape(beta), np.shape(level), y.shape[:-1]))
+    for t in range(y.shape[-1]):
+        error = y[..., t] - (level + trend)
+        sse = sse + error ** 2
+        level = level + trend + alpha * error
+        trend = trend + alpha * beta * error
+    return level, trend, sse, y.shape[-1]
+
+
+def fit_holt(y, alphas=ALPHAS, betas=BETAS):
+    """Fit every row of y (series x months) and keep the best parameters per series"""
+    series, months = y.shape
+    if months < 3:
+        raise ValueError("At least three months are needed to fit a trend")
+    grid_alpha, grid_beta = (a.ravel()[:, None] for a in np.meshgrid(alphas, betas, indexing="ij"))
+    level0, trend0 = y[:, 1], y[:, 1] - y[:, 0]
+
+    levels, trends, sse, n = _run(y[None, :, 2:], grid_alpha, grid_beta, level0[None, :], trend0[None, :])
+    best = np.argmin(sse, axis=0)
+    pick = (best, np.arange(series))
+    return HoltState(
+        alpha=grid_alpha[best, 0], beta=grid_beta[best, 0],
+        level=levels[pick], trend=trends[pick], sse=sse[pick],
+        n=np.full(series, n), months_since_fit=np.zeros(series, dtype=int),
+    )
+
+
+def update_holt(state, y_new):
+    """Advance fitted series by the new months in y_new (series x new months)"""
+    level, trend, sse, n = _run(y_new, state.alpha, state.beta, state.level, state.trend)
+    return HoltState(state.alpha, state.beta, level, trend, state.sse + sse, state.n + n,
+                     state.months_since_fit + n)
+
+
+def forecast_holt(state, horizon, z=Z):
+    """(mean, lower, upper), each series x horizon, never below zero"""
+    h = np.arange(1, horizon + 1)
+    mean = state.level[:, None] + h * state.trend[:, None]
+    sigma2 = state.sse / np.maximum(state.n - 2, 1)
+    # Variance of the h-step error of Holt's additive method
+    j = np.arange(1, horizon)
+    steps = (state.alpha[:, None, None] * (1 + j[None, None, :] * state.beta[:, None, None])) ** 2
+    steps = np.where(j[None, None, :] < h[None, :, None], steps, 0.0).sum(axis=2)
+    spread = z * np.sqrt(sigma2[:, None] * (1 + steps))
+    return np.maximum(mean, 0.0), np.maximum(mean - spread, 0.0), np.maximum(mean + spread, 0.0)
+
+
+def series_matrix(feature, keys):
+    """Pivot feature rows into (series keys, first-of-month dates, series x months array).
+
+    Months without sales are zero, and every month between the first and
+    the last month in the data is present.
+    """
+    months = pd.to_datetime(feature["FISCAL_YEAR_MONTH"])
+    grid = pd.date_range(months.min(), months.max(), freq="MS")
+    table = (feature.assign(FISCAL_YEAR_MONTH=months)
+             .groupby(list(keys) + ["FISCAL_YEAR_MONTH"])["TOTAL_NETAMOUNT"].sum()
+             .unstack("FISCAL_YEAR_MONTH")
+             .reindex(columns=grid, fill_value=0.0)
+             .fillna(0.0))
+    return table.index.to_frame(index=False), grid, table.to_numpy(dtype=float)
+
+
+def _combine(size, parts):
+    """One HoltState from (row mask, state of those rows) parts"""
+    combined = {}
+    for f in fields(HoltState):
+        values = np.zeros(size, dtype=int if f.name in ("n", "months_since_fit") else float)
+        for rows, state in parts:
+            values[rows] = getattr(state, f.name)
+        combined[f.name] = values
+    return HoltState(**combined)
+
+
+def _state_frame(series, state, fitted_through):
+    return series.assign(
+        ALPHA=state.alpha, BETA=state.beta, LEVEL=state.level, TREND=state.trend,
+        SSE=state.sse, N=state.n, MONTHS_SINCE_FIT=state.months_since_fit,
+        FITTED_THROUGH=pd.Timestamp(fitted_through).date(),
+    )
+
+
+def _state_from_frame(frame):
+    return HoltState(*(frame[c].to_numpy() for c in ("ALPHA", "BETA", "LEVEL", "TREND", "SSE", "N",
+                                                       "MONTHS_SINCE_FIT")))
+
+
+def forecast_series(feature, keys, horizon=3, previous_state=None, changed_months=None):
+    """Fit or update all series and forecast them.
+
+    previous_state is the state frame of an earlier run (or None);
+    changed_months are 'yyyy-MM' months that were rewritten since then, or
+    None if they are unknown, which refits every series.
+    Returns (forecast frame, state frame, {"fitted": n, "updated": n}).
+    """
+    series, grid, y = series_matrix(feature, keys)
+    keys = list(keys)
+    last = grid[-1]
+
+    state_rows = None
+    if previous_state is not None and len(previous_state):
+        fitted_through = pd.Timestamp(previous_state["FITTED_THROUGH"].iloc[0])
+        rewritten = changed_months is None or any(pd.Timestamp(f"{m}-01") <= fitted_through
+                                                  for m in changed_months)
+        if not rewritten and fitted_through <= last:
+            state_rows = series.merge(previous_state, on=keys, how="left")
+
+    parts = []
+    fit = np.ones(len(series), dtype=bool)
+    if state_rows is not None:
+        cached = (state_rows["ALPHA"].notna().to_numpy()
+                  & (state_rows["MONTHS_SINCE_FIT"].fillna(0).to_numpy() < REFIT_AFTER))
+        if cached.any():
+            previous = _state_from_frame(state_rows[cached])
+            parts.append((cached, update_holt(previous, y[cached][:, grid > fitted_through])))
+        fit = ~cached
+    if fit.any():
+        parts.append((fit, fit_holt(y[fit])))
+    state = _combine(len(series), parts)
+
+    mean, lower, upper = forecast_holt(state, horizon)
+    future = pd.date_range(last + pd.offsets.MonthBegin(1), periods=horizon, freq="MS")
+    forecast = series.loc[series.index.repeat(horizon)].reset_index(drop=True).assign(
+        FISCAL_YEAR_MONTH=np.tile(future.date, len(series)),
+        predicted_TOTAL_NETAMOUNT=mean.ravel(),
+        predicted_TOTAL_NETAMOUNT_lower=lower.ravel(),
+        predicted_TOTAL_NETAMOUNT_upper=upper.ravel(),
+        predicted_at=pd.Timestamp.now(tz="UTC").tz_localize(None),
+    )
+    return forecast, _state_frame(series, state, last), {"fitted": int(fit.sum()), "updated": int((~fit).sum())}
+
+
+def _rewritten_months(spark, namespace, state_table, versions):
+    """Months rewritten since the state was fitted, or None if they cannot be told"""
+    if versions is None or not spark.catalog.tableExists(state_table):
+        return None
+    recorded = recorded_versions(spark, state_table, tuple(versions), LAYOUT_VERSION)
+    if recorded is None:
+        return None
+    try:
+        return source_changed_months(spark, namespace, recorded, versions)
+    except Exception as e:
+        # e.g. change feed not enabled for the range, or old versions already vacuumed
+        print(f"Change feed unavailable ({e})")
+        return None
+
+
+def refresh_forecast(spark, namespace="workspace.default", grain="region", horizon=3, mode="incremental"):
+    """Forecast every series of a grain and overwrite its forecast and state tables.
+
+    In incremental mode the cached state is reused unless a month it was
+    fitted on has changed since the source versions recorded with it.
+    """
+    keys = GRAINS[grain]
+    feature_table = qualified(namespace, FEATURE_TABLE)
+    forecast_table = qualified(namespace, FORECAST_TABLE.format(grain=grain))
+    state_table = qualified(namespace, STATE_TABLE.format(grain=grain))
+
+    # Read before the rows: a refresh in between then only makes the next run refit more, never less
+    versions = recorded_versions(spark, feature_table)
+    feature = spark.sql(f"""
+    SELECT {', '.join(keys)}, FISCAL_YEAR_MONTH, SUM(TOTAL_NETAMOUNT) AS TOTAL_NETAMOUNT
+    FROM {feature_table}
+    WHERE FISCAL_YEAR_MONTH IS NOT NULL
+    GROUP BY {', '.join(keys)}, FISCAL_YEAR_MONTH
+    """).toPandas()
+
+    previous, rewritten = None, None
+    if mode == "incremental":
+        rewritten = _rewritten_months(spark, namespace, state_table, versions)
+    if rewritten is not None:
+        previous = spark.table(state_table).toPandas()
+
+    forecast, state, counts = forecast_series(feature, keys, horizon, previous, rewritten)
+    spark.createDataFrame(forecast).write.mode("overwrite").option("overwriteSchema", "true") \
+        .saveAsTable(forecast_table)
+    spark.createDataFrame(state).write.mode("overwrite").option("overwriteSchema", "true") \
+        .saveAsTable(state_table)
+    if versions is not None:
+        spark.sql(f"ALTER TABLE {state_table} SET TBLPROPERTIES ('{LAYOUT_PROPERTY}' = '{LAYOUT_VERSION}')")
+        record_versions(spark, state_table, versions)
+    else:
+        # Versions from an earlier run no longer describe this state
+        spark.sql(f"ALTER TABLE {state_table} UNSET TBLPROPERTIES IF EXISTS ('{LAYOUT_PROPERTY}')")
+    print(f"{forecast_table}: fitted {counts['fitted']:,} series, updated {counts['updated']:,}, "
+          f"{len(forecast):,} forecast rows")
+    return counts
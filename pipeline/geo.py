@@ -0,0 +1,234 @@
+"""Geographic sales queries over the address coordinates.
+
+GridIndex buckets points into cells of cell_deg x cell_deg degrees and
+keeps them sorted by cell number, so the points of a run of adjacent cells
+are one searchsorted slice. A radius query visits only the cells that can
+intersect the circle (its latitude band and, per row, the longitude span of
+the circle) and computes haversine distances for those candidates only.
+Nearest-neighbour queries widen a radius query until it holds k points.
+
+GeoSales attaches sales to the indexed addresses: order lines are summed
+per (ADDRESSID, month) through bronze_salesorders.PARTNERID and
+bronze_businesspartners.ADDRESSID, with the feature table's NETAMOUNT
+semantics. Radius, nearest and per-cell totals are then computed from
+those per-address sums.
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from pipeline.features import ITEMS_TABLE, ORDERS_TABLE, qualified
+
+ADDRESSES_TABLE = "bronze_addresses"
+PARTNERS_TABLE = "bronze_businesspartners"
+EARTH_RADIUS_KM = 6371.0088
+ADDRESS_COLUMNS = ["ADDRESSID", "CITY", "COUNTRY", "REGION", "LATITUDE", "LONGITUDE"]
+
+ADDRESS_SALES_SQL = """
+SELECT
+  bp.ADDRESSID
+  , trunc(so.CREATEDAT, 'MM') AS FISCAL_YEAR_MONTH
+  , COUNT(DISTINCT so.SALESORDERID) AS ORDERS
+  , SUM(soi.NETAMOUNT) AS TOTAL_NETAMOUNT
+FROM
+  {items} soi
+JOIN {orders} so
+  ON soi.SALESORDERID = so.SALESORDERID
+JOIN {partners} bp
+  ON so.PARTNERID = bp.PARTNERID
+WHERE bp.ADDRESSID IS NOT NULL
+GROUP BY bp.ADDRESSID, trunc(so.CREATEDAT, 'MM')
+"""
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km; arguments in degrees, broadcast like numpy"""
+    lat1, lon1, lat2, lon2 = (np.radians(v) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+class GridIndex:
+    """Points bucketed in a regular latitude/longitude grid, sorted by cell"""
+
+    def __init__(self, lat, lon, cell_deg=1.0):
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        # Points without coordinates are not indexed
+        self.ids = np.flatnonzero(~(np.isnan(lat) | np.isnan(lon)))
+        self.cell_deg = cell_deg
+        self.rows = int(np.ceil(180 / cell_deg))
+        self.columns = int(np.ceil(360 / cell_deg))
+
+        cells = self.cell_of(lat[self.ids], lon[self.ids])
+        order = np.argsort(cells, kind="stable")
+        self.cells = cells[order]
+        self.ids = self.ids[order]
+        self.lat = lat[self.ids]
+        self.lon = lon[self.ids]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _row(self, lat):
+        return np.clip(np.floor((lat + 90) / self.cell_deg).astype(np.int64), 0, self.rows - 1)
+
+    def _column(self, lon):
+        return np.floor((np.asarray(lon) + 180) / self.cell_deg).astype(np.int64) % self.columns
+
+    def cell_of(self, lat, lon):
+        return self._row(lat) * self.columns + self._column(lon)
+
+    def cell_corner(self, cells):
+        """South-west corner (lat, lon) of each cell number"""
+        cells = np.asarray(cells)
+        return cells // self.columns * self.cell_deg - 90, cells % self.columns * self.cell_deg - 180
+
+    def _cell_ranges(self, lat, lon, radius_km):
+        """Inclusive (first cell, last cell) runs covering a circle"""
+        angle = radius_km / EARTH_RADIUS_KM
+        dlat = np.degrees(angle)
+        first_row, last_row = self._row(lat - dlat), self._row(lat + dlat)
+        if abs(lat) + dlat >= 90 or angle >= np.pi / 2:
+            # The circle reaches a pole: every longitude is within reach
+            dlon = 180.0
+        else:
+            dlon = np.degrees(np.arcsin(np.sin(angle) / np.cos(np.radians(lat))))
+        if dlon >= 180:
+            spans = [(0, self.columns - 1)]
+        else:
+            first, last = self._column(lon - dlon), self._column(lon + dlon)
+            spans = [(first, last)] if first <= last else [(first, self.columns - 1), (0, last)]
+        return [(row * self.columns + c0, row * self.columns + c1)
+                for row in range(first_row, last_row + 1) for c0, c1 in spans]
+
+    def within(self, lat, lon, radius_km):
+        """(point ids, distances in km) within radius_km of (lat, lon), nearest first"""
+        ranges = np.array(self._cell_ranges(lat, lon, radius_km))
+        low = np.searchsorted(self.cells, ranges[:, 0], side="left")
+        high = np.searchsorted(self.cells, ranges[:, 1], side="right")
+        candidates = np.concatenate([np.arange(lo, hi) for lo, hi in zip(low, high)] or [np.empty(0, int)])
+        distances = haversine_km(lat, lon, self.lat[candidates], self.lon[candidates])
+        keep = distances <= radius_km
+        candidates, distances = candidates[keep], distances[keep]
+        order = np.argsort(distances, kind="stable")
+        return self.ids[candidates[order]], distances[order]
+
+    def nearest(self, lat, lon, k=1):
+        """(point ids, distances in km) of the k points closest to (lat, lon)"""
+        k = min(k, len(self))
+        radius = self.cell_deg * np.pi / 180 * EARTH_RADIUS_KM
+        while True:
+            ids, distances = self.within(lat, lon, radius)
+            # Every point closer than radius is in the result, so the first k are exact
+            if len(ids) >= k or radius >= np.pi * EARTH_RADIUS_KM:
+                return ids[:k], distances[:k]
+            radius *= 2
+
+
+class GeoSales:
+    """Addresses with their monthly sales, indexed by location"""
+
+    def __init__(self, addresses, address_sales, cell_deg=1.0):
+        self.addresses = addresses[ADDRESS_COLUMNS].reset_index(drop=True)
+        self.index = GridIndex(self.addresses["LATITUDE"].to_numpy(dtype=float),
+                               self.addresses["LONGITUDE"].to_numpy(dtype=float), cell_deg)
+
+        # Sales rows point at their address row, so per-address sums are one bincount
+        position = pd.Series(np.arange(len(self.addresses)), index=self.addresses["ADDRESSID"])
+        sales = address_sales[address_sales["ADDRESSID"].isin(position.index)]
+        self._address = position.loc[sales["ADDRESSID"]].to_numpy()
+        self._month = pd.to_datetime(sales["FISCAL_YEAR_MONTH"]).dt.strftime("%Y-%m").to_numpy(dtype=object)
+        self._orders = sales["ORDERS"].to_numpy(dtype=np.int64)
+        self._amount = sales["TOTAL_NETAMOUNT"].fillna(0.0).to_numpy(dtype=np.float64)
+
+    def _per_address(self, start_month=None, end_month=None):
+        """(orders, amount) per address row over an optional 'yyyy-MM' range"""
+        rows = np.ones(len(self._month), dtype=bool)
+        if start_month is not None:
+            rows &= self._month >= start_month
+        if end_month is not None:
+            rows &= self._month <= end_month
+        size = len(self.addresses)
+        return (np.bincount(self._address[rows], self._orders[rows], size).astype(np.int64),
+                np.bincount(self._address[rows], self._amount[rows], size))
+
+    def _with_sales(self, ids, distances, start_month, end_month):
+        orders, amount = self._per_address(start_month, end_month)
+        return self.addresses.iloc[ids].assign(
+            DISTANCE_KM=distances, ORDERS=orders[ids], TOTAL_NETAMOUNT=amount[ids]).reset_index(drop=True)
+
+    def within(self, lat, lon, radius_km, start_month=None, end_month=None):
+        """Addresses within radius_km with their sales, nearest first"""
+        return self._with_sales(*self.index.within(lat, lon, radius_km), start_month, end_month)
+
+    def nearest(self, lat, lon, k=5, start_month=None, end_month=None):
+        """The k closest addresses with their sales"""
+        return self._with_sales(*self.index.nearest(lat, lon, k), start_month, end_month)
+
+    def sales_by_cell(self, start_month=None, end_month=None):
+        """Addresses, orders and TOTAL_NETAMOUNT per grid cell that has addresses"""
+        orders, amount = self._per_address(start_month, end_month)
+        index = self.index
+        cells, first = np.unique(index.cells, return_index=True)
+        ends = np.append(first[1:], len(index.cells))
+        corner_lat, corner_lon = index.cell_corner(cells)
+        return pd.DataFrame({
+            "CELL": cells,
+            "CELL_LATITUDE": corner_lat,
+            "CELL_LONGITUDE": corner_lon,
+            "ADDRESSES": ends - first,
+            # Points are sorted by cell, so per-cell sums are reduceat over the sorted order
+            "ORDERS": np.add.reduceat(orders[index.ids], first) if len(cells) else [],
+            "TOTAL_NETAMOUNT": np.add.reduceat(amount[index.ids], first) if len(cells) else [],
+        })
+
+
+def spark_geo_sales(spark, namespace="workspace.default", cell_deg=1.0):
+    """GeoSales from the bronze tables; the join and aggregation run in Spark"""
+    addresses = spark.table(qualified(namespace, ADDRESSES_TABLE)).select(*ADDRESS_COLUMNS).toPandas()
+    address_sales = spark.sql(ADDRESS_SALES_SQL.format(
+        items=qualified(namespace, ITEMS_TABLE),
+        orders=qualified(namespace, ORDERS_TABLE),
+        partners=qualified(namespace, PARTNERS_TABLE),
+    )).toPandas()
+    return GeoSales(addresses, address_sales, cell_deg)
+
+
+def local_geo_sales(engine, cell_deg=1.0):
+    """GeoSales from a LocalEngine, with the same join and aggregation in pyarrow"""
+    orders = engine.arrow_table(ORDERS_TABLE, ["SALESORDERID", "PARTNERID", "CREATEDAT"])
+    items = engine.arrow_table(ITEMS_TABLE, ["SALESORDERID", "NETAMOUNT"])
+    partners = engine.arrow_table(PARTNERS_TABLE, ["PARTNERID", "ADDRESSID"])
+    lines = (items.join(orders, "SALESORDERID", join_type="inner")
+             .join(partners, "PARTNERID", join_type="inner")
+             .to_pandas())
+    lines = lines[lines["ADDRESSID"].notna()]
+    lines["FISCAL_YEAR_MONTH"] = pd.to_datetime(lines["CREATEDAT"]).dt.to_period("M").dt.to_timestamp()
+    address_sales = (lines.groupby(["ADDRESSID", "FISCAL_YEAR_MONTH"])
+                     .agg(ORDERS=("SALESORDERID", "nunique"), TOTAL_NETAMOUNT=("NETAMOUNT", "sum"))
+                     .reset_index())
+    return GeoSales(engine.table(ADDRESSES_TABLE), address_sales, cell_deg)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sales of the addresses around a point")
+    parser.add_argument("latitude", type=float)
+    parser.add_argument("longitude", type=float)
+    parser.add_argument("--radius-km", type=float, default=50.0)
+    parser.add_argument("--nearest", type=int, default=5, help="also list this many closest addresses")
+    parser.add_argument("--data-dir", default="data")
+    args = parser.parse_args(argv)
+
+    from pipeline.engine import LocalEngine
+    geo = local_geo_sales(LocalEngine(args.data_dir))
+    around = geo.within(args.latitude, args.longitude, args.radius_km)
+    print(around.to_string(index=False))
+    print(f"{len(around)} addresses within {args.radius_km:g} km: {around['ORDERS'].sum():,} orders, "
+          f"{around['TOTAL_NETAMOUNT'].sum():,.2f} net")
+    print(geo.nearest(args.latitude, args.longitude, args.nearest).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
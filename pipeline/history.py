@@ -0,0 +1,281 @@
+"""Point-in-time history of the business partner, product and employee tables.
+
+Every load overwrites or merges the bronze tables, so their earlier values
+are lost. capture_history keeps a type 2 slowly changing dimension next to
+each of them ({table}_history). Each version of a row is stored with
+VALID_FROM / VALID_TO (exclusive) dates and IS_CURRENT. The bronze table's
+Delta versions are replayed in order since the last capture, so several
+loads between two captures are all kept. A changed row is closed and
+its new version inserted in one MERGE.
+
+A new version takes effect at its CHANGEDAT (VALIDITY_STARTDATE for
+employees) when that is later than the previous version and not after
+the load; otherwise at the load date. The first captured version of a
+key is also valid before it, back to MIN_DATE, since nothing older is
+known; a key that reappears after a deletion starts at the load date.
+
+as_of_join pairs fact rows with the version valid at their date without a
+range join. Facts and versions are merged into one stream per key, sorted
+by date, and each fact takes the last version before it (last() over a
+window). as_of_indices does the same locally with one searchsorted over
+the versions sorted by (key, VALID_FROM).
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from pipeline.delta import table_version
+from pipeline.features import LAYOUT_PROPERTY, qualified, record_versions, recorded_versions
+from pipeline.schemas import TABLES
+
+HISTORY_TABLE = "{table}_history"
+LAYOUT_VERSION = "1"
+MIN_DATE = "0001-01-01"
+MAX_DATE = "9999-12-31"
+HISTORY_COLUMNS = ("VALID_FROM", "VALID_TO", "IS_CURRENT", "ROW_HASH", "LOADED_VERSION")
+
+# Operations in DESCRIBE HISTORY that change a table's rows
+DATA_OPERATIONS = (
+    "WRITE", "CREATE TABLE AS SELECT", "REPLACE TABLE AS SELECT", "CREATE OR REPLACE TABLE AS SELECT",
+    "MERGE", "UPDATE", "DELETE", "TRUNCATE", "STREAMING UPDATE",
+)
+
+
+@dataclass(frozen=True)
+class Dimension:
+    table: str
+    key: str
+    effective_column: str
+
+    @property
+    def history_table(self):
+        return HISTORY_TABLE.format(table=self.table)
+
+    @property
+    def columns(self):
+        return [c.name for c in TABLES[self.table].table_columns]
+
+
+DIMENSIONS = {d.table: d for d in [
+    Dimension("bronze_businesspartners", "PARTNERID", "CHANGEDAT"),
+    Dimension("bronze_products", "PRODUCTID", "CHANGEDAT"),
+    Dimension("bronze_employees", "EMPLOYEEID", "VALIDITY_STARTDATE"),
+]}
+
+
+def _snapshot_select(namespace, dimension, version):
+    """Bronze rows at a version with a hash of all their values"""
+    columns = ", ".join(f"`{c}`" for c in dimension.columns)
+    return f"""
+    SELECT {columns}, sha2(to_json(struct({columns})), 256) AS ROW_HASH
+    FROM {qualified(namespace, dimension.table)} VERSION AS OF {version}
+    """
+
+
+def _create_history(spark, namespace, dimension, version):
+    history = qualified(namespace, dimension.history_table)
+    spark.sql(f"""
+    CREATE OR REPLACE TABLE {history}
+    CLUSTER BY ({dimension.key}, VALID_FROM)
+    TBLPROPERTIES ('{LAYOUT_PROPERTY}' = '{LAYOUT_VERSION}')
+    AS SELECT
+      s.* EXCEPT (ROW_HASH)
+      , DATE'{MIN_DATE}' AS VALID_FROM
+      , DATE'{MAX_DATE}' AS VALID_TO
+      , true AS IS_CURRENT
+      , s.ROW_HASH
+      , CAST({version} AS BIGINT) AS LOADED_VERSION
+    FROM ({_snapshot_select(namespace, dimension, version)}) s
+    """)
+    record_versions(spark, history, {dimension.table: version})
+
+
+def merge_snapshot(spark, namespace, dimension, version, loaded_on):
+    """Close changed and deleted rows and insert their new versions, in one MERGE"""
+    history = qualified(namespace, dimension.history_table)
+    key, effective = dimension.key, dimension.effective_column
+    columns = ", ".join(f"`{c}`" for c in dimension.columns)
+    loaded = f"DATE'{loaded_on}'"
+
+    spark.sql(f"""
+    WITH snapshot AS ({_snapshot_select(namespace, dimension, version)}),
+    current AS (SELECT * FROM {history} WHERE IS_CURRENT),
+    known AS (SELECT DISTINCT {key} FROM {history}),
+    changes AS (
+      SELECT
+        s.*
+        , CASE
+            WHEN k.{key} IS NULL THEN DATE'{MIN_DATE}'
+            -- A key that comes back after being deleted
+            WHEN c.{key} IS NULL THEN {loaded}
+            WHEN s.{effective} > c.VALID_FROM AND s.{effective} <= {loaded} THEN s.{effective}
+            ELSE greatest({loaded}, c.VALID_FROM)
+          END AS _valid_from
+        , c.{key} IS NOT NULL AS _has_previous
+      FROM snapshot s
+      LEFT JOIN current c ON s.{key} = c.{key}
+      LEFT JOIN known k ON s.{key} = k.{key}
+      WHERE c.{key} IS NULL OR c.ROW_HASH <> s.ROW_HASH
+    )
+    MERGE INTO {history} t
+    USING (
+      -- Close the current version of changed keys
+      SELECT {key} AS _merge_key, _valid_from AS _close_on, {columns}, ROW_HASH, _valid_from
+      FROM changes WHERE _has_previous
+      UNION ALL
+      -- New versions never match, so they are inserted
+      SELECT NULL AS _merge_key, NULL AS _close_on, {columns}, ROW_HASH, _valid_from
+      FROM changes
+      UNION ALL
+      -- Keys gone from the table are closed at the load date
+      SELECT c.{key} AS _merge_key, greatest({loaded}, c.VALID_FROM) AS _close_on, {columns}, c.ROW_HASH,
+        NULL AS _valid_from
+      FROM current c LEFT ANTI JOIN snapshot s ON c.{key} = s.{key}
+    ) s
+    ON t.{key} = s._merge_key AND t.IS_CURRENT
+    WHEN MATCHED THEN UPDATE SET VALID_TO = s._close_on, IS_CURRENT = false
+    WHEN NOT MATCHED AND s._merge_key IS NULL THEN INSERT ({columns}, {', '.join(HISTORY_COLUMNS)})
+      VALUES ({', '.join(f's.`{c}`' for c in dimension.columns)}, s._valid_from, DATE'{MAX_DATE}', true,
+              s.ROW_HASH, CAST({version} AS BIGINT))
+    """)
+
+
+def data_versions(spark, table, after):
+    """(version, commit date) of the commits after a version that changed rows, oldest first"""
+    operations = ", ".join(f"'{o}'" for o in DATA_OPERATIONS)
+    rows = spark.sql(f"DESCRIBE HISTORY {table}").where(
+        f"version > {after} AND operation IN ({operations})"
+    ).selectExpr("version", "CAST(timestamp AS DATE) AS loaded_on").orderBy("version").collect()
+    return [(row["version"], row["loaded_on"]) for row in rows]
+
+
+def capture_history(spark, namespace="workspace.default", dimension="bronze_businesspartners"):
+    """Record the bronze versions loaded since the last capture; returns how many were applied"""
+    dimension = DIMENSIONS[dimension] if isinstance(dimension, str) else dimension
+    source = qualified(namespace, dimension.table)
+    history = qualified(namespace, dimension.history_table)
+    current = table_version(spark, source)
+
+    if not spark.catalog.tableExists(history):
+        print(f"Creating {history} from version {current} of {source}")
+        _create_history(spark, namespace, dimension, current)
+        return 1
+    recorded = recorded_versions(spark, history, (dimension.table,), LAYOUT_VERSION)
+    if recorded is None:
+        # Rebuilding would throw away the recorded history, so leave that decision to the caller
+        raise ValueError(f"{history} has another layout or no recorded source version; drop it to rebuild")
+    if recorded[dimension.table] == current:
+        print(f"{history} is up to date")
+        return 0
+
+    versions = data_versions(spark, source, recorded[dimension.table])
+    for version, loaded_on in versions:
+        merge_snapshot(spark, namespace, dimension, version, loaded_on)
+    record_versions(spark, history, {dimension.table: current})
+    print(f"Captured {len(versions)} versions of {source} into {history}")
+    return len(versions)
+
+
+def capture_all_history(spark, namespace="workspace.default", tables=None):
+    """capture_history for every dimension (or those in tables); returns {table: versions applied}"""
+    return {table: capture_history(spark, namespace, dimension)
+            for table, dimension in DIMENSIONS.items() if tables is None or table in tables}
+
+
+def as_of_join(spark, facts, dimension, namespace="workspace.default", fact_key=None, at="CREATEDAT",
+               columns=None, prefix=None):
+    """facts (a DataFrame) with the dimension columns valid at each row's `at` date.
+
+    Rows without a matching version get nulls. Dimension columns are
+    prefixed with prefix (default: the table name without "bronze_" plus
+    "_") so they cannot collide with fact columns.
+    """
+    from pyspark.sql import Window
+    from pyspark.sql import functions as F
+
+    dimension = DIMENSIONS[dimension] if isinstance(dimension, str) else dimension
+    fact_key = fact_key or dimension.key
+    columns = columns or [c for c in dimension.columns if c != dimension.key]
+    prefix = prefix if prefix is not None else dimension.table.removeprefix("bronze_").upper() + "_"
+
+    versions = spark.table(qualified(namespace, dimension.history_table)).select(
+        F.col(dimension.key).alias("_key"),
+        F.col("VALID_FROM").alias("_at"),
+        F.lit(0).alias("_kind"),
+        F.col("LOADED_VERSION").alias("_order"),
+        F.struct(*columns, "VALID_TO").alias("_version"),
+    )
+    events = facts.select(
+        F.col(fact_key).alias("_key"),
+        F.col(at).cast("date").alias("_at"),
+        F.lit(1).alias("_kind"),
+        F.lit(None).cast("bigint").alias("_order"),
+        F.struct(*facts.columns).alias("_fact"),
+    )
+    # Versions sort before facts on the same date, so a version starting that day applies to them
+    window = (Window.partitionBy("_key").orderBy("_at", "_kind", "_order")
+              .rowsBetween(Window.unboundedPreceding, Window.currentRow))
+    joined = (versions.unionByName(events, allowMissingColumns=True)
+              .withColumn("_valid", F.last("_version", ignorenulls=True).over(window))
+              .where("_kind = 1"))
+    # A version closed before the fact (e.g. a deleted key) does not apply
+    valid = F.col("_at").isNotNull() & (F.col("_valid.VALID_TO") > F.col("_at"))
+    return joined.select(
+        "_fact.*",
+        *[F.when(valid, F.col(f"_valid.{c}")).alias(f"{prefix}{c}") for c in columns],
+    )
+
+
+def as_of_indices(fact_keys, fact_dates, version_keys, valid_from, valid_to, order=None):
+    """Index of the version valid for each fact, -1 where there is none.
+
+    Keys may be any hashable values and dates anything numpy converts to
+    datetime64[D]. order breaks ties between versions starting on the same
+    date; the latest one wins.
+    """
+    codes, uniques = pd.factorize(pd.Series(version_keys))
+    fact_codes = pd.Index(uniques).get_indexer(pd.Series(fact_keys))
+    valid_from = np.asarray(valid_from, dtype="datetime64[D]").astype(np.int64)
+    valid_to = np.asarray(valid_to, dtype="datetime64[D]").astype(np.int64)
+    fact_days = np.asarray(fact_dates, dtype="datetime64[D]")
+    usable = (fact_codes >= 0) & ~np.isnat(fact_days)
+    fact_days = fact_days.astype(np.int64)
+    if not len(codes) or not usable.any():
+        return np.full(len(fact_codes), -1, dtype=np.int64)
+
+    # Key code and day packed into one sortable integer, as in pipeline.query
+    first = min(valid_from.min(), fact_days[usable].min())
+    span = max(valid_from.max(), fact_days[usable].max()) - first + 1
+    composite = codes * span + (valid_from - first)
+    sorted_rows = np.lexsort((np.asarray(order), composite)) if order is not None else \
+        np.argsort(composite, kind="stable")
+    sorted_composite = composite[sorted_rows]
+
+    # Last version of the fact's key starting on or before the fact's date
+    targets = np.where(usable, fact_codes * span + (fact_days - first), -1)
+    position = np.searchsorted(sorted_composite, targets, side="right") - 1
+    found = usable & (position >= 0)
+    result = np.full(len(fact_codes), -1, dtype=np.int64)
+    result[found] = sorted_rows[position[found]]
+    # The version must belong to the fact's key and still be open at its date
+    hit = np.maximum(result, 0)
+    result[(result >= 0) & ((codes[hit] != fact_codes) | (valid_to[hit] <= fact_days))] = -1
+    return result
+
+
+def as_of_join_local(facts, history, dimension, fact_key=None, at="CREATEDAT", columns=None, prefix=None):
+    """as_of_join for pandas frames: facts with the history columns valid at each row's date"""
+    dimension = DIMENSIONS[dimension] if isinstance(dimension, str) else dimension
+    fact_key = fact_key or dimension.key
+    columns = columns or [c for c in dimension.columns if c != dimension.key]
+    prefix = prefix if prefix is not None else dimension.table.removeprefix("bronze_").upper() + "_"
+
+    # The MIN_DATE / MAX_DATE bounds are outside the datetime64[ns] range of pandas 2,
+    # so the history dates go to as_of_indices as they are and become datetime64[D] there
+    index = as_of_indices(facts[fact_key], pd.to_datetime(facts[at]), history[dimension.key],
+                          history["VALID_FROM"], history["VALID_TO"],
+                          history["LOADED_VERSION"] if "LOADED_VERSION" in history else None)
+    matched = history[columns].iloc[np.maximum(index, 0)].reset_index(drop=True)
+    matched = matched.mask(np.repeat((index < 0)[:, None], len(columns), axis=1))
+    return pd.concat([facts.reset_index(drop=True), matched.add_prefix(prefix)], axis=1)
@@ -0,0 +1,156 @@
+"""Reading the source CSV files into typed Spark DataFrames and bronze tables."""
+from dataclasses import dataclass
+
+from pyspark.sql import Window
+from pyspark.sql import functions as F
+
+from pipeline.delta import get_table_property, last_commit_metrics, set_table_properties
+from pipeline.fetch import file_fingerprint
+
+# Table property recording the fingerprint of the source file last loaded into the table
+SOURCE_FINGERPRINT_PROPERTY = "pipeline.source.sha256"
+
+# Source file columns added to rows read together with extracts, used to pick the newest row per key
+FILE_TIME_COLUMN = "_file_modification_time"
+FILE_NAME_COLUMN = "_file_name"
+
+
+def _loaded_properties(fingerprint):
+    # The change feed lets downstream tables refresh only what changed
+    return {SOURCE_FINGERPRINT_PROPERTY: fingerprint, "delta.enableChangeDataFeed": "true"}
+
+
+@dataclass
+class IngestResult:
+    """Outcome of loading one source file into its bronze table"""
+    table: str
+    mode: str  # overwritten / created / merged / skipped
+    inserted: int = 0
+    updated: int = 0
+    deleted: int = 0
+    rows: int = 0
+    bytes: int = 0
+    files: int = 0
+
+
+def extract_pattern(table_schema):
+    """File name pattern of a table's source file and its extracts (SalesOrders.csv -> SalesOrders*.csv)"""
+    stem, extension = table_schema.source_file.rsplit(".", 1)
+    return f"{stem}*.{extension}"
+
+
+def with_file_columns(df):
+    return df.select("*",
+                     F.col("_metadata.file_modification_time").alias(FILE_TIME_COLUMN),
+                     F.col("_metadata.file_name").alias(FILE_NAME_COLUMN))
+
+
+def latest_per_key(df, key, first=None):
+    """One row per key: the one from the most recently modified file (file name breaks ties).
+
+    first is an optional boolean column; rows where it is true win over all others.
+    """
+    order = [F.col(FILE_TIME_COLUMN).desc(), F.col(FILE_NAME_COLUMN).desc()]
+    if first is not None:
+        order.insert(0, first.desc())
+    newest_first = Window.partitionBy(*key).orderBy(*order)
+    return (df.withColumn("_rank", F.row_number().over(newest_first))
+            .where(F.col("_rank") == 1)
+            .drop("_rank"))
+
+
+def read_csv(spark, csv_path, table_schema, extracts=False):
+    """Read a CSV file with its registered schema in a single pass.
+
+    With extracts, the extracts lying next to the file (the ones the
+    streams in pipeline.streaming ingest) are read in the same pass and
+    replace the file's rows by key, so a batch load keeps streamed rows.
+    """
+    # Read CSV with Spark, explicitly set encoding to UTF-8 to avoid mojibake
+    reader = (spark.read
+              .schema(table_schema.raw_ddl())
+              .option("header", "true")
+              .option("encoding", "UTF-8"))
+    if not extracts:
+        return typed_columns(reader.csv(csv_path), table_schema)
+
+    directory, filename = csv_path.rsplit("/", 1)
+    df = with_file_columns(reader.option("pathGlobFilter", extract_pattern(table_schema)).csv(directory))
+    df = latest_per_key(df, table_schema.key, first=F.col(FILE_NAME_COLUMN) != filename)
+    return typed_columns(df, table_schema)
+
+
+def typed_columns(df, table_schema):
+    """Project raw CSV columns onto the table columns, parsing dates"""
+    # Parse yyyyMMdd text into DATE; invalid dates become NULL, a column's open_end marker 9999-12-31
+    return df.select([
+        F.expr(c.date_sql()).alias(c.name) if c.type == "date" else F.col(c.name)
+        for c in table_schema.table_columns
+    ])
+
+
+def merge_into_table(spark, df, table_schema, delete_missing=True):
+    """Upsert df into the bronze table by its key, touching only changed rows"""
+    table = table_schema.table
+    key = table_schema.key
+    target_columns = spark.table(table).columns
+    values = [c for c in target_columns if c not in key]
+
+    source_view = f"_merge_source_{table}"
+    df.createOrReplaceTempView(source_view)
+
+    on = " AND ".join(f"t.`{c}` = s.`{c}`" for c in key)
+    unchanged = " AND ".join(f"t.`{c}` <=> s.`{c}`" for c in values) or "TRUE"
+    update_set = ", ".join(f"`{c}` = s.`{c}`" for c in values)
+    insert_columns = ", ".join(f"`{c}`" for c in target_columns)
+    insert_values = ", ".join(f"s.`{c}`" for c in target_columns)
+
+    statement = f"""
+    MERGE INTO {table} AS t
+    USING {source_view} AS s
+    ON {on}
+    """
+    if values:
+        statement += f"WHEN MATCHED AND NOT ({unchanged}) THEN UPDATE SET {update_set}\n"
+    statement += f"WHEN NOT MATCHED THEN INSERT ({insert_columns}) VALUES ({insert_values})\n"
+    if delete_missing:
+        # The source file is a full snapshot, so keys missing from it were deleted upstream
+        statement += "WHEN NOT MATCHED BY SOURCE THEN DELETE\n"
+
+    metrics = spark.sql(statement).first()
+    return IngestResult(
+        table, "merged",
+        inserted=metrics["num_inserted_rows"],
+        updated=metrics["num_updated_rows"],
+        deleted=metrics["num_deleted_rows"],
+        **last_commit_metrics(spark, table),
+    )
+
+
+def ingest_csv_overwrite(spark, csv_path, table_schema, extracts=False):
+    """Replace the bronze table with the CSV contents, without any extra Spark actions"""
+    table = table_schema.table
+    read_csv(spark, csv_path, table_schema, extracts).write.mode("overwrite").saveAsTable(table)
+    metrics = last_commit_metrics(spark, table)
+    set_table_properties(spark, table, _loaded_properties(file_fingerprint(csv_path)))
+    return IngestResult(table, "overwritten", inserted=metrics["rows"], **metrics)
+
+
+def ingest_csv_incremental(spark, csv_path, table_schema, delete_missing=True, extracts=False):
+    """Load a CSV into its bronze table, skipping unchanged files and merging changed ones"""
+    table = table_schema.table
+    fingerprint = file_fingerprint(csv_path)
+
+    if get_table_property(spark, table, SOURCE_FINGERPRINT_PROPERTY) == fingerprint:
+        return IngestResult(table, "skipped")
+
+    df = read_csv(spark, csv_path, table_schema, extracts)
+    if spark.catalog.tableExists(table):
+        result = merge_into_table(spark, df, table_schema, delete_missing)
+    else:
+        df.write.mode("overwrite").saveAsTable(table)
+        metrics = last_commit_metrics(spark, table)
+        result = IngestResult(table, "created", inserted=metrics["rows"], **metrics)
+
+    set_table_properties(spark, table, _loaded_properties(fingerprint))
+    return result
@@ -0,0 +1,200 @@
+"""Checks that the data satisfies the declared keys.
+
+Primary keys and foreign keys are declared RELY, so Databricks trusts them
+(e.g. to eliminate joins) without ever enforcing them. These checks verify
+them against the data: key uniqueness and non-null key columns for every
+primary/unique key in the registry, and every FOREIGN_KEYS edge with an
+anti-join.
+
+check_integrity runs everything as a single Spark query that reads each
+table once. Every row of a table emits one (constraint, key) entry per
+check it takes part in, as the checked row or as a referenced parent key,
+and a single aggregation over all entries finds duplicates, NULL keys and
+keys without a parent. Spark inlines CTEs, so sharing a projection between
+per-check subqueries would scan the table once per check.
+check_integrity_local does the same checks with pyarrow on a LocalEngine.
+"""
+import json
+from dataclasses import dataclass, field
+from functools import reduce
+
+import pyarrow.compute as pc
+
+from pipeline.schemas import FOREIGN_KEYS, TABLES
+
+
+@dataclass
+class Violation:
+    """Rows breaking one constraint, with a few offending keys"""
+    constraint: str
+    kind: str  # primary_key / unique_key / not_null / foreign_key
+    table: str
+    columns: tuple
+    count: int = 0
+    samples: list = field(default_factory=list)
+
+
+@dataclass(frozen=True)
+class _Check:
+    constraint: str
+    kind: str
+    table: str
+    columns: tuple
+    ref_table: str = None
+    ref_columns: tuple = ()
+
+
+def integrity_checks(tables=None):
+    """Checks for the registry's keys and foreign keys, limited to tables that are present"""
+    tables = set(tables if tables is not None else TABLES)
+    checks = []
+    for table_schema in TABLES.values():
+        if table_schema.table not in tables or not table_schema.key:
+            continue
+        kind = "primary_key" if table_schema.primary_key else "unique_key"
+        name = f"{'pk' if table_schema.primary_key else 'uk'}_{table_schema.table}"
+        checks.append(_Check(name, kind, table_schema.table, table_schema.key))
+        checks.append(_Check(f"{name}_not_null", "not_null", table_schema.table, table_schema.key))
+    for fk in FOREIGN_KEYS:
+        if fk.table in tables and fk.ref_table in tables:
+            checks.append(_Check(fk.name, "foreign_key", fk.table, fk.columns, fk.ref_table, fk.ref_columns))
+    return checks
+
+
+def _projections(checks):
+    """Columns each table must provide for all checks it takes part in"""
+    columns = {}
+    for check in checks:
+        columns.setdefault(check.table, set()).update(check.columns)
+        if check.ref_table:
+            columns.setdefault(check.ref_table, set()).update(check.ref_columns)
+    # Keep the registry's column order so projections are stable
+    return {t: [c.name for c in TABLES[t].table_columns if c.name in cols] for t, cols in columns.items()}
+
+
+def _violations(checks, found):
+    """One Violation per check, in check order, filled from {constraint: (count, samples)}"""
+    return [Violation(c.constraint, c.kind, c.table, c.columns, *found.get(c.constraint, (0, [])))
+            for c in checks]
+
+
+def _key_json(names, values):
+    pairs = ", ".join(f"'{n}', {v}" for n, v in zip(names, values))
+    return f"to_json(named_struct({pairs}), map('ignoreNullFields', 'false'))"
+
+
+def _entry(check, child):
+    """named_struct of one check entry for a row of the checked (child) or referenced table"""
+    if child:
+        values = [f"`{c}`" for c in check.columns]
+    else:
+        # Parent keys take the child's column names and types so both sides compare equal
+        types = {c.name: c.type for c in TABLES[check.table].columns}
+        values = [f"CAST(`{r}` AS {types[c]})" for c, r in zip(check.columns, check.ref_columns)]
+    has_null = " OR ".join(f"{v} IS NULL" for v in values)
+    return (f"named_struct('constraint', '{check.constraint}', 'kind', '{check.kind}', 'child', {str(child).lower()}, "
+            f"'key', {_key_json(check.columns, values)}, 'has_null', {has_null})")
+
+
+def _entries_sql(table, checks, namespace=None):
+    """One scan of a table emitting an entry per row and check involving the table"""
+    entries = [_entry(c, True) for c in checks if c.table == table]
+    entries += [_entry(c, False) for c in checks if c.ref_table == table]
+    source = f"{namespace}.{table}" if namespace else table
+    entries = ",\n        ".join(entries)
+    return f"SELECT inline(array(\n        {entries}\n      )) FROM {source}"
+
+
+def integrity_sql(checks, namespace=None, sample_size=5):
+    """Single query returning (constraint, violations, key) rows, up to sample_size keys per constraint"""
+    tables = list(_projections(checks))
+    entries = "\n      UNION ALL\n      ".join(_entries_sql(t, checks, namespace) for t in tables)
+    return f"""
+    WITH
+    entries AS (
+      {entries}
+    ),
+    keys AS (
+      SELECT
+        constraint
+        , kind
+        , key
+        , count_if(child) AS n
+        , bool_or(child AND has_null) AS has_null
+        , bool_or(NOT child AND NOT has_null) AS referenced
+      FROM entries
+      GROUP BY constraint, kind, key
+    ),
+    violations AS (
+      -- A duplicated key counts once, NULL keys and orphans count every row.
+      -- A NULL foreign key references nothing and is not a violation
+      SELECT constraint, key, CASE WHEN kind IN ('primary_key', 'unique_key') THEN 1 ELSE n END AS n
+      FROM keys
+      WHERE CASE kind
+        WHEN 'not_null' THEN has_null
+        WHEN 'foreign_key' THEN n > 0 AND NOT has_null AND NOT referenced
+        ELSE n > 1 AND NOT has_null
+      END
+    ),
+    ranked AS (
+      SELECT
+        constraint
+        , key
+        , sum(n) OVER (PARTITION BY constraint) AS violations
+        , row_number() OVER (PARTITION BY constraint ORDER BY key) AS rn
+      FROM violations
+    )
+    SELECT constraint, violations, key FROM ranked WHERE rn <= {sample_size}
+    """
+
+
+def check_integrity(spark, namespace=None, tables=None, sample_size=5):
+    """Verify keys and foreign keys of the bronze tables in one Spark query"""
+    checks = integrity_checks(tables)
+    if not checks:
+        return []
+    found = {}
+    for row in spark.sql(integrity_sql(checks, namespace, sample_size)).collect():
+        _, samples = found.setdefault(row["constraint"], (row["violations"], []))
+        samples.append(json.loads(row["key"]))
+    return _violations(checks, found)
+
+
+def check_integrity_local(engine, tables=None, sample_size=5):
+    """Same checks on a LocalEngine, with pyarrow hash aggregations and anti-joins"""
+    checks = integrity_checks(tables)
+    data = {t: engine.arrow_table(t, cols) for t, cols in _projections(checks).items()}
+    found = {}
+    for check in checks:
+        columns = list(check.columns)
+        keys = data[check.table].select(columns)
+        if check.kind == "not_null":
+            rows = keys.filter(reduce(pc.or_, [pc.is_null(keys[c]) for c in columns]))
+        elif check.kind in ("primary_key", "unique_key"):
+            # One row per duplicated key
+            counts = keys.drop_null().group_by(columns).aggregate([([], "count_all")])
+            rows = counts.filter(pc.greater(counts["count_all"], 1)).select(columns)
+        else:
+            parent = data[check.ref_table].select(list(check.ref_columns)).rename_columns(columns)
+            parent = parent.group_by(columns).aggregate([])
+            # A null foreign key references nothing and is not a violation
+            rows = keys.drop_null().join(parent, columns, join_type="left anti")
+        if rows.num_rows:
+            # Every offending row counts, samples are distinct keys as in check_integrity
+            offending = rows.group_by(columns).aggregate([]).sort_by([(c, "ascending") for c in columns])
+            found[check.constraint] = (rows.num_rows, offending.slice(0, sample_size).to_pylist())
+    return _violations(checks, found)
+
+
+def print_integrity_report(violations):
+    """Print one line per constraint and the sample keys of the violated ones"""
+    header = f"{'constraint':<40} {'kind':<12} {'table':<28} {'violations':>10}"
+    print(header)
+    print("-" * len(header))
+    for v in violations:
+        print(f"{v.constraint:<40} {v.kind:<12} {v.table:<28} {v.count:>10,}")
+        for sample in v.samples:
+            print(f"{'':<40}   e.g. {sample}")
+    broken = [v.constraint for v in violations if v.count]
+    print(f"{len(broken)} of {len(violations)} constraints violated" + (f": {', '.join(broken)}" if broken else ""))
+    return broken
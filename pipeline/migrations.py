@@ -0,0 +1,58 @@
+"""Type migrations applied to existing bronze tables."""
+from collections import defaultdict
+
+from pipeline.schemas import DATE_FORMAT, TABLES
+
+# Column types that are already temporal and need no conversion
+TEMPORAL_TYPES = ("DATE", "TIMESTAMP", "TIMESTAMP_NTZ")
+
+
+def find_date_columns(spark, catalog, schema, table_prefix="bronze_", tables=None):
+    """Group yyyyMMdd columns that are not yet DATE by table, in one metadata query"""
+    table_filter = ""
+    if tables:
+        table_filter = "AND table_name IN (" + ", ".join(f"'{t}'" for t in tables) + ")"
+    rows = spark.sql(f"""
+    SELECT
+      table_name
+      , column_name
+      , data_type
+    FROM
+      {catalog}.information_schema.columns
+    WHERE
+      table_schema = '{schema}'
+      AND table_name LIKE '{table_prefix}%'
+      AND (column_name LIKE '%DAT' OR column_name LIKE '%DATE')
+      {table_filter}
+    """).collect()
+
+    pending = defaultdict(list)
+    for row in rows:
+        if row["data_type"].upper() not in TEMPORAL_TYPES:
+            pending[row["table_name"]].append(row["column_name"])
+    return dict(pending)
+
+
+def migrate_date_columns(spark, catalog, schema, table_prefix="bronze_", tables=None, date_format=DATE_FORMAT):
+    """Convert yyyyMMdd columns to DATE, rewriting each affected table once"""
+    from pyspark.sql import functions as F
+
+    pending = find_date_columns(spark, catalog, schema, table_prefix, tables)
+
+    for table, columns in pending.items():
+        df = spark.read.table(table)
+        registered = {c.name: c for c in TABLES[table].date_columns} if table in TABLES else {}
+
+        def parse(c):
+            if c in registered:
+                return registered[c].date_sql(f"CAST(`{c}` AS STRING)")
+            return f"try_to_date(CAST(`{c}` AS STRING), '{date_format}')"
+
+        # All conversions for the table go into a single projection, keeping column order
+        df = df.select([F.expr(parse(c)).alias(c) if c in columns else F.col(c) for c in df.columns])
+        df.write.mode("overwrite").option("overwriteSchema", "true").saveAsTable(table)
+        print(f"Converted {table}: {', '.join(columns)}")
+
+    if not pending:
+        print("All date columns are already DATE")
+    return pending
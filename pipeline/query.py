@@ -0,0 +1,291 @@
+"""In-process range queries over feature_sales_by_product.
+
+The feature table is loaded once into numpy arrays. Months are stored as
+integers (year * 12 + month - 1) and every grain (all, REGION, PRODUCTID,
+REGION x PRODUCTID) keeps its rows sorted by (series code, month) together
+with the running total of TOTAL_NETAMOUNT. A range total is then two
+binary searches and a subtraction, and a batch of ranges is answered with
+one vectorized searchsorted per grain. Row listings (the sales_report
+result) come from a copy of the rows sorted by (month, REGION, PRODUCTID),
+sliced with a binary search as well.
+
+SalesQueryService watches the version of the source table and rebuilds
+the index when it changes, the way pipeline.cache invalidates its entries.
+"""
+import argparse
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from pipeline.delta import table_version
+from pipeline.features import FEATURE_TABLE, qualified
+
+GRAINS = ((), ("REGION",), ("PRODUCTID",), ("REGION", "PRODUCTID"))
+REPORT_COLUMNS = ["REGION", "PRODUCTID", "FISCAL_YEAR_MONTH", "TOTAL_NETAMOUNT"]
+
+
+def month_number(month):
+    """'yyyy-MM' -> year * 12 + month - 1"""
+    parsed = datetime.strptime(month, "%Y-%m")
+    return parsed.year * 12 + parsed.month - 1
+
+
+def _month_numbers(values):
+    months = pd.to_datetime(values)
+    return (months.dt.year * 12 + months.dt.month - 1).to_numpy(dtype=np.int64)
+
+
+def _month_array(values):
+    """month_number of each 'yyyy-MM' value, parsing each distinct month once"""
+    values = pd.Series(values)
+    return values.map({m: month_number(m) for m in values.unique()}).to_numpy(dtype=np.int64)
+
+
+def _month_labels(numbers):
+    return [f"{n // 12:04d}-{n % 12 + 1:02d}" for n in numbers]
+
+
+class _RangeSums:
+    """Rows of one grain sorted by (series, month) with running totals"""
+
+    def __init__(self, frame, months, amounts, keys, span):
+        self.keys = list(keys)
+        self.span = span
+        if keys:
+            codes, self.series = pd.MultiIndex.from_frame(frame[self.keys]).factorize()
+        else:
+            codes, self.series = np.zeros(len(frame), dtype=np.int64), None
+        # Series code and month packed into one sortable integer
+        composite = codes.astype(np.int64) * span + months
+        order = np.argsort(composite, kind="stable")
+        self.composite = composite[order]
+        self.prefix = np.concatenate([[0.0], np.cumsum(amounts[order])])
+
+    def code(self, key):
+        """Series code of one key tuple, -1 if it is not in the data"""
+        if self.series is None:
+            return 0
+        try:
+            return self.series.get_loc(key)
+        except KeyError:
+            return -1
+
+    def codes(self, keys):
+        """Series code of each row of a key frame, -1 for keys not in the data"""
+        if self.series is None:
+            return np.zeros(len(keys), dtype=np.int64)
+        return self.series.get_indexer(pd.MultiIndex.from_frame(keys[self.keys]))
+
+    def totals(self, codes, starts, ends):
+        """Sum of amounts for each (series code, first month, last month); unknown codes sum to 0"""
+        codes = np.asarray(codes, dtype=np.int64)
+        low = np.searchsorted(self.composite, codes * self.span + starts, side="left")
+        high = np.searchsorted(self.composite, codes * self.span + ends, side="right")
+        sums = self.prefix[high] - self.prefix[low]
+        return np.where((codes >= 0) & (ends >= starts), sums, 0.0)
+
+
+class SalesIndex:
+    """Immutable index over one version of the feature table"""
+
+    def __init__(self, feature, version=None):
+        feature = feature[feature["FISCAL_YEAR_MONTH"].notna()].reset_index(drop=True)
+        self.version = version
+        self.rows = len(feature)
+        months = _month_numbers(feature["FISCAL_YEAR_MONTH"])
+        amounts = feature["TOTAL_NETAMOUNT"].fillna(0.0).to_numpy(dtype=np.float64)
+        # Month values lie in [0, span), so code * span + month never collides
+        span = int(months.max()) + 1 if len(months) else 1
+        self.span = span
+        self._grains = {keys: _RangeSums(feature, months, amounts, keys, span) for keys in GRAINS}
+
+        # Listing order: month, then region and product, as sales_report callers sort it
+        listing = feature.assign(_MONTH=months).sort_values(["_MONTH", "REGION", "PRODUCTID"], kind="stable")
+        self._months = listing["_MONTH"].to_numpy()
+        self._regions = listing["REGION"].to_numpy(dtype=object)
+        self._products = listing["PRODUCTID"].to_numpy(dtype=object)
+        self._amounts = listing["TOTAL_NETAMOUNT"].to_numpy(dtype=np.float64)
+
+    def total(self, start_month, end_month, region=None, product=None):
+        """TOTAL_NETAMOUNT over the months, optionally for one region and/or product"""
+        keys = tuple(k for k, v in (("REGION", region), ("PRODUCTID", product)) if v is not None)
+        sums = self._grains[keys]
+        code = sums.code(tuple(v for v in (region, product) if v is not None))
+        return float(sums.totals([code], month_number(start_month), month_number(end_month))[0])
+
+    def totals(self, queries):
+        """Totals for many ranges at once.
+
+        queries is a DataFrame (or list of dicts) with start_month and
+        end_month and optional REGION / PRODUCTID columns; a missing or null
+        value means all. Returns a float array aligned with the queries.
+        """
+        queries = pd.DataFrame(queries).reset_index(drop=True)
+        for column in ("REGION", "PRODUCTID"):
+            if column not in queries:
+                queries[column] = None
+        starts = _month_array(queries["start_month"])
+        ends = _month_array(queries["end_month"])
+        has_region = queries["REGION"].notna().to_numpy()
+        has_product = queries["PRODUCTID"].notna().to_numpy()
+
+        result = np.zeros(len(queries))
+        for keys in GRAINS:
+            rows = ((has_region == ("REGION" in keys)) & (has_product == ("PRODUCTID" in keys))).nonzero()[0]
+            if len(rows):
+                sums = self._grains[keys]
+                result[rows] = sums.totals(sums.codes(queries.iloc[rows]), starts[rows], ends[rows])
+        return result
+
+    def report(self, start_month, end_month, region=None):
+        """Rows of sales_report(start_month, end_month), optionally for one region"""
+        low = np.searchsorted(self._months, month_number(start_month), side="left")
+        high = np.searchsorted(self._months, month_number(end_month), side="right")
+        rows = slice(low, max(low, high))
+        report = pd.DataFrame({
+            "REGION": self._regions[rows],
+            "PRODUCTID": self._products[rows],
+            "FISCAL_YEAR_MONTH": _month_labels(self._months[rows]),
+            "TOTAL_NETAMOUNT": self._amounts[rows],
+        }, columns=REPORT_COLUMNS)
+        if region is not None:
+            report = report[report["REGION"] == region].reset_index(drop=True)
+        return report
+
+    def reports(self, ranges):
+        """report() for each (start_month, end_month) pair"""
+        return [self.report(start, end) for start, end in ranges]
+
+
+@dataclass
+class QueryStats:
+    queries: int = 0
+    reloads: int = 0
+    version: int = None
+    rows: int = 0
+    load_seconds: float = 0.0
+
+
+class SalesQueryService:
+    """SalesIndex that is rebuilt whenever the source version changes.
+
+    load() returns the feature rows as a DataFrame and version() the
+    current source version (None for a static source). The version is
+    checked at most every version_check_interval seconds; a rebuild runs
+    outside the lock, so queries keep using the previous index meanwhile.
+    """
+
+    def __init__(self, load, version=lambda: None, version_check_interval=0.0):
+        self._load = load
+        self._version = version
+        self.version_check_interval = version_check_interval
+        self._index = None
+        self._checked_at = 0.0
+        self._stats = QueryStats()
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+
+    def _build(self, version):
+        started = time.perf_counter()
+        index = SalesIndex(self._load(), version)
+        with self._lock:
+            self._index = index
+            self._stats.reloads += 1
+            self._stats.version = version
+            self._stats.rows = index.rows
+            self._stats.load_seconds = time.perf_counter() - started
+        return index
+
+    def index(self):
+        """Current index, reloaded first if the source has a new version"""
+        with self._lock:
+            index = self._index
+            self._stats.queries += 1
+            due = index is None or time.monotonic() - self._checked_at >= self.version_check_interval
+        if not due:
+            return index
+        with self._reload_lock:
+            version = self._version()
+            with self._lock:
+                self._checked_at = time.monotonic()
+                index = self._index
+            if index is None or version != index.version:
+                index = self._build(version)
+        return index
+
+    def total(self, start_month, end_month, region=None, product=None):
+        return self.index().total(start_month, end_month, region, product)
+
+    def totals(self, queries):
+        return self.index().totals(queries)
+
+    def report(self, start_month, end_month, region=None):
+        return self.index().report(start_month, end_month, region)
+
+    def reports(self, ranges):
+        return self.index().reports(ranges)
+
+    def stats(self):
+        with self._lock:
+            return QueryStats(**self._stats.__dict__)
+
+
+def spark_query_service(spark, namespace="workspace.default", version_check_interval=5.0):
+    """Service over the feature table, reloaded after each commit to it"""
+    table = qualified(namespace, FEATURE_TABLE)
+    return SalesQueryService(
+        load=lambda: spark.table(table).select(*REPORT_COLUMNS).toPandas(),
+        version=lambda: table_version(spark, table),
+        version_check_interval=version_check_interval,
+    )
+
+
+def local_query_service(engine):
+    """Service over a LocalEngine's feature table, which never changes"""
+    return SalesQueryService(load=engine.feature_sales_by_product)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Answer sales range queries from the in-memory index")
+    parser.add_argument("start_month", help="yyyy-MM")
+    parser.add_argument("end_month", help="yyyy-MM")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--cache-dir", help="read the CSV files through a columnar cache in this directory")
+    parser.add_argument("--batch", type=int, default=10_000, help="random range queries to time")
+    args = parser.parse_args(argv)
+
+    from pipeline.engine import LocalEngine
+    cache = None
+    if args.cache_dir:
+        from pipeline.colcache import ColumnarCache
+        cache = ColumnarCache(args.cache_dir)
+    engine = LocalEngine(args.data_dir, cache)
+    service = local_query_service(engine)
+    index = service.index()
+    print(f"Indexed {index.rows:,} rows in {service.stats().load_seconds:.2f}s")
+
+    print(service.report(args.start_month, args.end_month).to_string(index=False))
+    print(f"Total {service.total(args.start_month, args.end_month):,.2f}")
+
+    feature = engine.feature_sales_by_product()
+    rng = np.random.default_rng(0)
+    first, last = month_number(args.start_month), month_number(args.end_month)
+    starts = rng.integers(first, last + 1, args.batch)
+    ends = np.minimum(starts + rng.integers(0, 12, args.batch), last)
+    picks = feature.sample(args.batch, replace=True, random_state=0)
+    queries = pd.DataFrame({
+        "start_month": _month_labels(starts), "end_month": _month_labels(ends),
+        "REGION": picks["REGION"].to_numpy(), "PRODUCTID": picks["PRODUCTID"].to_numpy(),
+    })
+    started = time.perf_counter()
+    service.totals(queries)
+    seconds = time.perf_counter() - started
+    print(f"{args.batch:,} range totals in {seconds * 1000:.1f}ms ({seconds / args.batch * 1e6:.1f}us each)")
+
+
+if __name__ == "__main__":
+    main()
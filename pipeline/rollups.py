@@ -0,0 +1,170 @@
+"""Pre-aggregated sales rollups over region, product category, product and month.
+
+feature_sales_rollup materializes several grouping levels in one GROUPING
+SETS pass. Every level keeps FISCAL_YEAR_MONTH, so the table can be
+refreshed month by month together with feature_sales_by_product and
+multi-month questions only add up a handful of monthly rows.
+"""
+from pipeline.features import (
+    ITEMS_TABLE, LAYOUT_PROPERTY, ORDERS_TABLE, changed_months, month_literals, qualified, record_versions,
+    recorded_versions, source_versions,
+)
+
+ROLLUP_TABLE = "feature_sales_rollup"
+PRODUCTS_TABLE = "bronze_products"
+SOURCES = (ORDERS_TABLE, ITEMS_TABLE, PRODUCTS_TABLE)
+LAYOUT_VERSION = "1"
+
+DIMENSIONS = ("REGION", "PRODCATEGORYID", "PRODUCTID")
+
+# Grouping levels, in addition to FISCAL_YEAR_MONTH which every level keeps
+GROUPING_LEVELS = (
+    ("REGION", "PRODCATEGORYID", "PRODUCTID"),
+    ("REGION", "PRODCATEGORYID"),
+    ("REGION",),
+    ("PRODCATEGORYID", "PRODUCTID"),
+    ("PRODCATEGORYID",),
+    (),
+)
+
+
+def grouping_id(level):
+    """GROUPING_ID of a level: one bit per dimension, set when it is aggregated away"""
+    return sum(1 << (len(DIMENSIONS) - 1 - i) for i, d in enumerate(DIMENSIONS) if d not in level)
+
+
+def grouping_id_sql():
+    """SQL computing grouping_id() per row from grouping() flags.
+
+    Spark's grouping_id(...) must list every grouping column, including
+    FISCAL_YEAR_MONTH which all levels keep, so the level is built from
+    the dimensions' own flags instead.
+    """
+    return " + ".join(f"grouping({d}) * {1 << (len(DIMENSIONS) - 1 - i)}" for i, d in enumerate(DIMENSIONS))
+
+
+def grouping_sets_sql():
+    return ", ".join("(" + ", ".join(level + ("FISCAL_YEAR_MONTH",)) + ")" for level in GROUPING_LEVELS)
+
+
+def _rollup_select(namespace, versions, months=None):
+    where = f"WHERE trunc(so.CREATEDAT, 'MM') IN ({month_literals(months)})" if months is not None else ""
+    return f"""
+    SELECT
+      REGION,
+      PRODCATEGORYID,
+      PRODUCTID,
+      FISCAL_YEAR_MONTH,
+      {grouping_id_sql()} AS GROUPING_ID,
+      SUM(NETAMOUNT) AS TOTAL_NETAMOUNT,
+      COUNT(*) AS ITEM_COUNT,
+      SUM(QUANTITY) AS TOTAL_QUANTITY
+    FROM (
+      SELECT
+        so.SALESORG AS REGION,
+        p.PRODCATEGORYID,
+        soi.PRODUCTID,
+        trunc(so.CREATEDAT, 'MM') AS FISCAL_YEAR_MONTH,
+        soi.NETAMOUNT,
+        soi.QUANTITY
+      FROM
+        {qualified(namespace, ORDERS_TABLE)} VERSION AS OF {versions[ORDERS_TABLE]} so
+      JOIN
+        {qualified(namespace, ITEMS_TABLE)} VERSION AS OF {versions[ITEMS_TABLE]} soi
+        ON so.SALESORDERID = soi.SALESORDERID
+      LEFT JOIN
+        {qualified(namespace, PRODUCTS_TABLE)} VERSION AS OF {versions[PRODUCTS_TABLE]} p
+        ON soi.PRODUCTID = p.PRODUCTID
+      {where}
+    ) lines
+    GROUP BY
+      GROUPING SETS ({grouping_sets_sql()})
+    """
+
+
+def rebuild_sales_rollup(spark, namespace, versions=None):
+    """Recompute every grouping level for all months"""
+    rollup = qualified(namespace, ROLLUP_TABLE)
+    versions = versions or source_versions(spark, namespace, SOURCES)
+    spark.sql(f"""
+    CREATE OR REPLACE TABLE {rollup}
+    CLUSTER BY (GROUPING_ID, FISCAL_YEAR_MONTH)
+    TBLPROPERTIES ('{LAYOUT_PROPERTY}' = '{LAYOUT_VERSION}')
+    AS {_rollup_select(namespace, versions)}
+    """)
+    record_versions(spark, rollup, versions)
+
+
+def refresh_sales_rollup(spark, namespace="workspace.default", mode="incremental"):
+    """Refresh the rollups, replacing only changed months when possible.
+
+    A change to bronze_products can move products between categories in any
+    month, so it always triggers a full rebuild.
+    """
+    rollup = qualified(namespace, ROLLUP_TABLE)
+    current = source_versions(spark, namespace, SOURCES)
+    recorded = recorded_versions(spark, rollup, SOURCES, LAYOUT_VERSION) if mode == "incremental" else None
+
+    if recorded is not None and current == recorded:
+        print(f"{rollup} is up to date")
+        return set()
+
+    months = None
+    if recorded is not None and recorded[PRODUCTS_TABLE] == current[PRODUCTS_TABLE]:
+        try:
+            months = changed_months(spark, namespace, recorded, current)
+        except Exception as e:
+            print(f"Change feed unavailable ({e})")
+
+    if months is None:
+        print(f"Full rebuild of {rollup}")
+        rebuild_sales_rollup(spark, namespace, current)
+        return None
+
+    if months:
+        spark.sql(f"""
+        INSERT INTO {rollup}
+        REPLACE WHERE FISCAL_YEAR_MONTH IN ({month_literals(months)})
+        {_rollup_select(namespace, current, months)}
+        """)
+    record_versions(spark, rollup, current)
+    print(f"Refreshed {len(months)} months of {rollup}")
+    return months
+
+
+def rollup_level(group_by=(), filters=None):
+    """The coarsest grouping level that can answer a query"""
+    needed = {d for d in group_by if d != "FISCAL_YEAR_MONTH"} | set(filters or {})
+    unknown = needed - set(DIMENSIONS)
+    if unknown:
+        raise ValueError(f"Unknown rollup dimensions: {', '.join(sorted(unknown))}")
+    candidates = [level for level in GROUPING_LEVELS if needed <= set(level)]
+    return min(candidates, key=len)
+
+
+def rollup_lookup(spark, namespace="workspace.default", group_by=(), filters=None,
+                  start_month=None, end_month=None):
+    """Answer an aggregate sales query from the coarsest matching pre-aggregate.
+
+    group_by: dimensions (and optionally FISCAL_YEAR_MONTH) to group by.
+    filters: {dimension: value or list of values}.
+    start_month / end_month: 'yyyy-MM' bounds, inclusive.
+    """
+    from pyspark.sql import functions as F
+
+    level = rollup_level(group_by, filters)
+    df = spark.table(qualified(namespace, ROLLUP_TABLE)).where(F.col("GROUPING_ID") == grouping_id(level))
+
+    for column, value in (filters or {}).items():
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        df = df.where(F.col(column).isin(list(values)))
+    if start_month:
+        df = df.where(F.col("FISCAL_YEAR_MONTH") >= F.to_date(F.lit(start_month), "yyyy-MM"))
+    if end_month:
+        df = df.where(F.col("FISCAL_YEAR_MONTH") <= F.to_date(F.lit(end_month), "yyyy-MM"))
+
+    return df.groupBy(*group_by).agg(
+        F.sum("TOTAL_NETAMOUNT").alias("TOTAL_NETAMOUNT"),
+        F.sum("ITEM_COUNT").alias("ITEM_COUNT"),
+        F.sum("TOTAL_QUANTITY").alias("TOTAL_QUANTITY"),
+    )
@@ -0,0 +1,91 @@
+"""A small dependency-aware task scheduler for the setup pipeline."""
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+
+
+@dataclass
+class Task:
+    name: str
+    fn: object
+    deps: tuple = ()
+
+
+@dataclass
+class TaskResult:
+    name: str
+    status: str  # succeeded / failed / skipped
+    value: object = None
+    error: str = None
+    seconds: float = 0.0
+
+
+def _check_graph(tasks):
+    """Fail fast on unknown dependencies or cycles"""
+    for task in tasks.values():
+        for dep in task.deps:
+            if dep not in tasks:
+                raise ValueError(f"Task {task.name} depends on unknown task {dep}")
+
+    visiting, done = set(), set()
+
+    def visit(name):
+        if name in done:
+            return
+        if name in visiting:
+            raise ValueError(f"Dependency cycle through task {name}")
+        visiting.add(name)
+        for dep in tasks[name].deps:
+            visit(dep)
+        visiting.discard(name)
+        done.add(name)
+
+    for name in tasks:
+        visit(name)
+
+
+def _run(task):
+    start = time.time()
+    try:
+        value = task.fn()
+        return TaskResult(task.name, "succeeded", value, seconds=time.time() - start)
+    except Exception as e:
+        return TaskResult(task.name, "failed", error=str(e), seconds=time.time() - start)
+
+
+def run_dag(tasks, max_workers=4):
+    """Run tasks in parallel as soon as all of their dependencies have succeeded.
+
+    A failed task is recorded and every task downstream of it is skipped;
+    independent branches keep running. Returns {task name: TaskResult}.
+    """
+    tasks = {task.name: task for task in tasks}
+    _check_graph(tasks)
+
+    results = {}
+    pending = dict(tasks)
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while pending or running:
+            for name, task in list(pending.items()):
+                dep_results = [results.get(dep) for dep in task.deps]
+                if any(r is not None and r.status != "succeeded" for r in dep_results):
+                    failed = [r.name for r in dep_results if r is not None and r.status != "succeeded"]
+                    results[name] = TaskResult(name, "skipped", error=f"upstream failed: {', '.join(failed)}")
+                    del pending[name]
+                elif all(r is not None for r in dep_results):
+                    running[pool.submit(_run, task)] = name
+                    del pending[name]
+
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                result = future.result()
+                results[result.name] = result
+                del running[future]
+                print(f"{result.status:>10}  {result.name}  ({result.seconds:.1f}s)"
+                      + (f"  {result.error}" if result.error else ""))
+
+    return {name: results[name] for name in tasks}
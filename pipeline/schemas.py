@@ -0,0 +1,271 @@
+"""Declarative schemas for the bronze tables.
+
+Column types are Spark SQL type names. Date columns are stored in the CSV
+files as yyyyMMdd text and are parsed into real DATE columns at ingest;
+text that is not a valid date becomes NULL unless the column declares it
+as its open_end marker. Columns with nullable=False are declared NOT NULL
+on the bronze table.
+"""
+from dataclasses import dataclass
+
+DATE_FORMAT = "yyyyMMdd"
+# Stored for an open_end marker: the latest date a DATE column holds
+OPEN_END_DATE = "9999-12-31"
+
+
+@dataclass(frozen=True)
+class Column:
+    name: str
+    type: str
+    nullable: bool = True
+    date_format: str = None
+    # Raw text meaning "no end" that is not a valid date itself; stored as OPEN_END_DATE
+    open_end: str = None
+
+    def date_sql(self, source=None):
+        """try_to_date of a date column's raw text, mapping its open_end marker to OPEN_END_DATE"""
+        source = source or f"`{self.name}`"
+        parsed = f"try_to_date({source}, '{self.date_format}')"
+        if self.open_end is None:
+            return parsed
+        return f"CASE WHEN {source} = '{self.open_end}' THEN DATE'{OPEN_END_DATE}' ELSE {parsed} END"
+
+
+@dataclass(frozen=True)
+class TableSchema:
+    table: str
+    source_file: str
+    columns: tuple
+    primary_key: tuple = ()
+    # Unique row key for tables without a declared primary key
+    unique_key: tuple = ()
+    # Columns present in the CSV but not loaded into the table
+    drop_columns: tuple = ()
+
+    @property
+    def key(self):
+        return self.primary_key or self.unique_key
+
+    @property
+    def column_names(self):
+        return [c.name for c in self.columns]
+
+    @property
+    def table_columns(self):
+        return [c for c in self.columns if c.name not in self.drop_columns]
+
+    @property
+    def date_columns(self):
+        return [c for c in self.table_columns if c.type == "date"]
+
+    @property
+    def not_null_columns(self):
+        """Columns declared NOT NULL on the table: nullable=False ones and the primary key"""
+        return [c.name for c in self.table_columns if not c.nullable or c.name in self.primary_key]
+
+    def raw_ddl(self):
+        """DDL for reading the CSV as-is (date columns are read as text)"""
+        return ", ".join(
+            f"`{c.name}` {'string' if c.type == 'date' else c.type}" for c in self.columns
+        )
+
+
+def _date(name, nullable=True, open_end=None):
+    return Column(name, "date", nullable, DATE_FORMAT, open_end)
+
+
+TABLES = {t.table: t for t in [
+    TableSchema("bronze_addresses", "Addresses.csv", (
+        Column("ADDRESSID", "int", False),
+        Column("CITY", "string"),
+        Column("POSTALCODE", "string"),
+        Column("STREET", "string"),
+        Column("BUILDING", "double"),
+        Column("COUNTRY", "string"),
+        Column("REGION", "string"),
+        Column("ADDRESSTYPE", "int"),
+        _date("VALIDITY_STARTDATE"),
+        _date("VALIDITY_ENDDATE"),
+        Column("LATITUDE", "double"),
+        Column("LONGITUDE", "double"),
+    ), primary_key=("ADDRESSID",)),
+    TableSchema("bronze_businesspartners", "BusinessPartners.csv", (
+        Column("PARTNERID", "int", False),
+        Column("PARTNERROLE", "int"),
+        Column("EMAILADDRESS", "string"),
+        Column("PHONENUMBER", "string"),
+        Column("FAXNUMBER", "string"),
+        Column("WEBADDRESS", "string"),
+        Column("ADDRESSID", "int"),
+        Column("COMPANYNAME", "string"),
+        Column("LEGALFORM", "string"),
+        Column("CREATEDBY", "int"),
+        _date("CREATEDAT"),
+        Column("CHANGEDBY", "int"),
+        _date("CHANGEDAT"),
+        Column("CURRENCY", "string"),
+    ), primary_key=("PARTNERID",)),
+    TableSchema("bronze_employees", "Employees.csv", (
+        Column("EMPLOYEEID", "int", False),
+        Column("NAME_FIRST", "string"),
+        Column("NAME_MIDDLE", "string"),
+        Column("NAME_LAST", "string"),
+        Column("NAME_INITIALS", "string"),
+        Column("SEX", "string"),
+        Column("LANGUAGE", "string"),
+        Column("PHONENUMBER", "string"),
+        Column("EMAILADDRESS", "string"),
+        Column("LOGINNAME", "string"),
+        Column("ADDRESSID", "int"),
+        _date("VALIDITY_STARTDATE"),
+        # Current employees end on 100041231 (year 10004), outside the DATE range
+        _date("VALIDITY_ENDDATE", open_end="100041231"),
+        Column("Unnamed13", "string"),
+        Column("Unnamed14", "string"),
+        Column("Unnamed15", "string"),
+        Column("Unnamed16", "string"),
+        Column("Unnamed17", "string"),
+        Column("Unnamed18", "string"),
+    ), primary_key=("EMPLOYEEID",),
+        drop_columns=("Unnamed13", "Unnamed14", "Unnamed15", "Unnamed16", "Unnamed17", "Unnamed18")),
+    TableSchema("bronze_productcategories", "ProductCategories.csv", (
+        Column("PRODCATEGORYID", "string", False),
+        Column("CREATEDBY", "int"),
+        _date("CREATEDAT"),
+    ), primary_key=("PRODCATEGORYID",)),
+    TableSchema("bronze_productcategorytext", "ProductCategoryText.csv", (
+        Column("PRODCATEGORYID", "string", False),
+        Column("LANGUAGE", "string", False),
+        Column("SHORT_DESCR", "string"),
+        Column("MEDIUM_DESCR", "string"),
+        Column("LONG_DESCR", "string"),
+    ), unique_key=("PRODCATEGORYID", "LANGUAGE")),
+    TableSchema("bronze_producttexts", "ProductTexts.csv", (
+        Column("PRODUCTID", "string", False),
+        Column("LANGUAGE", "string", False),
+        Column("SHORT_DESCR", "string"),
+        Column("MEDIUM_DESCR", "string"),
+        Column("LONG_DESCR", "string"),
+    ), unique_key=("PRODUCTID", "LANGUAGE")),
+    TableSchema("bronze_products", "Products.csv", (
+        Column("PRODUCTID", "string", False),
+        Column("TYPECODE", "string"),
+        Column("PRODCATEGORYID", "string"),
+        Column("CREATEDBY", "int"),
+        _date("CREATEDAT"),
+        Column("CHANGEDBY", "int"),
+        _date("CHANGEDAT"),
+        Column("SUPPLIER_PARTNERID", "int"),
+        Column("TAXTARIFFCODE", "int"),
+        Column("QUANTITYUNIT", "string"),
+        Column("WEIGHTMEASURE", "double"),
+        Column("WEIGHTUNIT", "string"),
+        Column("CURRENCY", "string"),
+        Column("PRICE", "int"),
+        Column("WIDTH", "double"),
+        Column("DEPTH", "double"),
+        Column("HEIGHT", "double"),
+        Column("DIMENSIONUNIT", "string"),
+        Column("PRODUCTPICURL", "string"),
+    ), primary_key=("PRODUCTID",)),
+    TableSchema("bronze_salesorderitems", "SalesOrderItems.csv", (
+        Column("SALESORDERID", "int", False),
+        Column("SALESORDERITEM", "int", False),
+        Column("PRODUCTID", "string"),
+        Column("NOTEID", "string"),
+        Column("CURRENCY", "string"),
+        Column("GROSSAMOUNT", "int"),
+        Column("NETAMOUNT", "double"),
+        Column("TAXAMOUNT", "double"),
+        Column("ITEMATPSTATUS", "string"),
+        Column("OPITEMPOS", "string"),
+        Column("QUANTITY", "int"),
+        Column("QUANTITYUNIT", "string"),
+        _date("DELIVERYDATE"),
+    ), unique_key=("SALESORDERID", "SALESORDERITEM")),
+    TableSchema("bronze_salesorders", "SalesOrders.csv", (
+        Column("SALESORDERID", "int", False),
+        Column("CREATEDBY", "int"),
+        _date("CREATEDAT"),
+        Column("CHANGEDBY", "int"),
+        _date("CHANGEDAT"),
+        Column("FISCVARIANT", "string"),
+        Column("FISCALYEARPERIOD", "int"),
+        Column("NOTEID", "string"),
+        Column("PARTNERID", "int"),
+        Column("SALESORG", "string"),
+        Column("CURRENCY", "string"),
+        Column("GROSSAMOUNT", "int"),
+        Column("NETAMOUNT", "double"),
+        Column("TAXAMOUNT", "double"),
+        Column("LIFECYCLESTATUS", "string"),
+        Column("BILLINGSTATUS", "string"),
+        Column("DELIVERYSTATUS", "string"),
+    ), primary_key=("SALESORDERID",)),
+]}
+
+
+def table_for_file(filename):
+    """Look up the bronze table schema for a source CSV file name"""
+    for schema in TABLES.values():
+        if schema.source_file == filename:
+            return schema
+    raise KeyError(f"No schema registered for {filename}")
+
+
+@dataclass(frozen=True)
+class ForeignKey:
+    name: str
+    table: str
+    columns: tuple
+    ref_table: str
+    ref_columns: tuple
+
+
+FOREIGN_KEYS = [
+    # businesspartners → addresses
+    ForeignKey("fk_bp_address", "bronze_businesspartners", ("ADDRESSID",), "bronze_addresses", ("ADDRESSID",)),
+    # salesorders → businesspartners
+    ForeignKey("fk_so_partner", "bronze_salesorders", ("PARTNERID",), "bronze_businesspartners", ("PARTNERID",)),
+    # salesorders → employees（CreatedBy, ChangedByは社員IDと推測）
+    ForeignKey("fk_so_createdby", "bronze_salesorders", ("CREATEDBY",), "bronze_employees", ("EMPLOYEEID",)),
+    ForeignKey("fk_so_changedby", "bronze_salesorders", ("CHANGEDBY",), "bronze_employees", ("EMPLOYEEID",)),
+    # salesorderitems → salesorders
+    ForeignKey("fk_soi_salesorder", "bronze_salesorderitems", ("SALESORDERID",), "bronze_salesorders", ("SALESORDERID",)),
+    # salesorderitems → products
+    ForeignKey("fk_soi_product", "bronze_salesorderitems", ("PRODUCTID",), "bronze_products", ("PRODUCTID",)),
+    # products → productcategories
+    ForeignKey("fk_products_category", "bronze_products", ("PRODCATEGORYID",), "bronze_productcategories", ("PRODCATEGORYID",)),
+    # employees → addresses
+    ForeignKey("fk_emp_address", "bronze_employees", ("ADDRESSID",), "bronze_addresses", ("ADDRESSID",)),
+    # products → producttexts
+    ForeignKey("fk_products_text", "bronze_producttexts", ("PRODUCTID",), "bronze_products", ("PRODUCTID",)),
+    # productcategories → productcategorytext
+    ForeignKey("fk_products_category_texts", "bronze_productcategorytext", ("PRODCATEGORYID",), "bronze_productcategories", ("PRODCATEGORYID",)),
+]
+
+
+def not_null_ddl(table_schema):
+    """Statements that declare the table's not_null_columns NOT NULL"""
+    return [f"ALTER TABLE {table_schema.table} ALTER COLUMN {c} SET NOT NULL" for c in table_schema.not_null_columns]
+
+
+def primary_key_ddl(table_schema):
+    """Statements that (re)declare the table's primary key as RELY, after its NOT NULL columns"""
+    table = table_schema.table
+    columns = ", ".join(table_schema.primary_key)
+    return [
+        *not_null_ddl(table_schema),
+        # Dropping with CASCADE also drops referencing foreign keys; they are re-added afterwards
+        f"ALTER TABLE {table} DROP PRIMARY KEY IF EXISTS CASCADE",
+        f"ALTER TABLE {table} ADD PRIMARY KEY ({columns}) RELY",
+    ]
+
+
+def foreign_key_ddl(fk):
+    """Statements that (re)declare a foreign key as RELY"""
+    return [
+        f"ALTER TABLE {fk.table} DROP CONSTRAINT IF EXISTS {fk.name}",
+        f"ALTER TABLE {fk.table} ADD CONSTRAINT {fk.name} "
+        f"FOREIGN KEY ({', '.join(fk.columns)}) REFERENCES {fk.ref_table}({', '.join(fk.ref_columns)}) RELY",
+    ]
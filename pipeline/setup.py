@@ -0,0 +1,117 @@
+"""Task graph for building the bronze tables.
+
+Every table runs its own chain (download -> load -> date fix -> column drop
+-> primary key, or NOT NULL columns for tables without one) independently
+of the others. Foreign keys are grouped by the table that owns them and
+only start once the owning table and every referenced primary key are
+ready.
+"""
+from collections import defaultdict
+
+from pipeline.migrations import migrate_date_columns
+from pipeline.scheduler import Task
+from pipeline.schemas import FOREIGN_KEYS, foreign_key_ddl, not_null_ddl, primary_key_ddl, table_for_file
+
+
+def _run_statements(spark, statements):
+    for statement in statements:
+        spark.sql(statement)
+
+
+def _drop_columns(spark, table_schema):
+    """Drop columns left over from tables created before the registry dropped them at read time"""
+    table = table_schema.table
+    existing = [c for c in table_schema.drop_columns if c in spark.table(table).columns]
+    if existing:
+        spark.sql(f"ALTER TABLE {table} SET TBLPROPERTIES ('delta.columnMapping.mode' = 'name')")
+        spark.sql(f"ALTER TABLE {table} DROP COLUMNS IF EXISTS ({', '.join(existing)})")
+    return existing
+
+
+def _download(fetcher, filename):
+    result = fetcher.fetch(filename)
+    if not result.ok:
+        raise RuntimeError(f"download failed: {result.error}")
+    return result
+
+
+def build_setup_tasks(spark, catalog, schema, csv_files, fetcher, load_table):
+    """Build the setup task graph.
+
+    load_table(csv_path, table_name) loads one file and returns its IngestResult
+    (or a falsy value on failure).
+    """
+    tasks = []
+    ready = {}  # table -> name of the last task in its chain
+
+    for filename in csv_files:
+        table_schema = table_for_file(filename)
+        table = table_schema.table
+
+        def load(filename=filename, table=table):
+            path = f"{fetcher.dest_dir}/{filename}"
+            result = load_table(path, table)
+            if not result:
+                raise RuntimeError(f"failed to load {table}")
+            return result
+
+        chain = [
+            Task(f"download:{filename}", lambda filename=filename: _download(fetcher, filename)),
+            Task(f"load:{table}", load),
+            Task(f"dates:{table}",
+                 lambda table=table: migrate_date_columns(spark, catalog, schema, tables=[table])),
+        ]
+        if table_schema.drop_columns:
+            chain.append(Task(f"columns:{table}", lambda ts=table_schema: _drop_columns(spark, ts)))
+        if table_schema.primary_key:
+            chain.append(Task(f"pk:{table}",
+                              lambda ts=table_schema: _run_statements(spark, primary_key_ddl(ts))))
+        elif table_schema.not_null_columns:
+            chain.append(Task(f"not_null:{table}",
+                              lambda ts=table_schema: _run_statements(spark, not_null_ddl(ts))))
+
+        for previous, task in zip(chain, chain[1:]):
+            task.deps = (previous.name,)
+        tasks.extend(chain)
+        ready[table] = chain[-1].name
+
+    # One task per owning table so ALTER TABLE statements on the same table never race
+    foreign_keys = defaultdict(list)
+    for fk in FOREIGN_KEYS:
+        if fk.table in ready and fk.ref_table in ready:
+            foreign_keys[fk.table].append(fk)
+
+    for table, fks in foreign_keys.items():
+        deps = {ready[table]} | {ready[fk.ref_table] for fk in fks}
+        statements = [statement for fk in fks for statement in foreign_key_ddl(fk)]
+        tasks.append(Task(f"fk:{table}", lambda statements=statements: _run_statements(spark, statements),
+                          tuple(sorted(deps))))
+
+    return tasks
+
+
+def loaded_tables(results):
+    """Split the load task results into (successful, failed) table names"""
+    successful, failed = [], []
+    for name, result in results.items():
+        if name.startswith("load:"):
+            (successful if result.status == "succeeded" else failed).append(name.split(":", 1)[1])
+    return successful, failed
+
+
+def print_ingest_summary(results):
+    """Print one table of per-table load metrics taken from the write commits"""
+    header = f"{'table':<28} {'mode':<12} {'rows':>10} {'inserted':>9} {'updated':>8} {'deleted':>8} " \
+             f"{'bytes':>12} {'files':>6} {'seconds':>8}"
+    print(header)
+    print("-" * len(header))
+    for name, result in results.items():
+        if not name.startswith("load:"):
+            continue
+        table = name.split(":", 1)[1]
+        r = result.value
+        if result.status != "succeeded" or r is None:
+            print(f"{table:<28} {result.status:<12} {result.error or ''}")
+            continue
+        print(f"{table:<28} {r.mode:<12} {r.rows:>10,} {r.inserted:>9,} {r.updated:>8,} {r.deleted:>8,} "
+              f"{r.bytes:>12,} {r.files:>6} {result.seconds:>8.1f}")
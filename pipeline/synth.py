@@ -0,0 +1,212 @@
+"""Synthetic scale-out of the bike sales data set.
+
+The fact tables (SalesOrders, SalesOrderItems) are scaled by resampling
+whole orders together with their items: every synthetic order is a copy of
+a randomly drawn source order under a new SALESORDERID. Partners, employees
+and products are only ever referenced through copied rows, so every foreign
+key still resolves.
+
+Copies alone would leave the REGION x PRODUCTID x month grain of the
+feature table as small as the source's, so the generator also grows it:
+each copy is moved back by a random number of whole years (0 to years - 1,
+dates and all), and its items are switched to one of product_copies clones
+of their product. Clones are added to Products.csv and ProductTexts.csv
+under new ids ("HT-1000-2") with their category and texts. By default both
+grow with the square root of the scale, so the feature table grows roughly
+with the scale; years=1, product_copies=1 keeps the source's grain. The
+other dimension files are copied unchanged.
+
+Output is written in chunks, so even 10,000x fits in a small amount of memory:
+
+    python -m pipeline.synth --scale 100 --out /tmp/bikes_x100
+"""
+import argparse
+import os
+import shutil
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+
+from pipeline.features import ITEMS_TABLE, ORDERS_TABLE
+from pipeline.schemas import TABLES
+
+ORDERS_FILE = TABLES[ORDERS_TABLE].source_file
+ITEMS_FILE = TABLES[ITEMS_TABLE].source_file
+PRODUCTS_FILE = TABLES["bronze_products"].source_file
+PRODUCT_TEXTS_FILE = TABLES["bronze_producttexts"].source_file
+
+# yyyyMMdd columns moved together with a copied order
+ORDER_DATE_COLUMNS = ("CREATEDAT", "CHANGEDAT")
+ITEM_DATE_COLUMNS = ("DELIVERYDATE",)
+
+
+def growth(scale):
+    """Default (years, product_copies) for a scale: both grow with its square root"""
+    n = max(1, int(round(scale ** 0.5)))
+    return n, n
+
+
+def _read_raw(path):
+    """Read a CSV with every column as text, so values are written back exactly as read"""
+    with open(path, encoding="utf-8") as f:
+        names = f.readline().rstrip("\r\n").split(",")
+    return pv.read_csv(path, convert_options=pv.ConvertOptions(
+        column_types={name: pa.string() for name in names},
+        null_values=[""],
+        strings_can_be_null=True,
+    ))
+
+
+def _item_ranges(orders, items):
+    """Sorted items plus, per order row, the (start, count) of its items"""
+    items = items.take(pc.sort_indices(pc.cast(items["SALESORDERID"], pa.int64())))
+    item_orders = pc.cast(items["SALESORDERID"], pa.int64()).to_numpy()
+    order_ids = pc.cast(orders["SALESORDERID"], pa.int64()).to_numpy()
+    starts = np.searchsorted(item_orders, order_ids, side="left")
+    ends = np.searchsorted(item_orders, order_ids, side="right")
+    return items, starts, ends - starts
+
+
+def _with_ids(table, ids):
+    index = table.schema.get_field_index("SALESORDERID")
+    return table.set_column(index, "SALESORDERID", pa.array(ids.astype(str)))
+
+
+def _shift_years(values, years):
+    """yyyyMMdd text moved by years per row (Feb 29 becomes Feb 28 in common years); other text is kept"""
+    text = values.to_numpy(zero_copy_only=False).astype(object)
+    valid = pc.fill_null(pc.match_substring_regex(values, r"^\d{8}$"), False).to_numpy(zero_copy_only=False)
+    dates = text[valid].astype(np.int64)
+    year = dates // 10000 + years[valid]
+    month_day = dates % 10000
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    month_day = np.where((month_day == 229) & ~leap, 228, month_day)
+    text[valid] = (year * 10000 + month_day).astype(str)
+    return pa.array(text, pa.string())
+
+
+def _shifted(table, columns, years):
+    if not years.any():
+        return table
+    for column in columns:
+        index = table.schema.get_field_index(column)
+        table = table.set_column(index, column, _shift_years(table[column], years))
+    return table
+
+
+def _product_id(product_ids, copies):
+    """Clone c of each product id: the id itself for c == 0, "<id>-<c + 1>" otherwise"""
+    suffixes = np.array([""] + [f"-{c + 1}" for c in range(1, int(copies.max(initial=0)) + 1)], dtype=object)
+    return pc.binary_join_element_wise(product_ids, pa.array(suffixes[copies], pa.string()), "")
+
+
+def _with_products(table, copies):
+    index = table.schema.get_field_index("PRODUCTID")
+    return table.set_column(index, "PRODUCTID", _product_id(table["PRODUCTID"], copies))
+
+
+def _clone_products(data_dir, out_dir, product_copies):
+    """Write Products.csv and ProductTexts.csv with product_copies clones of every product"""
+    rows = {}
+    for filename in (PRODUCTS_FILE, PRODUCT_TEXTS_FILE):
+        source = _read_raw(os.path.join(data_dir, filename))
+        clones = [_with_products(source, np.full(source.num_rows, c)) for c in range(product_copies)]
+        table = pa.concat_tables(clones)
+        pv.write_csv(table, os.path.join(out_dir, filename))
+        rows[filename] = table.num_rows
+    return rows
+
+
+def _writer(path, schema):
+    # The fact tables contain no delimiters or quotes, so write them unquoted like the source files
+    return pv.CSVWriter(path, schema, write_options=pv.WriteOptions(quoting_style="none", quoting_header="none"))
+
+
+def generate(data_dir, out_dir, scale, seed=0, chunk_orders=100_000, years=None, product_copies=None):
+    """Write a copy of data_dir with the fact tables scaled by `scale`.
+
+    The source orders are kept as they are; the remaining (scale - 1) x
+    orders are resampled copies with new ids, each moved back by 0 to
+    years - 1 years and using one of product_copies clones of its products
+    (both default to growth(scale)). Returns {file name: rows}.
+    """
+    if scale < 1:
+        raise ValueError("scale must be at least 1")
+    default_years, default_copies = growth(scale)
+    years = default_years if years is None else years
+    product_copies = default_copies if product_copies is None else product_copies
+    if years < 1 or product_copies < 1:
+        raise ValueError("years and product_copies must be at least 1")
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+
+    orders = _read_raw(os.path.join(data_dir, ORDERS_FILE))
+    items, starts, counts = _item_ranges(orders, _read_raw(os.path.join(data_dir, ITEMS_FILE)))
+    next_id = int(pc.max(pc.cast(orders["SALESORDERID"], pa.int64())).as_py()) + 1
+
+    total_orders = int(round(orders.num_rows * scale))
+    rows = {ORDERS_FILE: 0, ITEMS_FILE: 0}
+    orders_writer = _writer(os.path.join(out_dir, ORDERS_FILE), orders.schema)
+    items_writer = _writer(os.path.join(out_dir, ITEMS_FILE), items.schema)
+    try:
+        # The source data itself is the first "copy"
+        orders_writer.write_table(orders)
+        items_writer.write_table(items)
+        rows[ORDERS_FILE] += orders.num_rows
+        rows[ITEMS_FILE] += items.num_rows
+
+        remaining = total_orders - orders.num_rows
+        while remaining > 0:
+            n = min(remaining, chunk_orders)
+            picked = rng.integers(0, orders.num_rows, n)
+            ids = np.arange(next_id, next_id + n, dtype=np.int64)
+
+            # Item rows of each picked order, in order: starts[picked] + 0..counts[picked]-1
+            item_counts = counts[picked]
+            offsets = np.repeat(starts[picked] - np.cumsum(item_counts) + item_counts, item_counts)
+            item_rows = offsets + np.arange(item_counts.sum())
+
+            shift = -rng.integers(0, years, n)
+            item_shift = np.repeat(shift, item_counts)
+            copies = rng.integers(0, product_copies, len(item_rows))
+
+            orders_writer.write_table(_with_ids(_shifted(orders.take(picked), ORDER_DATE_COLUMNS, shift), ids))
+            chunk_items = _shifted(items.take(item_rows), ITEM_DATE_COLUMNS, item_shift)
+            items_writer.write_table(_with_ids(_with_products(chunk_items, copies), np.repeat(ids, item_counts)))
+            rows[ORDERS_FILE] += n
+            rows[ITEMS_FILE] += len(item_rows)
+            next_id += n
+            remaining -= n
+    finally:
+        orders_writer.close()
+        items_writer.close()
+
+    if product_copies > 1:
+        rows.update(_clone_products(data_dir, out_dir, product_copies))
+    for table_schema in TABLES.values():
+        if table_schema.source_file not in rows:
+            shutil.copyfile(os.path.join(data_dir, table_schema.source_file),
+                            os.path.join(out_dir, table_schema.source_file))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a scaled-out copy of the bike sales CSV files")
+    parser.add_argument("--scale", type=float, required=True, help="factor for SalesOrders/SalesOrderItems")
+    parser.add_argument("--out", required=True, help="output directory")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--years", type=int, help="spread copies over this many years (default: from the scale)")
+    parser.add_argument("--product-copies", type=int, help="clones per product (default: from the scale)")
+    args = parser.parse_args(argv)
+
+    counts = generate(args.data_dir, args.out, args.scale, args.seed, years=args.years,
+                      product_copies=args.product_copies)
+    for filename, count in counts.items():
+        print(f"{filename:<24} {count:>12,} rows")
+
+
+if __name__ == "__main__":
+    main()
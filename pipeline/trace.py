@@ -0,0 +1,224 @@
+"""Per-stage instrumentation of the notebook pipelines.
+
+A Tracer records one StageRecord per stage of a run: wall time, rows and
+bytes, the number of Spark jobs the stage started and the error if it
+failed. Stages are timed with tracer.stage(...) blocks, and the setup task
+graph is instrumented by wrapping its tasks with traced_tasks(), which
+names each stage after its task ("load:bronze_addresses" -> stage "load",
+target "bronze_addresses"). Rows and bytes are taken from the returned
+IngestResult / FetchResult, or from the commits the stage made to a table
+passed as table=.
+
+Spark jobs are counted through a job group per stage. Where the session
+has no SparkContext (serverless, Spark Connect) the count is left empty.
+
+A finished run is appended to a Delta run-history table with
+save_history() and exported with write_trace() in the Chrome trace event
+format, which chrome://tracing and https://ui.perfetto.dev display as a
+timeline with one lane per worker thread.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field, fields
+from datetime import datetime, timezone
+
+from pipeline.delta import commit_metrics_since, table_version
+from pipeline.scheduler import Task
+
+HISTORY_TABLE = "pipeline_run_history"
+
+HISTORY_DDL = """
+run_id STRING, run_name STRING, stage STRING, target STRING, status STRING,
+started_at TIMESTAMP, seconds DOUBLE, rows BIGINT, bytes BIGINT, spark_jobs INT,
+error STRING, thread STRING, extra STRING
+"""
+
+
+@dataclass
+class StageRecord:
+    """Measurements of one stage of one run"""
+    run_id: str
+    run_name: str
+    stage: str
+    target: str = None
+    status: str = "succeeded"  # succeeded / failed
+    started_at: datetime = None
+    seconds: float = 0.0
+    rows: int = None
+    bytes: int = None
+    spark_jobs: int = None
+    error: str = None
+    thread: str = None
+    extra: dict = field(default_factory=dict)
+    # perf_counter at the start, for the trace timeline only
+    _start: float = field(default=0.0, repr=False)
+
+
+def _spark_context(spark):
+    """The session's SparkContext, or None where job tracking is not available"""
+    if spark is None:
+        return None
+    try:
+        sc = spark.sparkContext
+        sc.statusTracker()
+        return sc
+    except Exception:
+        return None
+
+
+def _measure(record, value):
+    """Fill rows and bytes from a stage's return value when it carries them"""
+    if record.rows is None and isinstance(getattr(value, "rows", None), int):
+        record.rows = value.rows
+    if record.bytes is None and isinstance(getattr(value, "bytes", None), int):
+        record.bytes = value.bytes
+
+
+class Tracer:
+    """Collects the StageRecords of one run; safe to use from the task graph's worker threads"""
+
+    def __init__(self, spark=None, run_name="setup", run_id=None):
+        self.spark = spark
+        self.run_name = run_name
+        self.run_id = run_id or datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S-") + uuid.uuid4().hex[:6]
+        self.records = []
+        self._sc = _spark_context(spark)
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, stage, target=None, table=None):
+        """Time a block; the body may set rows, bytes and extra on the yielded record.
+
+        With table, rows and bytes not set by the body are summed over the
+        commits the stage made to that table.
+        """
+        record = StageRecord(self.run_id, self.run_name, stage, target or table,
+                             started_at=datetime.now(timezone.utc), thread=threading.current_thread().name)
+        before = None
+        if table is not None and self.spark is not None and self.spark.catalog.tableExists(table):
+            before = table_version(self.spark, table)
+        group = None
+        if self._sc is not None:
+            # Job groups are per thread, so parallel stages do not count each other's jobs
+            previous = (self._sc.getLocalProperty("spark.jobGroup.id"),
+                        self._sc.getLocalProperty("spark.job.description"))
+            group = f"{self.run_id}:{stage}:{target or table or ''}:{uuid.uuid4().hex[:6]}"
+            self._sc.setJobGroup(group, f"{stage} {target or table or ''}".strip())
+        record._start = time.perf_counter()
+        try:
+            try:
+                yield record
+            finally:
+                record.seconds = time.perf_counter() - record._start
+                if group is not None:
+                    try:
+                        record.spark_jobs = len(self._sc.statusTracker().getJobIdsForGroup(group))
+                    finally:
+                        self._sc.setLocalProperty("spark.jobGroup.id", previous[0])
+                        self._sc.setLocalProperty("spark.job.description", previous[1])
+            # After the job group is restored, so the history lookup is not counted as the stage's jobs
+            if table is not None and self.spark is not None and (record.rows is None or record.bytes is None):
+                metrics = commit_metrics_since(self.spark, table, before)
+                record.rows = metrics["rows"] if record.rows is None else record.rows
+                record.bytes = metrics["bytes"] if record.bytes is None else record.bytes
+        except Exception as e:
+            record.status = "failed"
+            record.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            with self._lock:
+                self.records.append(record)
+
+    def call(self, stage, fn, target=None):
+        """Run fn() as a stage and return its value, measuring rows/bytes from it"""
+        with self.stage(stage, target) as record:
+            value = fn()
+            _measure(record, value)
+        return value
+
+    def summary(self):
+        """Totals per stage name: [{stage, count, failed, seconds, rows, bytes, spark_jobs}]"""
+        totals = {}
+        for r in self.records:
+            t = totals.setdefault(r.stage, {"stage": r.stage, "count": 0, "failed": 0, "seconds": 0.0,
+                                            "rows": 0, "bytes": 0, "spark_jobs": 0})
+            t["count"] += 1
+            t["failed"] += r.status != "succeeded"
+            t["seconds"] += r.seconds
+            t["rows"] += r.rows or 0
+            t["bytes"] += r.bytes or 0
+            t["spark_jobs"] += r.spark_jobs or 0
+        return list(totals.values())
+
+    def print_summary(self):
+        """Print stage totals (seconds are summed over parallel tasks) and the run's wall time"""
+        header = f"{'stage':<16} {'count':>5} {'failed':>6} {'seconds':>9} {'rows':>12} {'bytes':>14} {'jobs':>6}"
+        print(header)
+        print("-" * len(header))
+        for t in self.summary():
+            print(f"{t['stage']:<16} {t['count']:>5} {t['failed']:>6} {t['seconds']:>9.1f} {t['rows']:>12,} "
+                  f"{t['bytes']:>14,} {t['spark_jobs']:>6}")
+        print(f"run {self.run_id}: {time.perf_counter() - self._origin:.1f}s wall time")
+
+    def history_rows(self):
+        """Records as plain dicts for the run-history table"""
+        rows = []
+        for r in self.records:
+            row = {f.name: getattr(r, f.name) for f in fields(r) if not f.name.startswith("_")}
+            row["extra"] = json.dumps(r.extra, ensure_ascii=False, default=str) if r.extra else None
+            rows.append(row)
+        return rows
+
+    def save_history(self, spark=None, table=HISTORY_TABLE):
+        """Append this run's records to the run-history Delta table"""
+        spark = spark or self.spark
+        rows = self.history_rows()
+        if not rows:
+            return 0
+        spark.createDataFrame(rows, schema=HISTORY_DDL).write.mode("append").saveAsTable(table)
+        return len(rows)
+
+    def trace_events(self):
+        """Records as Chrome trace events: one complete event per stage, one lane per thread"""
+        lanes = {}
+        events = []
+        for r in sorted(self.records, key=lambda r: r._start):
+            tid = lanes.setdefault(r.thread, len(lanes) + 1)
+            args = {k: v for k, v in asdict(r).items()
+                    if k in ("target", "status", "rows", "bytes", "spark_jobs", "error") and v is not None}
+            args.update(r.extra)
+            events.append({
+                "name": f"{r.stage} {r.target}" if r.target else r.stage,
+                "cat": r.stage,
+                "ph": "X",
+                "ts": round((r._start - self._origin) * 1e6),
+                "dur": round(r.seconds * 1e6),
+                "pid": 1,
+                "tid": tid,
+                "args": args,
+            })
+        events.extend({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": thread}}
+                      for thread, tid in lanes.items())
+        return events
+
+    def write_trace(self, path):
+        """Write the run as a Chrome trace file and return its path"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": self.trace_events(),
+                       "otherData": {"run_id": self.run_id, "run_name": self.run_name}},
+                      f, ensure_ascii=False, default=str)
+        return path
+
+
+def traced_tasks(tracer, tasks):
+    """Wrap setup tasks so each runs as a stage named after its task ("load:table" -> load, table)"""
+    def wrap(task):
+        stage, _, target = task.name.partition(":")
+        return Task(task.name, lambda: tracer.call(stage, task.fn, target or None), task.deps)
+    return [wrap(task) for task in tasks]
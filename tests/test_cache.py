@@ -0,0 +1,76 @@
+import threading
+
+import pandas as pd
+
+from pipeline.cache import TableFunctionCache
+
+
+class _Result:
+    def __init__(self, frame=None, version=None):
+        self.frame = frame
+        self.version = version
+
+    def first(self):
+        return {"version": self.version}
+
+    def toPandas(self):
+        return self.frame
+
+
+class _Spark:
+    """Answers DESCRIBE HISTORY with a settable version, blocking while gate is cleared"""
+
+    def __init__(self):
+        self.version = 1
+        self.gate = threading.Event()
+        self.gate.set()
+        self.history_calls = 0
+        self.queries = 0
+
+    def sql(self, statement, args=None):
+        if statement.startswith("DESCRIBE HISTORY"):
+            self.history_calls += 1
+            self.gate.wait(5)
+            return _Result(version=self.version)
+        self.queries += 1
+        return _Result(frame=pd.DataFrame({"args": [tuple(args.values())], "version": [self.version]}))
+
+
+def test_hits_and_invalidation():
+    spark = _Spark()
+    cache = TableFunctionCache(spark, "f", ["t"], version_check_interval=0)
+    assert cache("2023-01", "2023-03")["version"].tolist() == [1]
+    cache("2023-01", "2023-03")
+    assert spark.queries == 1 and cache.stats().hits == 1
+
+    spark.version = 2
+    assert cache("2023-01", "2023-03")["version"].tolist() == [2]
+    assert spark.queries == 2 and cache.stats().invalidations == 1
+
+
+def test_versions_are_checked_at_most_every_interval():
+    spark = _Spark()
+    cache = TableFunctionCache(spark, "f", ["t"], version_check_interval=60)
+    for _ in range(10):
+        cache("2023-01", "2023-03")
+    assert spark.history_calls == 1
+
+
+def test_hits_do_not_wait_for_a_running_version_check():
+    spark = _Spark()
+    cache = TableFunctionCache(spark, "f", ["t"], version_check_interval=0)
+    cache("2023-01", "2023-03")
+
+    spark.gate.clear()
+    checker = threading.Thread(target=cache, args=("2023-04", "2023-06"))
+    checker.start()
+    while spark.history_calls < 2:
+        pass
+    # The check is blocked in DESCRIBE HISTORY; a hit still returns straight away
+    hit = threading.Thread(target=cache, args=("2023-01", "2023-03"))
+    hit.start()
+    hit.join(1)
+    assert not hit.is_alive()
+    spark.gate.set()
+    checker.join(5)
+    assert cache.stats().hits == 1
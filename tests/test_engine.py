@@ -0,0 +1,74 @@
+import shutil
+
+import pandas as pd
+import pytest
+
+from pipeline.engine import LocalEngine, compare_frames
+from pipeline.features import FEATURE_SELECT, ITEMS_TABLE, ORDERS_TABLE
+from pipeline.schemas import TABLES
+
+KEY = ["REGION", "PRODUCTID", "FISCAL_YEAR_MONTH"]
+
+
+@pytest.fixture(scope="module")
+def data_dir(tmp_path_factory):
+    """The sample data plus an order whose CREATEDAT is not a valid date"""
+    path = tmp_path_factory.mktemp("data")
+    for table in (ORDERS_TABLE, ITEMS_TABLE):
+        shutil.copy(f"data/{TABLES[table].source_file}", path)
+    with open(path / TABLES[ORDERS_TABLE].source_file, "a", encoding="utf-8") as f:
+        f.write("599999999,4,20231341,4,20231341,K4,2018001,,100000022,APJ,USD,100,87.5,12.5,C,C,C\n")
+    with open(path / TABLES[ITEMS_TABLE].source_file, "a", encoding="utf-8") as f:
+        f.write("599999999,10,HT-1000,,USD,100,87.5,12.5,I,,1,EA,20231341\n")
+    return path
+
+
+def _pandas_feature(data_dir):
+    """feature_sales_by_product computed with plain pandas, independently of LocalEngine"""
+    orders = pd.read_csv(data_dir / TABLES[ORDERS_TABLE].source_file, dtype=str, keep_default_na=False)
+    items = pd.read_csv(data_dir / TABLES[ITEMS_TABLE].source_file, dtype=str, keep_default_na=False)
+    # try_to_date: text that is not a valid yyyyMMdd date becomes NULL
+    created = pd.to_datetime(orders["CREATEDAT"], format="%Y%m%d", errors="coerce")
+    orders = pd.DataFrame({
+        "SALESORDERID": orders["SALESORDERID"].astype(int),
+        "REGION": orders["SALESORG"],
+        "FISCAL_YEAR_MONTH": [None if pd.isna(d) else d.date().replace(day=1) for d in created],
+    })
+    items = pd.DataFrame({
+        "SALESORDERID": items["SALESORDERID"].astype(int),
+        "PRODUCTID": items["PRODUCTID"],
+        "NETAMOUNT": items["NETAMOUNT"].astype(float),
+    })
+    lines = orders.merge(items, on="SALESORDERID")
+    return (lines.groupby(KEY, dropna=False)["NETAMOUNT"].sum()
+            .rename("TOTAL_NETAMOUNT").reset_index())
+
+
+def test_local_feature_and_report_match_pandas(data_dir):
+    engine = LocalEngine(str(data_dir))
+    expected = _pandas_feature(data_dir)
+    feature = engine.feature_sales_by_product()
+    assert compare_frames(feature, expected, KEY) == []
+
+    # The order with an invalid date lands in a NULL month, like try_to_date in Spark
+    undated = feature[feature["FISCAL_YEAR_MONTH"].isna()]
+    assert undated["TOTAL_NETAMOUNT"].tolist() == [87.5]
+
+    report = engine.sales_report("2023-01", "2023-12")
+    dated = expected[expected["FISCAL_YEAR_MONTH"].notna()]
+    in_range = dated[dated["FISCAL_YEAR_MONTH"].map(lambda d: d.year == 2023)]
+    assert len(report) == len(in_range)
+    assert report["TOTAL_NETAMOUNT"].sum() == pytest.approx(in_range["TOTAL_NETAMOUNT"].sum())
+    assert set(report["FISCAL_YEAR_MONTH"]) == {f"2023-{m:02d}" for m in range(1, 13)}
+
+
+def test_local_feature_matches_spark(spark, data_dir):
+    from pipeline.ingest import read_csv
+
+    views = {table: f"engine_{table}" for table in (ORDERS_TABLE, ITEMS_TABLE)}
+    for table, view in views.items():
+        read_csv(spark, str(data_dir / TABLES[table].source_file), TABLES[table]).createOrReplaceTempView(view)
+    spark_feature = spark.sql(FEATURE_SELECT.format(
+        orders=views[ORDERS_TABLE], items=views[ITEMS_TABLE], where="")).toPandas()
+
+    assert compare_frames(spark_feature, LocalEngine(str(data_dir)).feature_sales_by_product(), KEY) == []
@@ -0,0 +1,37 @@
+import datetime as dt
+
+import pyarrow as pa
+
+from pipeline.export import load_manifest, load_training_set, write_snapshot
+
+
+def _rows(amounts):
+    months = [dt.date(2024, m, 1) for m in range(1, len(amounts) + 1)]
+    return pa.table({
+        "REGION": ["AMER"] * len(amounts),
+        "PRODUCTID": ["HT-1000"] * len(amounts),
+        "FISCAL_YEAR_MONTH": pa.array(months, pa.date32()),
+        "TOTAL_NETAMOUNT": pa.array(amounts, pa.float64()),
+    })
+
+
+def _export(out_dir, version, amounts):
+    data = _rows(amounts)
+    fingerprints = {f"2024-{i + 1:02d}": f"1-{a}" for i, a in enumerate(amounts)}
+    return write_snapshot(str(out_dir), "test", version, fingerprints, lambda labels: data, compression=None)
+
+
+def test_only_changed_months_are_written(tmp_path):
+    assert _export(tmp_path, 1, [1.0, 2.0])["exported_months"] == ["2024-01", "2024-02"]
+    assert _export(tmp_path, 2, [1.0, 3.0])["exported_months"] == ["2024-02"]
+    assert load_training_set(str(tmp_path), 1)["TOTAL_NETAMOUNT"].to_pylist() == [1.0, 2.0]
+    assert load_training_set(str(tmp_path))["TOTAL_NETAMOUNT"].to_pylist() == [1.0, 3.0]
+
+
+def test_exporting_an_older_version_keeps_latest(tmp_path):
+    _export(tmp_path, 5, [1.0, 2.0])
+    _export(tmp_path, 3, [1.0])
+    assert load_manifest(str(tmp_path))["version"] == 5
+    assert load_manifest(str(tmp_path), 3)["rows"] == 1
+    _export(tmp_path, 6, [1.0, 2.0, 4.0])
+    assert load_manifest(str(tmp_path))["version"] == 6
@@ -0,0 +1,152 @@
+import json
+import os
+import threading
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from pipeline.fetch import MANIFEST_NAME, CsvFetcher, download_csv_files
+
+LAST_MODIFIED = formatdate(1_700_000_000, usegmt=True)
+
+
+class _Server:
+    """Serves files from a dict, honouring conditional requests and injected failures"""
+
+    def __init__(self):
+        self.files = {}  # filename -> (body, etag or None, last_modified or None)
+        self.failures = {}  # filename -> status codes to return before serving the file
+        self.truncated = set()  # filenames whose body is cut off mid-response
+        self.requests = []  # (filename, headers)
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                name = self.path.lstrip("/")
+                server.requests.append((name, dict(self.headers)))
+                if server.failures.get(name):
+                    self.send_response(server.failures[name].pop(0))
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                if name not in server.files:
+                    self.send_error(404)
+                    return
+                body, etag, last_modified = server.files[name]
+                if (etag and self.headers.get("If-None-Match") == etag) or \
+                        (not etag and last_modified and self.headers.get("If-Modified-Since") == last_modified):
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(body)))
+                if etag:
+                    self.send_header("ETag", etag)
+                if last_modified:
+                    self.send_header("Last-Modified", last_modified)
+                self.end_headers()
+                self.wfile.write(body[:len(body) // 2] if name in server.truncated else body)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def count(self, filename):
+        return sum(name == filename for name, _ in self.requests)
+
+
+@pytest.fixture
+def server():
+    server = _Server()
+    server.thread.start()
+    yield server
+    server.httpd.shutdown()
+    server.httpd.server_close()
+
+
+def _fetch(server, dest, filenames, retries=2):
+    return {r.filename: r for r in download_csv_files(filenames, server.url, str(dest), retries=retries,
+                                                      backoff_factor=0)}
+
+
+def _manifest(dest):
+    with open(dest / MANIFEST_NAME, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_download_then_not_modified(server, tmp_path):
+    server.files["A.csv"] = (b"a,b\n1,2\n", '"v1"', None)
+    server.files["B.csv"] = (b"c\n3\n", None, LAST_MODIFIED)
+
+    first = _fetch(server, tmp_path, ["A.csv", "B.csv"])
+    assert {r.status for r in first.values()} == {"downloaded"}
+    assert (tmp_path / "A.csv").read_bytes() == b"a,b\n1,2\n"
+    assert _manifest(tmp_path)["A.csv"]["etag"] == '"v1"'
+    assert _manifest(tmp_path)["B.csv"]["last_modified"] == LAST_MODIFIED
+
+    mtimes = {name: os.stat(tmp_path / name).st_mtime_ns for name in ("A.csv", "B.csv")}
+    second = _fetch(server, tmp_path, ["A.csv", "B.csv"])
+    assert {r.status for r in second.values()} == {"not_modified"}
+    assert {name: os.stat(tmp_path / name).st_mtime_ns for name in mtimes} == mtimes
+    headers = {name: h for name, h in server.requests[-2:]}
+    assert headers["A.csv"]["If-None-Match"] == '"v1"'
+    assert headers["B.csv"]["If-Modified-Since"] == LAST_MODIFIED
+    assert _manifest(tmp_path)["A.csv"]["sha256"] == first["A.csv"].entry["sha256"]
+
+
+def test_changed_file_is_downloaded_again(server, tmp_path):
+    server.files["A.csv"] = (b"old\n", '"v1"', None)
+    _fetch(server, tmp_path, ["A.csv"])
+    server.files["A.csv"] = (b"new\n", '"v2"', None)
+
+    result = _fetch(server, tmp_path, ["A.csv"])["A.csv"]
+    assert result.status == "downloaded"
+    assert (tmp_path / "A.csv").read_bytes() == b"new\n"
+    assert _manifest(tmp_path)["A.csv"]["etag"] == '"v2"'
+
+
+@pytest.mark.parametrize("status", [404, 500])
+def test_error_keeps_previous_copy_and_manifest(server, tmp_path, status):
+    server.files["A.csv"] = (b"good\n", '"v1"', None)
+    _fetch(server, tmp_path, ["A.csv"])
+    before = _manifest(tmp_path)
+
+    if status == 404:
+        del server.files["A.csv"]
+    else:
+        server.failures["A.csv"] = [status] * 10
+    results = _fetch(server, tmp_path, ["A.csv", "Missing.csv"])
+
+    assert results["A.csv"].status == "failed" and results["A.csv"].error
+    assert results["Missing.csv"].status == "failed"
+    assert (tmp_path / "A.csv").read_bytes() == b"good\n"
+    assert _manifest(tmp_path) == before
+    assert not [p for p in os.listdir(tmp_path) if p.endswith((".part", ".tmp"))]
+
+
+def test_truncated_download_leaves_no_partial_file(server, tmp_path):
+    server.files["A.csv"] = (b"x" * 4096, '"v1"', None)
+    server.truncated.add("A.csv")
+
+    result = _fetch(server, tmp_path, ["A.csv"], retries=0)["A.csv"]
+    assert result.status == "failed"
+    assert os.listdir(tmp_path) == [MANIFEST_NAME]
+    assert _manifest(tmp_path) == {}
+
+
+def test_retries_transient_errors(server, tmp_path):
+    server.files["A.csv"] = (b"a\n", '"v1"', None)
+    server.failures["A.csv"] = [503, 502]
+
+    with CsvFetcher(server.url, str(tmp_path), retries=2, backoff_factor=0) as fetcher:
+        assert fetcher.fetch("A.csv").status == "downloaded"
+    assert server.count("A.csv") == 3
+
+    server.failures["A.csv"] = [503, 503, 503]
+    with CsvFetcher(server.url, str(tmp_path), retries=2, backoff_factor=0) as fetcher:
+        assert fetcher.fetch("A.csv").status == "failed"
+    assert server.count("A.csv") == 6
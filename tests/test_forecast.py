@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+from pipeline.forecast import fit_holt, forecast_holt, forecast_series, update_holt
+
+
+def _feature(values, start="2023-01-01", regions=("APJ", "EMEA")):
+    months = pd.date_range(start, periods=len(values), freq="MS")
+    return pd.DataFrame([
+        {"REGION": region, "FISCAL_YEAR_MONTH": month.date(), "TOTAL_NETAMOUNT": value * (i + 1)}
+        for i, region in enumerate(regions) for month, value in zip(months, values)
+    ])
+
+
+def test_fit_holt_recovers_a_linear_series():
+    y = np.array([[10.0 + 5.0 * t for t in range(12)], [100.0 - 2.0 * t for t in range(12)]])
+    state = fit_holt(y)
+
+    np.testing.assert_allclose(state.sse, 0.0, atol=1e-9)
+    mean, lower, upper = forecast_holt(state, 3)
+    np.testing.assert_allclose(mean, [[70.0, 75.0, 80.0], [76.0, 74.0, 72.0]])
+    np.testing.assert_allclose(lower, mean)
+    np.testing.assert_allclose(upper, mean)
+
+
+def test_update_holt_matches_a_fit_over_all_months():
+    rng = np.random.default_rng(0)
+    y = 100.0 + np.cumsum(rng.normal(2.0, 5.0, size=(4, 20)), axis=1)
+    alphas, betas = np.array([0.4]), np.array([0.2])
+
+    updated = update_holt(fit_holt(y[:, :15], alphas, betas), y[:, 15:])
+    full = fit_holt(y, alphas, betas)
+
+    for name in ("level", "trend", "sse", "n"):
+        np.testing.assert_allclose(getattr(updated, name), getattr(full, name))
+    assert updated.months_since_fit.tolist() == [5] * 4
+
+
+def test_forecast_holt_bounds_widen_with_the_horizon():
+    rng = np.random.default_rng(1)
+    y = 1000.0 + np.cumsum(rng.normal(10.0, 50.0, size=(3, 24)), axis=1)
+    mean, lower, upper = forecast_holt(fit_holt(y), 6)
+
+    width = upper - lower
+    assert (lower <= mean).all() and (mean <= upper).all()
+    assert (np.diff(width, axis=1) > 0).all()
+
+
+def test_forecast_series_updates_new_months_and_refits_rewritten_ones():
+    values = [100.0 + 3.0 * t + (-1) ** t for t in range(18)]
+    _, state, counts = forecast_series(_feature(values[:15]), ["REGION"])
+    assert counts == {"fitted": 2, "updated": 0}
+
+    feature = _feature(values)
+    forecast, updated, counts = forecast_series(feature, ["REGION"], horizon=2, previous_state=state,
+                                                changed_months={"2024-04", "2024-05", "2024-06"})
+    assert counts == {"fitted": 0, "updated": 2}
+    assert updated["N"].tolist() == [16, 16]
+    assert updated["FITTED_THROUGH"].astype(str).tolist() == ["2024-06-01"] * 2
+    assert forecast["FISCAL_YEAR_MONTH"].astype(str).tolist() == ["2024-07-01", "2024-08-01"] * 2
+
+    _, _, counts = forecast_series(feature, ["REGION"], previous_state=state, changed_months={"2023-06"})
+    assert counts == {"fitted": 2, "updated": 0}
+
+    # Unknown changes (e.g. no recorded versions) never reuse the state
+    _, _, counts = forecast_series(feature, ["REGION"], previous_state=state, changed_months=None)
+    assert counts == {"fitted": 2, "updated": 0}
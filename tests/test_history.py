@@ -0,0 +1,27 @@
+import datetime as dt
+
+import pandas as pd
+import pytest
+
+from pipeline.history import MAX_DATE, MIN_DATE, as_of_join_local
+
+
+@pytest.mark.parametrize("as_dates", [True, False])
+def test_as_of_join_local_with_open_ended_versions(as_dates):
+    bounds = [MIN_DATE, "2023-06-01", "2023-06-01", MAX_DATE]
+    if as_dates:
+        bounds = [dt.date.fromisoformat(d) for d in bounds]
+    history = pd.DataFrame({
+        "PRODUCTID": ["HT-1000", "HT-1000"],
+        "PRODCATEGORYID": ["NB", "LT"],
+        "VALID_FROM": [bounds[0], bounds[2]],
+        "VALID_TO": [bounds[1], bounds[3]],
+    })
+    facts = pd.DataFrame({
+        "PRODUCTID": ["HT-1000", "HT-1000", "HT-9999"],
+        "CREATEDAT": [dt.date(2023, 1, 15), dt.date(2024, 3, 1), dt.date(2023, 1, 15)],
+    })
+
+    joined = as_of_join_local(facts, history, "bronze_products", columns=["PRODCATEGORYID"])
+    assert joined["PRODUCTS_PRODCATEGORYID"].tolist()[:2] == ["NB", "LT"]
+    assert pd.isna(joined["PRODUCTS_PRODCATEGORYID"].iloc[2])
@@ -0,0 +1,32 @@
+import re
+
+from pipeline.integrity import check_integrity, integrity_checks, integrity_sql
+
+TABLES = ["bronze_products", "bronze_productcategories"]
+
+
+def test_each_table_is_read_once():
+    sql = integrity_sql(integrity_checks(), "workspace.default")
+    sources = re.findall(r"\bFROM (workspace\.default\.\w+)", sql)
+    assert sorted(sources) == sorted(set(sources))
+    assert len(sources) == 9
+
+
+def test_check_integrity(spark):
+    spark.createDataFrame(
+        [("LT", 1), ("PC", 1), ("PC", 2), (None, 3)],
+        "PRODCATEGORYID STRING, CREATEDBY INT",
+    ).createOrReplaceTempView("bronze_productcategories")
+    spark.createDataFrame(
+        [("LT-1001", "LT"), ("LT-1002", "LT"), ("XX-1001", "XX"), ("XX-1002", "XX"), ("NO-1001", None)],
+        "PRODUCTID STRING, PRODCATEGORYID STRING",
+    ).createOrReplaceTempView("bronze_products")
+
+    found = {v.constraint: v for v in check_integrity(spark, tables=TABLES)}
+    assert found["pk_bronze_productcategories"].count == 1
+    assert found["pk_bronze_productcategories"].samples == [{"PRODCATEGORYID": "PC"}]
+    assert found["pk_bronze_productcategories_not_null"].count == 1
+    assert found["pk_bronze_products"].count == 0
+    # Two orphan rows with one key; the NULL category is not a violation
+    assert found["fk_products_category"].count == 2
+    assert found["fk_products_category"].samples == [{"PRODCATEGORYID": "XX"}]
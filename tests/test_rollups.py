@@ -0,0 +1,33 @@
+from pipeline.rollups import DIMENSIONS, GROUPING_LEVELS, grouping_id, grouping_id_sql, grouping_sets_sql
+
+
+def test_grouping_ids_are_distinct():
+    assert len({grouping_id(level) for level in GROUPING_LEVELS}) == len(GROUPING_LEVELS)
+    assert grouping_id(DIMENSIONS) == 0
+    assert grouping_id(()) == (1 << len(DIMENSIONS)) - 1
+
+
+def test_grouping_id_sql_matches_helper(spark):
+    spark.createDataFrame(
+        [("AMER", "LT", "LT-1001", "2024-01-01", 10.0),
+         ("AMER", "LT", "LT-1002", "2024-01-01", 20.0),
+         ("EMEA", "PC", "PC-1001", "2024-02-01", 30.0)],
+        "REGION STRING, PRODCATEGORYID STRING, PRODUCTID STRING, FISCAL_YEAR_MONTH STRING, NETAMOUNT DOUBLE",
+    ).createOrReplaceTempView("rollup_lines")
+    rows = spark.sql(f"""
+    SELECT REGION, PRODCATEGORYID, PRODUCTID, FISCAL_YEAR_MONTH,
+      {grouping_id_sql()} AS GROUPING_ID, SUM(NETAMOUNT) AS TOTAL_NETAMOUNT
+    FROM rollup_lines
+    GROUP BY GROUPING SETS ({grouping_sets_sql()})
+    """).collect()
+
+    by_level = {}
+    for r in rows:
+        # The sample has no NULL dimensions, so a NULL marks an aggregated-away column
+        level = tuple(d for d in DIMENSIONS if r[d] is not None)
+        assert r["FISCAL_YEAR_MONTH"] is not None
+        assert r["GROUPING_ID"] == grouping_id(level)
+        by_level.setdefault(level, 0.0)
+        by_level[level] += r["TOTAL_NETAMOUNT"]
+    assert set(by_level) == set(GROUPING_LEVELS)
+    assert all(total == 60.0 for total in by_level.values())
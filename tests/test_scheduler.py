@@ -0,0 +1,107 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from pipeline.scheduler import Task, run_dag
+from pipeline.schemas import FOREIGN_KEYS, TABLES
+from pipeline.setup import build_setup_tasks
+
+
+def _recording(log, name, seconds=0.0, error=None):
+    def fn():
+        log.append(("start", name, time.monotonic()))
+        time.sleep(seconds)
+        log.append(("end", name, time.monotonic()))
+        if error:
+            raise RuntimeError(error)
+        return name
+    return fn
+
+
+def _times(log, event):
+    return {name: at for kind, name, at in log if kind == event}
+
+
+def test_dependencies_run_first_and_independent_tasks_in_parallel():
+    log = []
+    results = run_dag([
+        Task("a", _recording(log, "a", 0.2)),
+        Task("b", _recording(log, "b", 0.2)),
+        Task("c", _recording(log, "c"), ("a", "b")),
+    ])
+    assert {r.status for r in results.values()} == {"succeeded"}
+    assert results["c"].value == "c"
+    start, end = _times(log, "start"), _times(log, "end")
+    assert start["c"] >= max(end["a"], end["b"])
+    # a and b overlap
+    assert start["b"] < end["a"] and start["a"] < end["b"]
+
+
+def test_failure_skips_downstream_and_keeps_other_branches_running():
+    log = []
+    results = run_dag([
+        Task("bad", _recording(log, "bad", error="boom")),
+        Task("child", _recording(log, "child"), ("bad",)),
+        Task("grandchild", _recording(log, "grandchild"), ("child",)),
+        Task("other", _recording(log, "other", 0.1)),
+        Task("other_child", _recording(log, "other_child"), ("other",)),
+    ])
+    assert results["bad"].status == "failed" and results["bad"].error == "boom"
+    assert results["child"].status == "skipped" and "bad" in results["child"].error
+    assert results["grandchild"].status == "skipped"
+    assert results["other"].status == results["other_child"].status == "succeeded"
+    assert "child" not in _times(log, "start")
+
+
+def test_unknown_dependency_and_cycle_are_rejected():
+    with pytest.raises(ValueError, match="unknown task missing"):
+        run_dag([Task("a", lambda: 1, ("missing",))])
+    with pytest.raises(ValueError, match="cycle"):
+        run_dag([Task("a", lambda: 1, ("c",)), Task("b", lambda: 1, ("a",)), Task("c", lambda: 1, ("b",))])
+
+
+def test_parallelism_is_bounded_by_max_workers():
+    running, peak, lock = [0], [0], threading.Lock()
+
+    def fn():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+
+    run_dag([Task(str(i), fn) for i in range(6)], max_workers=2)
+    assert peak[0] == 2
+
+
+def test_setup_foreign_keys_wait_for_referenced_primary_keys():
+    files = [t.source_file for t in TABLES.values()]
+    tasks = {t.name: t for t in build_setup_tasks(None, "workspace", "default", files,
+                                                  SimpleNamespace(dest_dir="/tmp"), lambda path, table: True)}
+
+    for fk in FOREIGN_KEYS:
+        task = tasks[f"fk:{fk.table}"]
+        assert f"pk:{fk.ref_table}" in task.deps
+        owner = TABLES[fk.table]
+        assert (f"pk:{fk.table}" if owner.primary_key else f"not_null:{fk.table}") in task.deps
+    # Every table's chain runs download -> load -> dates in order
+    for table_schema in TABLES.values():
+        assert tasks[f"load:{table_schema.table}"].deps == (f"download:{table_schema.source_file}",)
+        assert tasks[f"dates:{table_schema.table}"].deps == (f"load:{table_schema.table}",)
+
+
+def test_setup_drops_foreign_keys_to_missing_tables():
+    tasks = build_setup_tasks(None, "workspace", "default", ["Products.csv", "ProductCategories.csv"],
+                              SimpleNamespace(dest_dir="/tmp"), lambda path, table: True)
+    fk_tasks = [t for t in tasks if t.name.startswith("fk:")]
+    assert [t.name for t in fk_tasks] == ["fk:bronze_products"]
+    assert set(fk_tasks[0].deps) == {"pk:bronze_products", "pk:bronze_productcategories"}
+
+
+def test_setup_declares_not_null_key_columns():
+    tasks = {t.name: t for t in build_setup_tasks(None, "workspace", "default", ["SalesOrderItems.csv"],
+                                                  SimpleNamespace(dest_dir="/tmp"), lambda path, table: True)}
+    assert tasks["not_null:bronze_salesorderitems"].deps == ("dates:bronze_salesorderitems",)
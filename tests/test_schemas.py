@@ -0,0 +1,29 @@
+import datetime as dt
+
+from pipeline.engine import read_csv_arrow
+from pipeline.schemas import TABLES, not_null_ddl, primary_key_ddl
+
+
+def test_key_columns_are_declared_not_null():
+    assert not_null_ddl(TABLES["bronze_salesorderitems"]) == [
+        "ALTER TABLE bronze_salesorderitems ALTER COLUMN SALESORDERID SET NOT NULL",
+        "ALTER TABLE bronze_salesorderitems ALTER COLUMN SALESORDERITEM SET NOT NULL",
+    ]
+    assert primary_key_ddl(TABLES["bronze_salesorders"])[0] == \
+        "ALTER TABLE bronze_salesorders ALTER COLUMN SALESORDERID SET NOT NULL"
+    for table_schema in TABLES.values():
+        assert set(table_schema.key) <= set(table_schema.not_null_columns)
+
+
+def test_open_end_dates_are_kept(tmp_path):
+    path = tmp_path / "Employees.csv"
+    header = ",".join(TABLES["bronze_employees"].column_names)
+    values = ["1", "", "", "", "", "", "", "", "", "", "1000000001"]
+    rows = [values + [start, end] + [""] * 6
+            for start, end in [("20050101", "100041231"), ("20050101", "20231301"), ("20050101", "")]]
+    path.write_text("\n".join([header, *[",".join(r) for r in rows]]) + "\n", encoding="utf-8")
+
+    table = read_csv_arrow(str(path), TABLES["bronze_employees"])
+    # The open_end marker becomes the open-end date, other invalid text and empty fields NULL
+    assert table["VALIDITY_ENDDATE"].to_pylist() == [dt.date(9999, 12, 31), None, None]
+    assert table["VALIDITY_STARTDATE"].to_pylist() == [dt.date(2005, 1, 1)] * 3
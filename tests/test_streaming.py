@@ -0,0 +1,84 @@
+import os
+
+import pytest
+
+pytest.importorskip("pyspark")
+
+from pipeline.features import ORDERS_TABLE  # noqa: E402
+from pipeline.ingest import ingest_csv_incremental, ingest_csv_overwrite  # noqa: E402
+from pipeline.schemas import TABLES  # noqa: E402
+from pipeline.streaming import start_sales_streams  # noqa: E402
+
+HEADER = ",".join(TABLES[ORDERS_TABLE].column_names)
+
+
+def _order(order_id, net_amount):
+    return f"{order_id},4,20230111,4,20230116,K4,2018001,,100000022,APJ,USD,13587,{net_amount},1698.375,C,C,C"
+
+
+def _write_extract(path, rows, mtime):
+    path.write_text("\n".join([HEADER, *rows]) + "\n", encoding="utf-8")
+    os.utime(path, (mtime, mtime))
+
+
+def test_local_directory_stream_keeps_newest_extract(spark, tmp_path):
+    data = tmp_path / "data"
+    data.mkdir()
+    # The newer extract sorts first by name, so only the modification time can pick it
+    _write_extract(data / "SalesOrders_a.csv", [_order(500000000, 200.0), _order(500000001, 10.0)], 1_700_000_100)
+    _write_extract(data / "SalesOrders_b.csv", [_order(500000000, 100.0)], 1_700_000_000)
+
+    queries = start_sales_streams(spark, "spark_catalog.default", str(data), str(tmp_path / "schemas"),
+                                  str(tmp_path / "checkpoints"), auto_loader=False, refresh=False,
+                                  tables=(ORDERS_TABLE,))
+    try:
+        for query in queries:
+            query.awaitTermination()
+        rows = {r["SALESORDERID"]: r["NETAMOUNT"]
+                for r in spark.table(f"spark_catalog.default.{ORDERS_TABLE}").collect()}
+    finally:
+        spark.sql(f"DROP TABLE IF EXISTS spark_catalog.default.{ORDERS_TABLE}")
+    assert rows == {500000000: 200.0, 500000001: 10.0}
+
+
+def _run_streams(spark, tmp_path, data):
+    queries = start_sales_streams(spark, "spark_catalog.default", str(data), str(tmp_path / "schemas"),
+                                  str(tmp_path / "checkpoints"), auto_loader=False, refresh=False,
+                                  tables=(ORDERS_TABLE,))
+    for query in queries:
+        query.awaitTermination()
+
+
+def _orders(spark):
+    return {r["SALESORDERID"]: r["NETAMOUNT"] for r in spark.table(f"spark_catalog.default.{ORDERS_TABLE}").collect()}
+
+
+@pytest.mark.parametrize("incremental", [False, True])
+def test_setup_after_streaming_keeps_streamed_rows(spark, tmp_path, incremental):
+    data = tmp_path / "data"
+    data.mkdir()
+    table_schema = TABLES[ORDERS_TABLE]
+    snapshot = data / table_schema.source_file
+
+    def setup():
+        spark.sql("USE spark_catalog.default")
+        if incremental:
+            ingest_csv_incremental(spark, str(snapshot), table_schema, extracts=True)
+        else:
+            ingest_csv_overwrite(spark, str(snapshot), table_schema, extracts=True)
+
+    try:
+        _write_extract(snapshot, [_order(500000000, 100.0), _order(500000002, 30.0)], 1_700_000_000)
+        setup()
+        _write_extract(data / "SalesOrders_0001.csv", [_order(500000000, 150.0), _order(500000001, 10.0)],
+                       1_700_000_100)
+        _run_streams(spark, tmp_path, data)
+        assert _orders(spark) == {500000000: 150.0, 500000001: 10.0, 500000002: 30.0}
+
+        # The snapshot is downloaded again, newer than the extract and with one more order
+        _write_extract(snapshot, [_order(500000000, 100.0), _order(500000002, 30.0), _order(500000003, 5.0)],
+                       1_700_000_200)
+        setup()
+        assert _orders(spark) == {500000000: 150.0, 500000001: 10.0, 500000002: 30.0, 500000003: 5.0}
+    finally:
+        spark.sql(f"DROP TABLE IF EXISTS spark_catalog.default.{ORDERS_TABLE}")
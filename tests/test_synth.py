@@ -0,0 +1,42 @@
+import pytest
+
+from pipeline.engine import LocalEngine
+from pipeline.integrity import check_integrity_local
+from pipeline.synth import generate, growth
+
+
+@pytest.fixture(scope="module")
+def source():
+    return LocalEngine("data").feature_arrow()
+
+
+def _months(feature):
+    return set(feature["FISCAL_YEAR_MONTH"].to_pylist())
+
+
+def test_growth_follows_the_scale():
+    assert growth(1) == (1, 1)
+    assert growth(4) == (2, 2)
+    assert growth(100) == (10, 10)
+
+
+def test_scaled_data_keeps_keys_and_grows_the_grain(tmp_path, source):
+    counts = generate("data", str(tmp_path), 9, years=3, product_copies=2)
+    engine = LocalEngine(str(tmp_path))
+
+    assert [v.constraint for v in check_integrity_local(engine) if v.count] == []
+    assert counts["Products.csv"] == 2 * LocalEngine("data").arrow_table("bronze_products").num_rows
+    feature = engine.feature_arrow()
+    # Two more years of months back, and products beyond the source's
+    months = sorted(_months(feature))
+    assert months[-1] == max(_months(source))
+    assert months[0].year == min(_months(source)).year - 2
+    assert len(set(feature["PRODUCTID"].to_pylist())) > len(set(source["PRODUCTID"].to_pylist()))
+    assert feature.num_rows > 3 * source.num_rows
+
+
+def test_without_growth_the_grain_is_the_source_grain(tmp_path, source):
+    generate("data", str(tmp_path), 3, years=1, product_copies=1)
+    feature = LocalEngine(str(tmp_path)).feature_arrow()
+    assert feature.num_rows == source.num_rows
+    assert _months(feature) == _months(source)
@@ -0,0 +1,105 @@
+from pipeline.scheduler import Task, run_dag
+from pipeline.trace import Tracer, traced_tasks
+
+
+class _Frame:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def first(self):
+        return self.rows[0]
+
+    def where(self, condition):
+        version = int(condition.split(">")[1])
+        return _Frame([r for r in self.rows if r["version"] > version])
+
+    def select(self, *columns):
+        return self
+
+    def collect(self):
+        return self.rows
+
+
+class _StatusTracker:
+    def __init__(self, jobs):
+        self.jobs = jobs
+
+    def getJobIdsForGroup(self, group):
+        return [job for job, job_group in self.jobs if job_group == group]
+
+
+class _SparkContext:
+    """Local properties per call, jobs tagged with the job group current when they ran"""
+
+    def __init__(self):
+        self.properties = {}
+        self.jobs = []
+
+    def statusTracker(self):
+        return _StatusTracker(self.jobs)
+
+    def getLocalProperty(self, key):
+        return self.properties.get(key)
+
+    def setLocalProperty(self, key, value):
+        self.properties[key] = value
+
+    def setJobGroup(self, group, description):
+        self.properties.update({"spark.jobGroup.id": group, "spark.job.description": description})
+
+    def run_job(self):
+        self.jobs.append((len(self.jobs), self.properties.get("spark.jobGroup.id")))
+
+
+class _Catalog:
+    def tableExists(self, table):
+        return True
+
+
+class _Spark:
+    """Every sql() call runs one job; the table's history gains a commit per write()"""
+
+    def __init__(self):
+        self.sparkContext = _SparkContext()
+        self.catalog = _Catalog()
+        self.history = [{"version": 0, "operationMetrics": {"numOutputRows": "5", "numOutputBytes": "50"}}]
+
+    def write(self, rows):
+        self.sparkContext.run_job()
+        self.history.insert(0, {"version": len(self.history),
+                                "operationMetrics": {"numOutputRows": str(rows), "numOutputBytes": str(rows * 10)}})
+
+    def sql(self, statement):
+        self.sparkContext.run_job()
+        return _Frame(self.history)
+
+
+def test_stage_counts_only_its_own_jobs():
+    spark = _Spark()
+    tracer = Tracer(spark, run_name="test")
+    with tracer.stage("feature", table="t"):
+        spark.write(3)
+        spark.write(4)
+
+    record, = tracer.records
+    assert (record.rows, record.bytes) == (7, 70)
+    assert record.spark_jobs == 2
+    assert spark.sparkContext.getLocalProperty("spark.jobGroup.id") is None
+
+
+def test_failed_stage_is_recorded():
+    tracer = Tracer(None)
+    try:
+        with tracer.stage("load", "bronze_addresses"):
+            raise ValueError("bad file")
+    except ValueError:
+        pass
+    record, = tracer.records
+    assert record.status == "failed" and record.error == "ValueError: bad file"
+
+
+def test_traced_tasks_name_stages_after_tasks():
+    tracer = Tracer(None)
+    tasks = traced_tasks(tracer, [Task("load:bronze_addresses", lambda: 1), Task("comments", lambda: 2)])
+    run_dag(tasks)
+    assert sorted((r.stage, r.target) for r in tracer.records) == [("comments", None), ("load", "bronze_addresses")]